@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import nrp_bench
+import nrp_engine
+
+MARKETPLACES = ["DE", "FR", "ES", "IT"]
+
+
+def catalog_frame(n_asins=3000, seed=0):
+    """Random catalog in nrp_batch.INPUT_COLUMNS layout (MARKETPLACES, one row per ASIN x MP)."""
+    records, po_status, lead_time, po_arrival = nrp_bench.synthetic_catalog(n_asins, len(MARKETPLACES), seed=seed)
+    m = len(MARKETPLACES)
+    return pd.DataFrame({
+        "asin": np.repeat([f"B{i:09d}" for i in range(n_asins)], m),
+        "marketplace": MARKETPLACES * n_asins,
+        "stock": records["stock"].ravel(),
+        "forecast": records["forecast"].ravel(),
+        "cppu": records["cppu"].ravel(),
+        "po_status": np.repeat(np.asarray(nrp_engine.PO_STATUSES)[po_status], m),
+        "lead_time": np.repeat(lead_time, m),
+        "po_arrival": np.repeat(po_arrival, m),
+    })
+
+
+@pytest.fixture
+def catalog_csv(tmp_path):
+    path = str(tmp_path / "catalog.csv")
+    catalog_frame().to_csv(path, index=False)
+    return path
@@ -1,8 +1,287 @@
+import os
+import shutil
+import tempfile
+
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
+import numpy as np
+
+import nrp_batch
+import nrp_boundaries
+import nrp_engine
+import nrp_figures
+import nrp_jobs
+import nrp_montecarlo
+import nrp_rebalance
+import nrp_rolling
+import nrp_scenarios
+import nrp_sweep
+import nrp_timing
+
+# Default marketplace inputs: (stock, weekly forecast, CPPU)
+DEFAULT_MP_INPUTS = {
+    "DE": (120, 30, 3.00),
+    "FR": (80, 25, 2.80),
+    "ES": (0, 15, 2.00),
+    "IT": (0, 10, 1.80),
+}
+NEW_MP_INPUTS = (0, 10, 2.00)
+MP_COLUMNS = 4
+
+# PO status choices of the sidebar; "No PO" is split by the confirmation rate
+# (nrp_engine.po_status_from_cr)
+PO_CHOICES = ["No PO", "Incoming PO", "EoL Product"]
+
+# Memoized calculations/figures, keyed on the input tuple (shared by all sessions)
+CACHE_ENTRIES = 256
+CACHE_TTL = 3600  # seconds
+
+# Scenarios kept in a session's workspace, and compared side by side at most
+SESSION_SCENARIOS = 8
+COMPARE_SCENARIOS = 4
+SCENARIO_CHARTS = {
+    "woc": "WoC Comparison",
+    "cp": "CP Breakdown",
+    "timeline": "Stock Depletion",
+    "heatmap": "Decision Matrix",
+}
+
+# Help of the checkboxes that run the optional analyses; they stay off until
+# checked, so a calculation does not pay for closed panels
+RUN_HELP = "Re-runs with every calculation while checked; results are cached per input."
+
+# Largest batch result offered as a download (read into server memory);
+# bigger results are only shown by path
+DOWNLOAD_MAX_BYTES = 200 << 20
+
+# Seconds between progress refreshes of a running batch job
+JOB_POLL_SECONDS = 1.0
+
+# Runs whose stage timings are kept for the debug panel download (per session)
+TIMING_RUNS = 50
+
+# Sensitivity sweep axes: label and (min, max) range
+SWEEP_LABELS = {
+    "oor_cost": "OOR Cost ($)",
+    "max_woc": "Max Healthy WoC",
+    "lead_time": "Vendor Lead Time (days)",
+    "po_arrival": "PO Arrival (weeks)",
+}
+SWEEP_RANGES = {
+    "oor_cost": (0.0, 5.0),
+    "max_woc": (1.0, 20.0),
+    "lead_time": (1.0, 120.0),
+    "po_arrival": (0.5, 26.0),
+}
+
+
+def read_file(path):
+    """Contents of a file, for a download button."""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def forecast_horizon(mp_inputs, seasonality):
+    """Weekly forecasts (1, n_mps, n_weeks) from a seasonality index; None if flat."""
+    if not seasonality:
+        return None
+    return mp_inputs["forecast"][..., None] * np.asarray(seasonality)
+
+
+def compute(inputs, timer=None):
+    """Engine results for one input tuple (see the Calculate button logic).
+    
+    Returns (mp_inputs, result, greedy, breakdown); greedy is the greedy-mode
+    result used for comparison when the optimal search is selected.
+    timer: optional nrp_timing.StageTimer receiving the engine stage times.
+    """
+    po_status, po_arrival, lead_time, oor_cost, max_woc, search_mode, marketplaces, mp_rows, seasonality = inputs
+    mp_inputs = np.array([list(mp_rows)], dtype=nrp_engine.MARKETPLACE_DTYPE)
+    horizon = forecast_horizon(mp_inputs, seasonality)
+    params = dict(
+        po_status=nrp_engine.PO_STATUSES.index(po_status),
+        lead_time=lead_time,
+        po_arrival=po_arrival,
+        oor_cost=oor_cost,
+        max_woc=max_woc
+    )
+    result = nrp_engine.evaluate_records(mp_inputs, mode=search_mode, horizon=horizon, timer=timer, **params)
+    with nrp_timing.stage(timer, "greedy_comparison"):
+        greedy = nrp_engine.evaluate_records(mp_inputs, **params) if search_mode == "optimal" else result
+    with nrp_timing.stage(timer, "cp_breakdown"):
+        breakdown = nrp_engine.marketplace_breakdown(
+            mp_inputs["stock"], mp_inputs["forecast"], mp_inputs["cppu"], result, oor_cost, horizon
+        )
+    return mp_inputs, result, greedy, breakdown
+
+
+@st.cache_resource
+def scenario_store():
+    """Saved scenarios of this server (nrp_scenarios.DEFAULT_PATH), shared by all sessions."""
+    return nrp_scenarios.ScenarioStore()
+
+
+def saved_scenario(inputs):
+    """The saved scenario with exactly these inputs, or None."""
+    return scenario_store().get(nrp_scenarios.scenario_key(inputs))
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, ttl=CACHE_TTL)
+def calculate(inputs):
+    """compute(), memoized; reuses the results of a saved scenario with the same inputs."""
+    scenario = saved_scenario(inputs)
+    return scenario.results if scenario is not None else compute(inputs)
+
+
+def figures_for(inputs, results, timer=None):
+    """The four result charts for one input tuple and its compute() results."""
+    _, _, _, _, max_woc, _, all_mps, _, seasonality = inputs
+    mp_inputs, result, _, breakdown = results
+    return nrp_figures.result_figures(
+        mp_inputs, result, breakdown, all_mps, max_woc, forecast_horizon(mp_inputs, seasonality), timer=timer
+    )
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, ttl=CACHE_TTL)
+def build_figures(inputs):
+    """figures_for() of the memoized calculation (or of a saved scenario)."""
+    scenario = saved_scenario(inputs)
+    if scenario is not None and scenario.figures is not None:
+        return scenario.figures
+    return figures_for(inputs, calculate(inputs))
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, ttl=CACHE_TTL)
+def run_sweep(inputs, x_name, x_range, y_name, y_range, points):
+    """Sensitivity sweep of one input tuple over two global parameters."""
+    mp_inputs, _, _, _ = calculate(inputs)
+    po_status, po_arrival, lead_time, oor_cost, max_woc, search_mode, _, _, _ = inputs
+    params = {"oor_cost": oor_cost, "max_woc": max_woc, "lead_time": lead_time, "po_arrival": po_arrival}
+    grid = {x_name: np.linspace(*x_range, points), y_name: np.linspace(*y_range, points)}
+    return nrp_sweep.sweep(
+        mp_inputs,
+        nrp_engine.PO_STATUSES.index(po_status),
+        grid,
+        mode=search_mode,
+        **{name: value for name, value in params.items() if name not in grid}
+    )
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, ttl=CACHE_TTL)
+def run_simulation(inputs, draws, cv, distribution, seed):
+    """Monte Carlo forecast scenarios of one input tuple (per-draw CP kept for the histogram)."""
+    mp_inputs, _, _, _ = calculate(inputs)
+    po_status, po_arrival, lead_time, oor_cost, max_woc, search_mode, _, _, _ = inputs
+    return nrp_montecarlo.simulate(
+        mp_inputs, nrp_engine.PO_STATUSES.index(po_status), lead_time, po_arrival, oor_cost, max_woc,
+        draws=draws, cv=cv, distribution=distribution, seed=seed, mode=search_mode, keep_draws=True
+    )
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, ttl=CACHE_TTL)
+def run_rolling(inputs, weeks, po_cover_weeks):
+    """Week-by-week simulation of one input tuple under every policy (nrp_rolling.POLICIES order)."""
+    mp_inputs, _, _, _ = calculate(inputs)
+    po_status, po_arrival, lead_time, oor_cost, max_woc, search_mode, _, _, seasonality = inputs
+    return [
+        nrp_rolling.simulate(
+            mp_inputs, nrp_engine.PO_STATUSES.index(po_status), lead_time, po_arrival, oor_cost, max_woc,
+            weeks, policy, po_cover_weeks=po_cover_weeks, horizon=forecast_horizon(mp_inputs, seasonality),
+            mode=search_mode, keep_weekly=True
+        )
+        for policy in nrp_rolling.POLICIES
+    ]
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, ttl=CACHE_TTL)
+def run_rebalance(inputs, lanes, transfer_weeks):
+    """Rebalancing transfers of one input tuple next to its turn-off decision (lanes: (m, m) tuples)."""
+    mp_inputs, result, _, _ = calculate(inputs)
+    oor_cost = inputs[3]
+    return nrp_rebalance.rebalance(
+        mp_inputs["stock"], mp_inputs["forecast"], result, oor_cost, np.array(lanes), transfer_weeks
+    )
+
+
+def start_batch_job(upload, server_path, oor_cost, max_woc, search_mode, workers):
+    """Start a background catalog evaluation and keep it in the session state."""
+    if "batch_job_dir" in st.session_state:
+        shutil.rmtree(st.session_state["batch_job_dir"], ignore_errors=True)
+    work_dir = st.session_state["batch_job_dir"] = tempfile.mkdtemp(prefix="nrp_job_")
+    if upload is not None:
+        input_path = os.path.join(work_dir, os.path.basename(upload.name))
+        with open(input_path, "wb") as f:
+            shutil.copyfileobj(upload, f)
+    else:
+        input_path = server_path
+    suffix = ".parquet" if nrp_batch._is_parquet(input_path) else ".csv"
+    job = nrp_jobs.BatchJob(input_path, os.path.join(work_dir, "nrp_results" + suffix), oor_cost, max_woc,
+                            mode=search_mode, workers=workers)
+    st.session_state["batch_job"] = job.start()
+
+
+def batch_panel(oor_cost, max_woc, search_mode):
+    """Catalog batch run: start, progress, cancel and results (a fragment; polls while a job runs)."""
+    job = st.session_state.get("batch_job")
+    if job is None or job.done:
+        col1, col2 = st.columns([3, 2])
+        with col1:
+            upload = st.file_uploader("Catalog file", type=["csv", "parquet", "pq"],
+                                      help="Columns: " + ", ".join(nrp_batch.INPUT_COLUMNS))
+        with col2:
+            server_path = st.text_input("...or a catalog path on the server",
+                                        help="For catalogs larger than the upload limit")
+            workers = st.number_input("Worker processes", value=1, min_value=0, max_value=os.cpu_count(),
+                                      help="0 = one per CPU")
+        st.caption(f"Uses the sidebar OOR cost (${oor_cost:.2f}), max WoC ({max_woc}) and "
+                   f"{search_mode} search.")
+        ready = upload is not None or (server_path and os.path.exists(server_path))
+        if st.button("▶️ Start Batch Run", disabled=not ready):
+            start_batch_job(upload, server_path.strip(), oor_cost, max_woc, search_mode, workers)
+            st.rerun()
+        if server_path and not os.path.exists(server_path):
+            st.error(f"No such file: {server_path}")
+        if job is None:
+            return
+
+    progress = job.snapshot()
+    if progress["state"] == nrp_jobs.RUNNING:
+        text = f"{progress['rows']:,} rows"
+        if progress["total_rows"]:
+            text += f" of ~{progress['total_rows']:,}"
+        if progress["rows"]:
+            text += f" · {progress['rows_per_sec']:,.0f} rows/sec"
+        if progress["eta"] is not None:
+            text += f" · ETA {progress['eta']:,.0f}s"
+        st.progress(progress["fraction"] or 0.0, text=text)
+        st.caption(f"Running for {progress['elapsed']:,.0f}s. You can keep using the calculator; "
+                   "progress refreshes on its own.")
+        if not job.cancel_requested and st.button("⏹️ Cancel Batch Run"):
+            job.cancel()
+        if job.cancel_requested:
+            st.info("Cancelling after the chunk in flight...")
+        return
+    if st.session_state.get("batch_job_polling"):
+        # The job finished since the last poll: rerun the page once to stop polling
+        st.session_state["batch_job_polling"] = False
+        st.rerun()
+
+    if progress["state"] == nrp_jobs.DONE:
+        st.success(
+            f"Last run: {progress['rows']:,} rows ({progress['asins']:,} ASINs) in {progress['elapsed']:,.1f}s, "
+            f"{progress['rows_per_sec']:,.0f} rows/sec, {progress['turned_off']:,} MPs turned off."
+        )
+        if os.path.getsize(job.output_path) <= DOWNLOAD_MAX_BYTES:
+            st.download_button(
+                "Download results", data=lambda: read_file(job.output_path),
+                file_name=os.path.basename(job.output_path)
+            )
+        st.caption(f"Results: `{job.output_path}` (open it in `streamlit run nrp_dashboard.py`)")
+    elif progress["state"] == nrp_jobs.CANCELLED:
+        st.warning(f"Last run cancelled after {progress['rows']:,} rows.")
+    else:
+        st.error(f"Last run failed: {progress['error']}")
+
 
 # Page config
 st.set_page_config(
@@ -11,6 +290,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Stage timings of this script run (shown in the debug panel when enabled)
+timer = nrp_timing.StageTimer()
+
 # Title with documentation link
 col_title, col_link = st.columns([4, 1])
 with col_title:
@@ -24,114 +306,121 @@ st.markdown("---")
 with st.sidebar:
     st.header("🌍 Global Parameters")
     
-    po_status = st.selectbox(
+    po_choice = st.selectbox(
         "PO Status",
-        ["No PO (CR > 25%)", "No PO (CR < 25%)", "Incoming PO", "EoL Product"]
+        PO_CHOICES
     )
     
     po_arrival = st.number_input("PO Arrival (weeks)", value=8.0, step=0.5)
     lead_time = st.number_input("Vendor Lead Time (days)", value=14)
     cr_rate = st.number_input("Confirmation Rate (%)", value=30, min_value=0, max_value=100)
+    po_code = nrp_engine.po_status_from_cr(cr_rate, po_open=po_choice == "Incoming PO", eol=po_choice == "EoL Product")
+    po_status = nrp_engine.PO_STATUSES[po_code]
+    if po_choice == "No PO":
+        st.caption(f"Confirmation rate {cr_rate}% → **{po_status}**: stock expected in "
+                   f"{nrp_engine.t_arrival_weeks(po_code, lead_time, po_arrival):.1f} weeks")
     oor_cost = st.number_input("OOR Cost ($)", value=1.50, step=0.1)
     max_woc = st.number_input("Max Healthy WoC", value=7)
+    seasonality_text = st.text_input(
+        "Weekly Seasonality Index",
+        placeholder="e.g. 1.0, 1.2, 1.5, 0.8",
+        help="Multipliers of every weekly forecast for weeks 1, 2, ...; the last one continues past the horizon. Empty = flat forecast."
+    )
+    try:
+        seasonality = tuple(float(v) for v in seasonality_text.split(",") if v.strip())
+    except ValueError:
+        st.error("Seasonality index must be comma-separated numbers - using a flat forecast.")
+        seasonality = ()
+    if any(v < 0 for v in seasonality):
+        st.error("Seasonality index cannot be negative - using a flat forecast.")
+        seasonality = ()
+    
+    search_mode = st.radio(
+        "Turn-off Search",
+        nrp_engine.MODES,
+        format_func=str.capitalize,
+        help="Greedy accepts zero-stock MPs one by one in forecast order; Optimal searches for the CP-maximizing set."
+    )
+    if seasonality and search_mode == "optimal":
+        st.warning("Optimal search needs a flat forecast - using Greedy with the seasonality index.")
+        search_mode = "greedy"
+    
+    marketplaces = st.multiselect(
+        "Marketplaces",
+        list(nrp_engine.MARKETPLACES),
+        default=list(DEFAULT_MP_INPUTS)
+    )
     
     st.markdown("---")
     calculate_button = st.button("🚀 Calculate NRP Optimization", type="primary", use_container_width=True)
+    debug_timings = st.checkbox(
+        "⏱️ Show stage timings",
+        help="Debug panel with the time spent per stage of this run; the calculation bypasses the cache while it is on."
+    )
+
+# Sidebar values for the catalog batch run; the results section below
+# rebinds the parameter names to the last calculated inputs
+sidebar_params = (oor_cost, max_woc, search_mode)
 
 # MARKETPLACE INPUTS AS TABLE
 st.subheader("📊 Marketplace Input Parameters")
 
-# Create input table
-col1, col2, col3, col4 = st.columns(4)
-
-with col1:
-    st.markdown("### Germany (DE)")
-    stock_de = st.number_input("Stock (units)", value=120, key="stock_de", label_visibility="visible")
-    forecast_de = st.number_input("Weekly Forecast", value=30, key="forecast_de", label_visibility="visible")
-    cppu_de = st.number_input("CPPU ($)", value=3.00, step=0.1, key="cppu_de", label_visibility="visible")
-
-with col2:
-    st.markdown("### France (FR)")
-    stock_fr = st.number_input("Stock (units)", value=80, key="stock_fr", label_visibility="visible")
-    forecast_fr = st.number_input("Weekly Forecast", value=25, key="forecast_fr", label_visibility="visible")
-    cppu_fr = st.number_input("CPPU ($)", value=2.80, step=0.1, key="cppu_fr", label_visibility="visible")
-
-with col3:
-    st.markdown("### Spain (ES)")
-    stock_es = st.number_input("Stock (units)", value=0, key="stock_es", label_visibility="visible")
-    forecast_es = st.number_input("Weekly Forecast", value=15, key="forecast_es", label_visibility="visible")
-    cppu_es = st.number_input("CPPU ($)", value=2.00, step=0.1, key="cppu_es", label_visibility="visible")
-
-with col4:
-    st.markdown("### Italy (IT)")
-    stock_it = st.number_input("Stock (units)", value=0, key="stock_it", label_visibility="visible")
-    forecast_it = st.number_input("Weekly Forecast", value=10, key="forecast_it", label_visibility="visible")
-    cppu_it = st.number_input("CPPU ($)", value=1.80, step=0.1, key="cppu_it", label_visibility="visible")
+if not marketplaces:
+    st.warning("Select at least one marketplace in the sidebar.")
+    st.stop()
+
+# One column per marketplace, wrapping every MP_COLUMNS marketplaces
+mp_inputs = nrp_engine.marketplace_inputs(1, len(marketplaces))
+
+for row_start in range(0, len(marketplaces), MP_COLUMNS):
+    columns = st.columns(MP_COLUMNS)
+    for col, (i, mp) in zip(columns, enumerate(marketplaces[row_start:row_start + MP_COLUMNS], row_start)):
+        stock_default, forecast_default, cppu_default = DEFAULT_MP_INPUTS.get(mp, NEW_MP_INPUTS)
+        key = mp.lower()
+        with col:
+            st.markdown(f"### {nrp_engine.MARKETPLACES[mp]} ({mp})")
+            mp_inputs["stock"][0, i] = st.number_input("Stock (units)", value=stock_default, key=f"stock_{key}", label_visibility="visible")
+            mp_inputs["forecast"][0, i] = st.number_input("Weekly Forecast", value=forecast_default, key=f"forecast_{key}", label_visibility="visible")
+            mp_inputs["cppu"][0, i] = st.number_input("CPPU ($)", value=cppu_default, step=0.1, key=f"cppu_{key}", label_visibility="visible")
 
 st.markdown("---")
 
-# Calculate button logic
-# Calculate button logic
+# Calculate button logic: the last calculated inputs are kept in session state,
+# so results survive reruns caused by other widgets
+current_inputs = (
+    po_status, po_arrival, lead_time, oor_cost, max_woc, search_mode,
+    tuple(marketplaces), tuple(mp_inputs[0].tolist()), seasonality
+)
 if calculate_button:
-    # EU Totals
-    S_EU = stock_de + stock_fr + stock_es + stock_it
-    F_EU = forecast_de + forecast_fr + forecast_es + forecast_it
-    WoC_EU = S_EU / F_EU if F_EU > 0 else 0
-    
-    # T_arrival calculation
-    if po_status == "EoL Product":
-        T_arrival_weeks = 999
-    elif po_status == "Incoming PO":
-        T_arrival_weeks = po_arrival
-    elif po_status == "No PO (CR < 25%)":
-        T_arrival_weeks = (2 * lead_time) / 7
-    else:
-        T_arrival_weeks = lead_time / 7
-    
-    # CPPU_avg for MPs with stock
-    cppu_sum = 0
-    forecast_sum = 0
-    if stock_de > 0:
-        cppu_sum += cppu_de * forecast_de
-        forecast_sum += forecast_de
-    if stock_fr > 0:
-        cppu_sum += cppu_fr * forecast_fr
-        forecast_sum += forecast_fr
-    if stock_es > 0:
-        cppu_sum += cppu_es * forecast_es
-        forecast_sum += forecast_es
-    if stock_it > 0:
-        cppu_sum += cppu_it * forecast_it
-        forecast_sum += forecast_it
+    st.session_state["nrp_inputs"] = current_inputs
+timer.lap("inputs")
+# Engine and figure build stages; only timed with the debug panel on, as the
+# cached calls would otherwise time a cache lookup
+calc_timer = nrp_timing.StageTimer() if debug_timings else None
+
+if "nrp_inputs" in st.session_state:
+    # Plotly is only needed once there are results to chart
+    import plotly.graph_objects as go
     
-    CPPU_avg = cppu_sum / forecast_sum if forecast_sum > 0 else 0
+    inputs = st.session_state["nrp_inputs"]
+    if inputs != current_inputs:
+        st.caption("✏️ Inputs changed since the last calculation - click **Calculate** to update the results below.")
     
-    # Calculate CP BEFORE optimization
-    def calculate_cp_before(s_de, s_fr, s_es, s_it, f_de, f_fr, f_es, f_it, c_de, c_fr, c_es, c_it, s_eu, f_eu, oor):
-        if f_eu == 0:
-            return 0
-        woc = s_eu / f_eu
-        
-        # Units sold per MP (proportional to forecast)
-        units_de = f_de * woc
-        units_fr = f_fr * woc
-        units_es = f_es * woc
-        units_it = f_it * woc
-        
-        # Calculate CP (with OOR penalty for zero-stock MPs)
-        cp_de = units_de * c_de
-        cp_fr = units_fr * c_fr
-        cp_es = units_es * (c_es - oor if s_es == 0 else c_es)
-        cp_it = units_it * (c_it - oor if s_it == 0 else c_it)
-        
-        return cp_de + cp_fr + cp_es + cp_it
+    po_status, po_arrival, lead_time, oor_cost, max_woc, search_mode, all_mps, _, seasonality = inputs
+    results = compute(inputs, calc_timer) if debug_timings else calculate(inputs)
+    mp_inputs, result, greedy, breakdown = results
+    timer.lap("calculation")
+    stock = mp_inputs["stock"]
+    forecast = mp_inputs["forecast"]
+    cppu = mp_inputs["cppu"]
     
-    cp_before = calculate_cp_before(
-        stock_de, stock_fr, stock_es, stock_it,
-        forecast_de, forecast_fr, forecast_es, forecast_it,
-        cppu_de, cppu_fr, cppu_es, cppu_it,
-        S_EU, F_EU, oor_cost
-    )
+    # EU Totals
+    S_EU = result.s_eu[0]
+    F_EU = result.f_eu[0]
+    WoC_EU = result.woc_eu[0]
+    T_arrival_weeks = result.t_arrival[0]
+    CPPU_avg = result.cppu_avg[0]
+    cp_before = result.cp_before[0]
     
     # Display EU Summary
     st.subheader("📈 EU Summary Metrics")
@@ -149,84 +438,37 @@ if calculate_button:
         st.metric("Stock Arrival", f"{'Never (EoL)' if T_arrival_weeks >= 999 else f'{T_arrival_weeks:.1f}w'}")
     
     st.markdown("---")
+    timer.lap("eu_summary")
     
-    # Find zero-stock MPs
-    zero_stock_mps = []
-    if stock_it == 0:
-        zero_stock_mps.append({"name": "IT", "forecast": forecast_it, "cppu": cppu_it})
-    if stock_es == 0:
-        zero_stock_mps.append({"name": "ES", "forecast": forecast_es, "cppu": cppu_es})
-    if stock_fr == 0:
-        zero_stock_mps.append({"name": "FR", "forecast": forecast_fr, "cppu": cppu_fr})
-    if stock_de == 0:
-        zero_stock_mps.append({"name": "DE", "forecast": forecast_de, "cppu": cppu_de})
-    
-    if len(zero_stock_mps) == 0:
+    if result.n_zero[0] == 0:
         st.info("✅ All marketplaces have stock. No NRP optimization needed.")
     else:
-        zero_stock_mps.sort(key=lambda x: x["forecast"])
-        
-        # Sequential optimization
-        F_EU_remaining = F_EU
+        # Decisions in evaluation order (zero-stock MPs sorted by forecast)
         decisions = []
-        
-        for mp in zero_stock_mps:
-            cppu_effective = mp["cppu"] - oor_cost
-            pass_cppu = cppu_effective <= CPPU_avg
-            
-            WoC_new = S_EU / (F_EU_remaining - mp["forecast"]) if (F_EU_remaining - mp["forecast"]) > 0 else 999
-            pass_woc_health = WoC_new <= max_woc
-            pass_woc_depletion = T_arrival_weeks >= 999 or WoC_new < T_arrival_weeks
-            
-            decision = "TURN_OFF" if (pass_cppu and pass_woc_health and pass_woc_depletion) else "KEEP_ACTIVE"
-            
+        for i in result.order[0, :result.n_zero[0]]:
             decisions.append({
-                "MP": mp["name"],
-                "Forecast": mp["forecast"],
-                "CPPU": mp["cppu"],
-                "CPPU Effective": cppu_effective,
-                "Pass CPPU": pass_cppu,
-                "New WoC": WoC_new,
-                "Pass WoC Health": pass_woc_health,
-                "Pass Depletion": pass_woc_depletion,
-                "Decision": decision
+                "MP": all_mps[i],
+                "Forecast": forecast[0, i],
+                "CPPU": cppu[0, i],
+                "CPPU Effective": result.cppu_effective[0, i],
+                "Pass CPPU": result.pass_cppu[0, i],
+                "New WoC": result.new_woc[0, i],
+                "Pass WoC Health": result.pass_woc_health[0, i],
+                "Pass Depletion": result.pass_depletion[0, i],
+                "Decision": nrp_engine.DECISIONS[result.decision[0, i]]
             })
-            
-            if decision == "TURN_OFF":
-                F_EU_remaining -= mp["forecast"]
-        
-        # ============= FIX 1: Calculate active MPs correctly =============
-        # Start with all MPs
-        all_mps = ["DE", "FR", "ES", "IT"]
         
-        # Get turned off MPs
         turned_off = [d['MP'] for d in decisions if d['Decision'] == 'TURN_OFF']
-        
-        # Active MPs = all MPs minus turned off ones
         kept_active = [mp for mp in all_mps if mp not in turned_off]
-        # ================================================================
         
-        # Calculate CP AFTER optimization
-        active_forecast_de = forecast_de if "DE" in kept_active else 0
-        active_forecast_fr = forecast_fr if "FR" in kept_active else 0
-        active_forecast_es = forecast_es if "ES" in kept_active else 0
-        active_forecast_it = forecast_it if "IT" in kept_active else 0
-        
-        f_total_after = active_forecast_de + active_forecast_fr + active_forecast_es + active_forecast_it
-        
-        if f_total_after > 0:
-            cp_after = (
-                (active_forecast_de / f_total_after) * S_EU * cppu_de +
-                (active_forecast_fr / f_total_after) * S_EU * cppu_fr +
-                (active_forecast_es / f_total_after) * S_EU * cppu_es +
-                (active_forecast_it / f_total_after) * S_EU * cppu_it
-            )
-        else:
-            cp_after = 0
+        F_EU_remaining = result.f_remaining[0]
+        cp_after = result.cp_after[0]
         
         # Display decisions with IMPROVED LAYOUT
         st.subheader("📋 Marketplace Decision Analysis")
         
+        flip = nrp_boundaries.decision_boundaries(cppu, nrp_engine.PO_STATUSES.index(po_status), result)
+        
         for d in decisions:
             with st.expander(f"🔍 {d['MP']} - {d['Decision']}", expanded=True):
                 # Decision banner
@@ -268,12 +510,25 @@ if calculate_button:
                         st.success("✓ PASS - Will deplete before arrival")
                     else:
                         st.error("✗ FAIL - Won't deplete in time")
+                
+                # Input values at which each check flips (other MPs' decisions held fixed)
+                i = all_mps.index(d['MP'])
+                flip_points = [
+                    f"OOR cost ≥ ${flip.oor_cost[0, i]:.2f}",
+                    f"Max WoC ≥ {flip.max_woc[0, i]:.2f}",
+                ]
+                if not np.isnan(flip.po_arrival[0, i]):
+                    flip_points.append(f"PO arrival > {flip.po_arrival[0, i]:.2f} weeks")
+                elif not np.isnan(flip.lead_time[0, i]):
+                    flip_points.append(f"Lead time > {flip.lead_time[0, i]:.1f} days")
+                st.caption("Checks pass for: " + " · ".join(flip_points))
+        timer.lap("decision_analysis")
         
         # Final state
         st.markdown("---")
         st.subheader("🎯 Final State After Optimization")
         
-        final_woc = S_EU / F_EU_remaining if F_EU_remaining > 0 else 999
+        final_woc = result.final_woc[0]
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -285,78 +540,27 @@ if calculate_button:
         with col4:
             st.metric("Active MPs", ", ".join(kept_active))  # ← FIX: Removed "if kept_active else All"
         
+        if search_mode == "optimal":
+            if nrp_engine.compare_modes(greedy, result)["disagree"]:
+                greedy_off = [all_mps[i] for i in np.flatnonzero(greedy.decision[0] == nrp_engine.TURN_OFF)]
+                st.info(f"🔎 Greedy search would turn off {', '.join(greedy_off) or 'None'} "
+                        f"(CP ${greedy.cp_after[0]:.2f} vs ${cp_after:.2f})")
+        timer.lap("final_state")
+        
         # ==================== COMPARISON TABLE ====================
         st.markdown("---")
         st.subheader("📊 Before vs After Comparison Table")
         
-        # ============= FIX 3: Better explanation of CBF calculation =============
         # CBF units BEFORE: All units sold to zero-stock MPs require cross-border shipment
-        cbf_units_before = 0
-        if stock_es == 0:
-            cbf_units_before += (forecast_es * WoC_EU)  # ES demand × weeks of stock
-        if stock_it == 0:
-            cbf_units_before += (forecast_it * WoC_EU)  # IT demand × weeks of stock
-        if stock_de == 0:
-            cbf_units_before += (forecast_de * WoC_EU)
-        if stock_fr == 0:
-            cbf_units_before += (forecast_fr * WoC_EU)
-        
         # CBF units AFTER: Only active zero-stock MPs need CBF (turned-off MPs = 0 CBF)
-        cbf_units_after = 0
-        for mp_name, stock, forecast in [("DE", stock_de, forecast_de), ("FR", stock_fr, forecast_fr), 
-                                          ("ES", stock_es, forecast_es), ("IT", stock_it, forecast_it)]:
-            if stock == 0 and mp_name in kept_active:  # Zero stock AND still active
-                cbf_units_after += (forecast * final_woc)
-        # ========================================================================
+        cbf_units_before = result.cbf_units_before[0]
+        cbf_units_after = result.cbf_units_after[0]
         
         cbf_savings = (cbf_units_before - cbf_units_after) * oor_cost
         cp_improvement = cp_after - cp_before
         cp_improvement_pct = (cp_improvement / cp_before * 100) if cp_before > 0 else 0
         
-        comparison_data = {
-            "Metric": [
-                "Total Stock (units)",
-                "Active Forecast (units/week)",
-                "Weeks of Coverage",
-                "Active Marketplaces",
-                "Cross-Border Units",
-                "OOR Shipping Cost",
-                "Total Contribution Profit",
-                "CP Improvement"
-            ],
-            "Before NRP": [
-                f"{S_EU:.0f}",
-                f"{F_EU:.1f}",
-                f"{WoC_EU:.2f}",
-                "DE, FR, ES, IT",
-                f"{cbf_units_before:.0f}",  # ← FIX 2: Integer display
-                f"${cbf_units_before * oor_cost:.2f}",
-                f"${cp_before:.2f}",
-                "-"
-            ],
-            "After NRP": [
-                f"{S_EU:.0f}",
-                f"{F_EU_remaining:.1f}",
-                f"{final_woc:.2f}",
-                ", ".join(kept_active),  # ← FIX 1: Now correct
-                f"{cbf_units_after:.0f}",  # ← FIX 2: Integer display
-                f"${cbf_units_after * oor_cost:.2f}",
-                f"${cp_after:.2f}",
-                f"+${cp_improvement:.2f} ({cp_improvement_pct:+.1f}%)"
-            ],
-            "Change": [
-                "0",
-                f"{F_EU_remaining - F_EU:.1f}",
-                f"{final_woc - WoC_EU:+.2f}",
-                f"{len(turned_off)} turned off",
-                f"{int(cbf_units_after - cbf_units_before)}",  # ← FIX 2: Integer
-                f"-${cbf_savings:.2f}",
-                f"+${cp_improvement:.2f}",
-                f"{cp_improvement_pct:+.1f}%"
-            ]
-        }
-        
-        df_comparison = pd.DataFrame(comparison_data)
+        df_comparison = nrp_figures.comparison_table(result, all_mps, oor_cost)
         st.dataframe(df_comparison, use_container_width=True, hide_index=True)
         
         # Highlight key improvements
@@ -367,202 +571,40 @@ if calculate_button:
             st.metric("📦 CBF Units Avoided", f"{int(cbf_units_before - cbf_units_after)}", delta=f"-{((cbf_units_before - cbf_units_after) / cbf_units_before * 100) if cbf_units_before > 0 else 0:.1f}%")
         with col3:
             st.metric("💵 OOR Cost Saved", f"${cbf_savings:.2f}", delta="Savings")
+        timer.lap("comparison_table")
         
         # ==================== ADDITIONAL VISUALIZATIONS ====================
         st.markdown("---")
         st.subheader("📈 Advanced Analytics & Visualizations")
         
+        figures = figures_for(inputs, results, calc_timer) if debug_timings else build_figures(inputs)
+        timer.lap("figures")
+        
         # Row 1: WoC Comparison + CP Breakdown
         col1, col2 = st.columns(2)
-        
         with col1:
-            # WoC Comparison Chart
-            fig_woc = go.Figure()
-            fig_woc.add_trace(go.Bar(
-                x=["Before NRP", "After NRP"],
-                y=[WoC_EU, final_woc],
-                text=[f"{WoC_EU:.2f}w", f"{final_woc:.2f}w"],
-                textposition='auto',
-                marker_color=['#667eea', '#28a745']
-            ))
-            
-            fig_woc.add_hline(y=max_woc, line_dash="dash", line_color="red", 
-                          annotation_text=f"Max Healthy WoC ({max_woc})")
-            
-            if T_arrival_weeks < 999:
-                fig_woc.add_hline(y=T_arrival_weeks, line_dash="dash", line_color="orange",
-                              annotation_text=f"PO Arrival ({T_arrival_weeks:.1f}w)")
-            
-            fig_woc.update_layout(
-                title="Weeks of Coverage Comparison",
-                yaxis_title="Weeks",
-                showlegend=False,
-                height=400
-            )
-            
-            st.plotly_chart(fig_woc, use_container_width=True)
-        
+            st.plotly_chart(figures["woc"], use_container_width=True)
+            timer.lap("chart_woc")
         with col2:
-            # CP Breakdown by Marketplace
-            cp_breakdown_before = []
-            cp_breakdown_after = []
-            mp_labels = []
-            
-            for mp_name, stock, forecast, cppu in [
-                ("DE", stock_de, forecast_de, cppu_de),
-                ("FR", stock_fr, forecast_fr, cppu_fr),
-                ("ES", stock_es, forecast_es, cppu_es),
-                ("IT", stock_it, forecast_it, cppu_it)
-            ]:
-                mp_labels.append(mp_name)
-                
-                # Before
-                units_before = (forecast / F_EU * S_EU) if F_EU > 0 else 0
-                cp_mp_before = units_before * (cppu - oor_cost if stock == 0 else cppu)
-                cp_breakdown_before.append(cp_mp_before)
-                
-                # After
-                is_active = mp_name in kept_active
-                if is_active and f_total_after > 0:
-                    forecast_after = forecast if mp_name in kept_active else 0
-                    units_after = (forecast_after / f_total_after * S_EU)
-                    cp_mp_after = units_after * cppu
-                else:
-                    cp_mp_after = 0
-                cp_breakdown_after.append(cp_mp_after)
-            
-            fig_cp = go.Figure()
-            fig_cp.add_trace(go.Bar(
-                name='Before NRP',
-                x=mp_labels,
-                y=cp_breakdown_before,
-                marker_color='#667eea'
-            ))
-            fig_cp.add_trace(go.Bar(
-                name='After NRP',
-                x=mp_labels,
-                y=cp_breakdown_after,
-                marker_color='#28a745'
-            ))
-            
-            fig_cp.update_layout(
-                title="Contribution Profit by Marketplace",
-                yaxis_title="CP ($)",
-                barmode='group',
-                height=400
-            )
-            
-            st.plotly_chart(fig_cp, use_container_width=True)
+            st.plotly_chart(figures["cp"], use_container_width=True)
+            timer.lap("chart_cp")
         
         # Row 2: Stock Depletion Timeline + Decision Matrix
         col1, col2 = st.columns(2)
-        
         with col1:
-            # Stock Depletion Timeline
-            weeks = list(range(0, int(max(final_woc, WoC_EU, T_arrival_weeks if T_arrival_weeks < 999 else 10)) + 2))
-            stock_before = [max(0, S_EU - (F_EU * w)) for w in weeks]
-            stock_after = [max(0, S_EU - (F_EU_remaining * w)) for w in weeks]
-            
-            fig_timeline = go.Figure()
-            fig_timeline.add_trace(go.Scatter(
-                x=weeks,
-                y=stock_before,
-                mode='lines+markers',
-                name='Before NRP',
-                line=dict(color='#667eea', width=3)
-            ))
-            fig_timeline.add_trace(go.Scatter(
-                x=weeks,
-                y=stock_after,
-                mode='lines+markers',
-                name='After NRP',
-                line=dict(color='#28a745', width=3)
-            ))
-            
-            if T_arrival_weeks < 999:
-                fig_timeline.add_vline(x=T_arrival_weeks, line_dash="dash", line_color="orange",
-                                   annotation_text="PO Arrival")
-            
-            fig_timeline.update_layout(
-                title="Stock Depletion Timeline",
-                xaxis_title="Weeks",
-                yaxis_title="Remaining Stock (units)",
-                height=400
-            )
-            
-            st.plotly_chart(fig_timeline, use_container_width=True)
-        
+            st.plotly_chart(figures["timeline"], use_container_width=True)
+            timer.lap("chart_timeline")
         with col2:
-            # Decision Matrix Heatmap
-            decision_matrix = []
-            for d in decisions:
-                decision_matrix.append({
-                    "MP": d["MP"],
-                    "CPPU Check": 1 if d["Pass CPPU"] else 0,
-                    "WoC Health": 1 if d["Pass WoC Health"] else 0,
-                    "Depletion Timing": 1 if d["Pass Depletion"] else 0,
-                })
-            
-            df_matrix = pd.DataFrame(decision_matrix)
-            
-            fig_heatmap = go.Figure(data=go.Heatmap(
-                z=df_matrix[["CPPU Check", "WoC Health", "Depletion Timing"]].values.T,
-                x=df_matrix["MP"],
-                y=["CPPU Check", "WoC Health", "Depletion Timing"],
-                colorscale=[[0, '#dc3545'], [1, '#28a745']],
-                text=[["✗" if val == 0 else "✓" for val in row] for row in df_matrix[["CPPU Check", "WoC Health", "Depletion Timing"]].values.T],
-                texttemplate="%{text}",
-                textfont={"size": 20, "color": "white"},
-                showscale=False
-            ))
-            
-            fig_heatmap.update_layout(
-                title="Decision Matrix: Check Results",
-                height=400
-            )
-            
-            st.plotly_chart(fig_heatmap, use_container_width=True)
+            st.plotly_chart(figures["heatmap"], use_container_width=True)
+            timer.lap("chart_heatmap")
         
         # Row 3: Detailed Metrics Table
         st.markdown("---")
         st.subheader("📋 Detailed Calculation Metrics")
         
-        detailed_metrics = []
-        for mp_name, stock, forecast, cppu in [
-            ("DE", stock_de, forecast_de, cppu_de),
-            ("FR", stock_fr, forecast_fr, cppu_fr),
-            ("ES", stock_es, forecast_es, cppu_es),
-            ("IT", stock_it, forecast_it, cppu_it)
-        ]:
-            is_zero_stock = stock == 0
-            is_turned_off = mp_name in turned_off
-            
-            units_sold_before = (forecast / F_EU * S_EU) if F_EU > 0 else 0
-            cp_before_mp = units_sold_before * (cppu - oor_cost if is_zero_stock else cppu)
-            
-            if is_turned_off:
-                units_sold_after = 0
-                cp_after_mp = 0
-            else:
-                forecast_after = forecast
-                units_sold_after = (forecast_after / f_total_after * S_EU) if f_total_after > 0 else 0
-                cp_after_mp = units_sold_after * cppu
-            
-            detailed_metrics.append({
-                "Marketplace": f"{mp_name}",
-                "Stock": stock,
-                "Forecast": forecast,
-                "CPPU": f"${cppu:.2f}",
-                "Status": "❌ Turned Off" if is_turned_off else "✅ Active",
-                "Units Sold (Before)": f"{int(units_sold_before)}",  # ← FIX 2: Integer
-                "Units Sold (After)": f"{int(units_sold_after)}",   # ← FIX 2: Integer
-                "CP Before": f"${cp_before_mp:.2f}",
-                "CP After": f"${cp_after_mp:.2f}",
-                "CP Change": f"+${cp_after_mp - cp_before_mp:.2f}"
-            })
-        
-        df_detailed = pd.DataFrame(detailed_metrics)
+        df_detailed = nrp_figures.detailed_table(mp_inputs, result, breakdown, all_mps)
         st.dataframe(df_detailed, use_container_width=True, hide_index=True)
+        timer.lap("detailed_table")
         
         # ============= FIX 3: Add explanation box for OOR calculation =============
         with st.expander("ℹ️ How are Cross-Border (OOR) Units Calculated?", expanded=False):
@@ -575,25 +617,17 @@ if calculate_button:
             **Example (Current Scenario):**
             """)
             
-            if stock_es == 0 or stock_it == 0:
+            zero_stock_idx = np.flatnonzero(stock[0] == 0)
+            if len(zero_stock_idx) > 0:
                 explanation_data = []
-                if stock_es == 0:
-                    explanation_data.append({
-                        "MP": "ES",
-                        "Stock": 0,
-                        "Forecast": f"{forecast_es} units/week",
-                        "WoC": f"{WoC_EU:.2f} weeks",
-                        "Calculation": f"{forecast_es} × {WoC_EU:.2f}",
-                        "CBF Units": f"{forecast_es * WoC_EU:.1f}"
-                    })
-                if stock_it == 0:
+                for i in zero_stock_idx:
                     explanation_data.append({
-                        "MP": "IT",
+                        "MP": all_mps[i],
                         "Stock": 0,
-                        "Forecast": f"{forecast_it} units/week",
+                        "Forecast": f"{forecast[0, i]:g} units/week",
                         "WoC": f"{WoC_EU:.2f} weeks",
-                        "Calculation": f"{forecast_it} × {WoC_EU:.2f}",
-                        "CBF Units": f"{forecast_it * WoC_EU:.1f}"
+                        "Calculation": f"{forecast[0, i]:g} × {WoC_EU:.2f}",
+                        "CBF Units": f"{forecast[0, i] * WoC_EU:.1f}"
                     })
                 
                 df_explanation = pd.DataFrame(explanation_data)
@@ -603,7 +637,7 @@ if calculate_button:
                 **Total CBF Before NRP:** {cbf_units_before:.1f} units
                 
                 **Why?** These MPs have no local stock, so ALL customer orders must be fulfilled 
-                from other countries (DE/FR with stock), incurring ${oor_cost:.2f} extra shipping cost per unit.
+                from other countries ({"/".join(mp for mp, s in zip(all_mps, stock[0]) if s > 0) or "none"} with stock), incurring ${oor_cost:.2f} extra shipping cost per unit.
                 
                 ### After NRP:
                 When we **turn off** zero-stock MPs, their customers can't order anymore, so:
@@ -612,6 +646,7 @@ if calculate_button:
                 """)
             else:
                 st.info("All marketplaces have stock, so no cross-border shipments needed!")
+        timer.lap("oor_explanation")
         # =========================================================================
         
         # Summary insights
@@ -644,6 +679,275 @@ if calculate_button:
         
         for insight in insights:
             st.markdown(insight)
+        timer.lap("insights")
+        
+        # ==================== PARAMETER SENSITIVITY SWEEP ====================
+        st.markdown("---")
+        with st.expander("🧭 Parameter Sensitivity Sweep", expanded=False):
+            st.caption("Re-evaluates the decisions above over a grid of two global parameters.")
+            if seasonality:
+                st.caption("The sweep uses flat weekly forecasts; the seasonality index is ignored.")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                x_name = st.selectbox("X axis", nrp_sweep.SWEEP_PARAMS, format_func=SWEEP_LABELS.get, key="sweep_x")
+                x_range = st.slider("X range", *SWEEP_RANGES[x_name], value=SWEEP_RANGES[x_name], key=f"sweep_x_{x_name}")
+            with col2:
+                y_options = [p for p in nrp_sweep.SWEEP_PARAMS if p != x_name]
+                y_name = st.selectbox("Y axis", y_options, format_func=SWEEP_LABELS.get, key="sweep_y")
+                y_range = st.slider("Y range", *SWEEP_RANGES[y_name], value=SWEEP_RANGES[y_name], key=f"sweep_y_{y_name}")
+            with col3:
+                points = st.number_input("Grid points per axis", value=50, min_value=2, max_value=200, key="sweep_points")
+                sweep_mp = st.selectbox("Decision shown", ["All MPs"] + list(all_mps), key="sweep_mp")
+            
+            if st.checkbox("Run the sweep", key="sweep_run", help=RUN_HELP):
+                sweep = run_sweep(inputs, x_name, x_range, y_name, y_range, points)
+                if sweep_mp == "All MPs":
+                    z_decision = sweep.n_turned_off[0]
+                    decision_title = "Number of MPs Turned Off"
+                else:
+                    z_decision = (sweep.decision[0, :, :, list(all_mps).index(sweep_mp)] == nrp_engine.TURN_OFF).astype(int)
+                    decision_title = f"{sweep_mp} Turned Off (1 = yes)"
+            
+                col1, col2 = st.columns(2)
+                with col1:
+                    fig_sweep_decision = go.Figure(data=go.Heatmap(
+                        z=z_decision.T, x=sweep.values[0], y=sweep.values[1], colorscale="Greens"
+                    ))
+                    fig_sweep_decision.update_layout(
+                        title=decision_title, xaxis_title=SWEEP_LABELS[x_name], yaxis_title=SWEEP_LABELS[y_name], height=400
+                    )
+                    st.plotly_chart(fig_sweep_decision, use_container_width=True)
+                with col2:
+                    fig_sweep_cp = go.Figure(data=go.Heatmap(
+                        z=sweep.cp_improvement[0].T, x=sweep.values[0], y=sweep.values[1], colorscale="RdYlGn"
+                    ))
+                    fig_sweep_cp.update_layout(
+                        title="CP Improvement ($)", xaxis_title=SWEEP_LABELS[x_name], yaxis_title=SWEEP_LABELS[y_name], height=400
+                    )
+                    st.plotly_chart(fig_sweep_cp, use_container_width=True)
+        timer.lap("sensitivity_sweep")
+
+        # ==================== FORECAST UNCERTAINTY ====================
+        with st.expander("🎲 Forecast Uncertainty (Monte Carlo)", expanded=False):
+            st.caption("Re-evaluates the decisions above on random forecast scenarios around the point forecasts; stock and CPPU are kept.")
+            if seasonality:
+                st.caption("Scenarios are drawn around flat weekly forecasts; the seasonality index is ignored.")
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                draws = st.number_input("Scenarios", value=10000, min_value=100, max_value=100000, step=1000, key="mc_draws")
+            with col2:
+                cv = st.slider("Forecast CV", 0.0, 1.0, 0.3, 0.05, key="mc_cv", help="Standard deviation / mean of each MP forecast")
+            with col3:
+                distribution = st.selectbox("Distribution", nrp_montecarlo.DISTRIBUTIONS, key="mc_distribution")
+            with col4:
+                seed = st.number_input("Random seed", value=0, min_value=0, key="mc_seed")
+            
+            if st.checkbox("Run the simulation", key="mc_run", help=RUN_HELP):
+                simulation = run_simulation(inputs, draws, cv, distribution, seed)
+                p10, p50, p90 = simulation.cp_improvement_quantiles[0]
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("CP Improvement P10", f"${p10:.2f}")
+                col2.metric("CP Improvement P50", f"${p50:.2f}")
+                col3.metric("CP Improvement P90", f"${p90:.2f}")
+                col4.metric("Stockout Before PO Arrival", f"{simulation.p_stockout[0]:.1%}",
+                            help="Share of scenarios where final WoC < T_arrival (stock runs out before the next PO)")
+            
+                col1, col2 = st.columns(2)
+                with col1:
+                    fig_mc_off = go.Figure(data=go.Bar(
+                        x=list(all_mps), y=simulation.p_turn_off[0], marker_color="#2ca02c",
+                        text=[f"{p:.0%}" for p in simulation.p_turn_off[0]], textposition="auto"
+                    ))
+                    fig_mc_off.update_layout(
+                        title="P(TURN_OFF) by Marketplace", yaxis_title="Probability", yaxis_range=[0, 1], height=400
+                    )
+                    st.plotly_chart(fig_mc_off, use_container_width=True)
+                with col2:
+                    fig_mc_cp = go.Figure(data=go.Histogram(x=simulation.cp_improvement[0], nbinsx=50, marker_color="#1f77b4"))
+                    for q, value in zip(nrp_montecarlo.QUANTILES, simulation.cp_improvement_quantiles[0]):
+                        fig_mc_cp.add_vline(x=value, line_dash="dash", line_color="gray", annotation_text=f"P{q}")
+                    fig_mc_cp.update_layout(
+                        title="CP Improvement Distribution", xaxis_title="CP Improvement ($)", yaxis_title="Scenarios", height=400
+                    )
+                    st.plotly_chart(fig_mc_cp, use_container_width=True)
+        timer.lap("monte_carlo")
+
+        # ==================== ROLLING HORIZON SIMULATION ====================
+        with st.expander("📆 Week-by-Week Simulation (Rolling Horizon)", expanded=False):
+            st.caption(
+                "Steps stock week by week: active MPs sell their forecast from the EU stock, the PO lands at "
+                "T_arrival and re-activates turned-off MPs. **Static** keeps the decision above until then; "
+                "**Rolling** re-runs the decision every week on the remaining stock; **None** never turns MPs off."
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                rolling_weeks = st.slider("Horizon (weeks)", nrp_rolling.MIN_WEEKS, nrp_rolling.MAX_WEEKS,
+                                          nrp_rolling.MAX_WEEKS, key="rolling_weeks")
+            with col2:
+                po_cover_weeks = st.number_input("PO Size (weeks of EU forecast)", value=float(nrp_rolling.DEFAULT_PO_COVER_WEEKS),
+                                                 min_value=0.0, step=1.0, key="rolling_po_cover")
+
+            if st.checkbox("Run the simulation", key="rolling_run", help=RUN_HELP):
+                rolling = run_rolling(inputs, rolling_weeks, po_cover_weeks)
+                policy_colors = {"none": "#667eea", "static": "#28a745", "rolling": "#ff7f0e"}
+                cols = st.columns(len(rolling))
+                for col, run in zip(cols, rolling):
+                    col.metric(f"CP ({run.policy.capitalize()})", f"${run.cp[0]:,.2f}",
+                               delta=None if run.policy == "none" else f"${run.cp[0] - rolling[0].cp[0]:+,.2f} vs none",
+                               help=f"OOR cost ${run.oor_cost[0]:,.2f}; MP-weeks turned off: {int(run.weeks_off[0].sum())}")
+
+                weeks_axis = np.arange(1, rolling_weeks + 1)
+                arrival = rolling[0].arrival_week[0]
+                col1, col2 = st.columns(2)
+                with col1:
+                    fig_roll_stock = go.Figure([
+                        go.Scatter(x=weeks_axis, y=run.asin_weekly_stock[0], mode="lines", name=run.policy.capitalize(),
+                                   line=dict(color=policy_colors[run.policy], width=3))
+                        for run in rolling
+                    ])
+                    fig_roll_stock.update_layout(title="EU Stock at Week End", xaxis_title="Week",
+                                                 yaxis_title="Stock (units)", height=400)
+                    if not np.isnan(arrival):
+                        fig_roll_stock.add_vline(x=arrival, line_dash="dash", line_color="orange", annotation_text="PO Arrival")
+                    st.plotly_chart(fig_roll_stock, use_container_width=True)
+                with col2:
+                    fig_roll_cp = go.Figure([
+                        go.Scatter(x=weeks_axis, y=np.cumsum(run.asin_weekly_cp[0]), mode="lines", name=run.policy.capitalize(),
+                                   line=dict(color=policy_colors[run.policy], width=3))
+                        for run in rolling
+                    ])
+                    fig_roll_cp.update_layout(title="Cumulative CP", xaxis_title="Week", yaxis_title="CP ($)", height=400)
+                    if not np.isnan(arrival):
+                        fig_roll_cp.add_vline(x=arrival, line_dash="dash", line_color="orange", annotation_text="PO Arrival")
+                    st.plotly_chart(fig_roll_cp, use_container_width=True)
+                st.dataframe(
+                    pd.DataFrame({
+                        "Marketplace": list(all_mps),
+                        **{f"Weeks Off ({run.policy.capitalize()})": run.weeks_off[0] for run in rolling[1:]},
+                    }),
+                    use_container_width=True, hide_index=True
+                )
+        timer.lap("rolling_simulation")
+
+        # ==================== STOCK REBALANCING ====================
+        with st.expander("🚚 Stock Rebalancing vs Turn-Off", expanded=False):
+            st.caption(
+                "Moves the stock that stocked MPs will not sell before the EU stock runs out to the zero-stock MPs, "
+                "once, at the lane's transfer cost instead of the OOR cost of every cross-border unit. Demand during "
+                "the transfer still ships cross-border. Compared with keeping every MP active and with the "
+                "turn-off decision above (less the OOR cost of its CBF units)."
+            )
+            transfer_weeks = st.number_input("Transfer Time (weeks)", value=nrp_rebalance.DEFAULT_TRANSFER_WEEKS,
+                                              min_value=0.0, step=0.5, key="rebalance_weeks")
+            st.markdown("**Transfer cost per unit ($)**: rows ship to columns")
+            default_lanes = nrp_rebalance.lane_costs(all_mps)
+            lanes_df = st.data_editor(
+                pd.DataFrame(np.where(np.isinf(default_lanes), np.nan, default_lanes),
+                             index=list(all_mps), columns=list(all_mps)),
+                use_container_width=True, key=f"rebalance_lanes_{'_'.join(all_mps)}"
+            )
+            lanes = lanes_df.to_numpy(dtype=np.float64)
+            lanes = np.where(np.isnan(lanes) | np.eye(len(all_mps), dtype=bool), np.inf, lanes)
+
+            if st.checkbox("Optimize transfers", key="rebalance_run", help=RUN_HELP):
+                plan = run_rebalance(inputs, tuple(map(tuple, lanes)), transfer_weeks)
+                cp_values = {"keep": plan.cp_keep[0], "turn_off": plan.cp_turn_off[0], "rebalance": plan.cp_rebalance[0]}
+                labels = {"keep": "Keep All Active", "turn_off": "Turn-Off Decision", "rebalance": "Rebalance Stock"}
+                best = nrp_rebalance.ACTIONS[plan.best[0]]
+                cols = st.columns(len(cp_values))
+                for col, (action, value) in zip(cols, cp_values.items()):
+                    col.metric(f"CP ({labels[action]})" + (" ✅" if action == best else ""), f"${value:,.2f}",
+                               delta=None if action == "keep" else f"${value - plan.cp_keep[0]:+,.2f} vs keep")
+
+                source, destination = np.nonzero(plan.transfer[0] > nrp_rebalance.EPSILON)
+                if len(source):
+                    units = plan.transfer[0, source, destination]
+                    st.dataframe(
+                        pd.DataFrame({
+                            "From": np.asarray(all_mps)[source],
+                            "To": np.asarray(all_mps)[destination],
+                            "Units": units.round(1),
+                            "Cost/Unit ($)": lanes[source, destination],
+                            "Saving vs OOR ($)": ((oor_cost - lanes[source, destination]) * units).round(2),
+                        }),
+                        use_container_width=True, hide_index=True
+                    )
+                    st.caption(f"{plan.units_moved[0]:,.1f} units moved for ${plan.transfer_cost[0]:,.2f}; "
+                               f"{plan.oor_units_after[0]:,.1f} units still ship cross-border. "
+                               f"Solved by {nrp_rebalance.METHODS[plan.method[0]].replace('_', ' ')}.")
+                else:
+                    st.info("No transfer pays off: no stocked MP has stock to spare, no MP is at zero stock, "
+                            "or every lane costs at least the OOR cost.")
+        timer.lap("rebalancing")
+
+    # ==================== SCENARIO WORKSPACE ====================
+    st.markdown("---")
+    # Scenarios of this session (saved or opened): name -> nrp_scenarios.Scenario,
+    # least recently used first
+    workspace = st.session_state.setdefault("scenarios", {})
+    with st.expander("🗂️ Scenario Workspace", expanded=bool(workspace)):
+        store = scenario_store()
+        scenario_name = st.text_input(
+            "Scenario Name",
+            value=f"{po_status} · OOR ${oor_cost:.2f} · WoC {max_woc:g}",
+            help="Saved on this server; saving an existing name replaces it."
+        ).strip()
+        if st.button("💾 Save Scenario", disabled=not scenario_name):
+            scenario = nrp_scenarios.Scenario(inputs, results, build_figures(inputs))
+            aliases = store.save(scenario_name, scenario)
+            workspace.pop(scenario_name, None)
+            workspace[scenario_name] = scenario
+            # Newly saved scenarios join the comparison
+            compared = [name for name in st.session_state.get("compare_scenarios", []) if name != scenario_name]
+            st.session_state["compare_scenarios"] = ([scenario_name] + compared)[:COMPARE_SCENARIOS]
+            st.success(f"Saved **{scenario_name}**" + (
+                f" - same inputs as {', '.join(aliases)}, stored once." if aliases else "."
+            ))
+
+        saved = store.names()["name"].tolist()
+        options = list(dict.fromkeys(list(reversed(workspace)) + saved))
+        if "compare_scenarios" in st.session_state:
+            st.session_state["compare_scenarios"] = [
+                name for name in st.session_state["compare_scenarios"] if name in options
+            ]
+        selected = st.multiselect(
+            "Compare Scenarios",
+            options,
+            key="compare_scenarios",
+            max_selections=COMPARE_SCENARIOS,
+            help="Scenarios of this session first, then those saved on this server."
+        )
+        scenarios = {}
+        for name in selected:
+            if name not in workspace:
+                try:
+                    workspace[name] = store.load(name)
+                except KeyError:
+                    st.warning(f"Scenario **{name}** is no longer saved on this server.")
+                    continue
+            scenarios[name] = workspace.pop(name)
+            workspace[name] = scenarios[name]
+        while len(workspace) > SESSION_SCENARIOS:
+            workspace.pop(next(name for name in workspace if name not in scenarios))
+
+        if scenarios:
+            # Rendered from the stored results: nothing is recomputed
+            st.dataframe(nrp_scenarios.compare(scenarios), use_container_width=True)
+            st.dataframe(nrp_scenarios.decision_grid(scenarios), use_container_width=True)
+            cp_after = {name: scenario.results[1].cp_after[0] for name, scenario in scenarios.items()}
+            best_cp = max(cp_after.values())
+            best = ", ".join(f"**{name}**" for name, value in cp_after.items() if value == best_cp)
+            st.caption(f"Highest CP after NRP (${best_cp:,.2f}): {best}")
+
+            chart = st.radio("Chart", list(SCENARIO_CHARTS), format_func=SCENARIO_CHARTS.get, horizontal=True)
+            for col, (name, scenario) in zip(st.columns(len(scenarios)), scenarios.items()):
+                with col:
+                    st.markdown(f"**{name}**")
+                    st.plotly_chart(scenario.figures[chart], use_container_width=True, key=f"scenario_chart_{name}")
+        stats = store.stats()
+        st.caption(f"{stats['scenarios']} distinct scenarios ({stats['bytes'] / 1e6:.1f} MB) saved on this server; "
+                   "identical inputs are stored once and reused instead of recomputed.")
+    timer.lap("scenarios")
 
 else:
     st.info("👈 Set your parameters in the **sidebar** and marketplace inputs above, then click **Calculate** to see results")
@@ -656,4 +960,43 @@ else:
         "Forecast": [30, 25, 15, 10],
         "CPPU": ["$3.00", "$2.80", "$2.00", "$1.80"]
     })
-    st.dataframe(sample_data, use_container_width=True, hide_index=True)
\ No newline at end of file
+    st.dataframe(sample_data, use_container_width=True, hide_index=True)
+
+# ==================== CATALOG BATCH RUN ====================
+st.markdown("---")
+with st.expander("📦 Catalog Batch Run", expanded="batch_job" in st.session_state):
+    batch_job = st.session_state.get("batch_job")
+    polling = batch_job is not None and not batch_job.done
+    st.session_state["batch_job_polling"] = polling
+    st.fragment(batch_panel, run_every=JOB_POLL_SECONDS if polling else None)(*sidebar_params)
+timer.lap("batch_run")
+
+# ==================== DEBUG: STAGE TIMINGS ====================
+if debug_timings:
+    timer.lap("page_end")
+    runs = st.session_state.setdefault("timing_runs", [])
+    runs.append(timer.jsonl(run=len(runs), scope="page")
+                + (calc_timer.jsonl(run=len(runs), scope="calculation") if calc_timer else ""))
+    del runs[:-TIMING_RUNS]
+    page_timings = timer.frame()
+    with st.expander("⏱️ Stage Timings (debug)", expanded=False):
+        st.caption(f"This run: {page_timings['Total (ms)'].sum():.1f} ms of script time. "
+                   "Each page stage covers the time since the previous one, widget rendering included.")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Page stages**")
+            st.dataframe(page_timings, use_container_width=True, hide_index=True,
+                         column_config={"Total (ms)": st.column_config.NumberColumn(format="%.2f"),
+                                        "Share": st.column_config.ProgressColumn(min_value=0, max_value=1)})
+        with col2:
+            st.markdown("**Calculation and figure stages** (uncached)")
+            if calc_timer is not None and calc_timer.records:
+                st.dataframe(calc_timer.frame(), use_container_width=True, hide_index=True,
+                             column_config={"Total (ms)": st.column_config.NumberColumn(format="%.3f"),
+                                            "Share": st.column_config.ProgressColumn(min_value=0, max_value=1)})
+            else:
+                st.caption("No calculation in this run.")
+        st.download_button(
+            f"Download timings of the last {len(runs)} run(s) (JSON lines)",
+            "".join(runs), file_name="nrp_timings.jsonl", mime="application/x-ndjson"
+        )
@@ -0,0 +1,400 @@
+"""Batch NRP evaluation of catalog files.
+
+Streams a CSV or Parquet catalog of ASIN x marketplace rows in fixed-size
+chunks, pivots each chunk to the marketplace arrays of ``nrp_engine``,
+evaluates it and appends the results to the output file, so memory stays flat
+whatever the file size. Rows of one ASIN must be contiguous in the file.
+
+    python nrp_batch.py catalog.csv results.csv --oor-cost 1.5 --max-woc 7
+"""
+import argparse
+import contextlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import nrp_engine
+import nrp_timing
+
+# Catalog columns: one row per ASIN x marketplace. PO status, lead time
+# (days) and PO arrival (weeks) are per ASIN and read from its first row.
+INPUT_COLUMNS = ["asin", "marketplace", "stock", "forecast", "cppu", "po_status", "lead_time", "po_arrival"]
+
+# Optional time-phased weekly forecasts: forecast_w1, forecast_w2, ...
+HORIZON_PREFIX = "forecast_w"
+
+# Optional vendor ID column. With a vendor table (nrp_vendors) PO status,
+# lead time and PO arrival come from the ASIN's vendor, and the catalog's
+# own columns are only needed for EoL and Incoming PO ASINs.
+VENDOR_ID = "vendor_id"
+
+# Identifier columns, always read as strings (all-digit ASINs such as
+# ISBN-10s keep their leading zeros and every chunk has the same dtypes)
+STRING_DTYPES = {"asin": str, "marketplace": str, VENDOR_ID: str}
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+
+
+def _is_input_column(name):
+    return name in INPUT_COLUMNS or name == VENDOR_ID or horizon_week(name) is not None
+
+
+def horizon_week(column):
+    """Week number of a forecast horizon column (forecast_w3 -> 3), else None."""
+    week = column[len(HORIZON_PREFIX):] if column.startswith(HORIZON_PREFIX) else ""
+    return int(week) if week.isdigit() else None
+
+
+def read_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield the catalog as DataFrames of at most chunk_rows rows."""
+    if _is_parquet(path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet catalogs requires pyarrow (pip install pyarrow)")
+        parquet = pq.ParquetFile(path)
+        columns = [name for name in parquet.schema_arrow.names if _is_input_column(name)]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+            df = batch.to_pandas()
+            yield df.astype({name: str for name in STRING_DTYPES if name in df})
+    else:
+        yield from pd.read_csv(path, usecols=_is_input_column, chunksize=chunk_rows, dtype=STRING_DTYPES)
+
+
+def asin_chunks(chunks):
+    """Re-cut chunks so that no ASIN is split across two of them.
+
+    The rows of the last ASIN in each chunk are carried over to the next one.
+    """
+    carry = None
+    for df in chunks:
+        if not len(df):
+            continue
+        if carry is not None:
+            df = pd.concat([carry, df], ignore_index=True)
+        asin = df["asin"].to_numpy()
+        is_last = asin == asin[-1]
+        tail_start = len(df) - int(np.argmin(is_last[::-1])) if not is_last.all() else 0
+        carry = df.iloc[tail_start:]
+        if tail_start > 0:
+            yield df.iloc[:tail_start]
+    if carry is not None and len(carry):
+        yield carry
+
+
+def po_status_codes(values):
+    """PO status column (labels from nrp_engine.PO_STATUSES or codes) as codes."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        codes = values.to_numpy(dtype=np.int8)
+        unknown = (codes < 0) | (codes >= len(nrp_engine.PO_STATUSES))
+    else:
+        codes = pd.Categorical(values, categories=nrp_engine.PO_STATUSES).codes
+        unknown = codes < 0
+    if unknown.any():
+        raise ValueError(f"Unknown PO status {values[unknown].iloc[0]!r}")
+    return codes
+
+
+def pivot_chunk(df, marketplaces, vendors=None):
+    """Pivot catalog rows to per-ASIN marketplace arrays.
+
+    Returns (asins, records, po_status, lead_time, po_arrival, asin_idx,
+    mp_idx): records is an (n_asins, n_marketplaces) MARKETPLACE_DTYPE array
+    and asin_idx/mp_idx locate each input row in it. MPs an ASIN does not list
+    are left at zero stock and forecast, which leaves its result unchanged.
+    Raises ValueError for unknown marketplaces and for ASINs listing a
+    marketplace twice.
+    vendors: optional nrp_vendors.VendorTable joined on the VENDOR_ID column.
+    """
+    asin_idx, asins = pd.factorize(df["asin"], sort=False)
+    mp_idx = pd.Categorical(df["marketplace"], categories=marketplaces).codes
+    if (mp_idx < 0).any():
+        unknown = df["marketplace"].to_numpy()[mp_idx < 0][0]
+        raise ValueError(f"Unknown marketplace {unknown!r}, expected one of {marketplaces}")
+    cell = asin_idx * len(marketplaces) + mp_idx
+    duplicated = np.bincount(cell, minlength=len(asins) * len(marketplaces)) > 1
+    if duplicated.any():
+        row = int(np.argmax(duplicated[cell]))
+        raise ValueError(
+            f"Duplicate rows for ASIN {asins[asin_idx[row]]!r} in marketplace {marketplaces[mp_idx[row]]!r}"
+        )
+
+    records = nrp_engine.marketplace_inputs(len(asins), len(marketplaces))
+    for field in ("stock", "forecast", "cppu"):
+        records[field][asin_idx, mp_idx] = df[field].to_numpy(dtype=np.float64)
+
+    first = np.unique(asin_idx, return_index=True)[1]
+    per_asin = df.iloc[first]
+    if vendors is not None:
+        po_status, lead_time, po_arrival, _ = vendors.join(
+            per_asin[VENDOR_ID].to_numpy(),
+            po_status_codes(per_asin["po_status"]) if "po_status" in per_asin else None,
+            per_asin["po_arrival"].to_numpy(dtype=np.float64) if "po_arrival" in per_asin else None,
+        )
+    else:
+        po_status = po_status_codes(per_asin["po_status"])
+        lead_time = per_asin["lead_time"].to_numpy(dtype=np.float64)
+        po_arrival = per_asin["po_arrival"].to_numpy(dtype=np.float64)
+    return asins, records, po_status, lead_time, po_arrival, asin_idx, mp_idx
+
+
+def pivot_horizon(df, shape, asin_idx, mp_idx):
+    """Weekly forecast columns as an (n_asins, n_marketplaces, n_weeks) array, or None.
+
+    Weeks are ordered by their number and must run from 1 without gaps.
+    """
+    columns = sorted((c for c in df.columns if horizon_week(c) is not None), key=horizon_week)
+    if not columns:
+        return None
+    if [horizon_week(c) for c in columns] != list(range(1, len(columns) + 1)):
+        raise ValueError(f"Forecast horizon columns must be {HORIZON_PREFIX}1..{HORIZON_PREFIX}N without gaps")
+    horizon = np.zeros(shape + (len(columns),))
+    horizon[asin_idx, mp_idx] = df[columns].to_numpy(dtype=np.float64)
+    return horizon
+
+
+def evaluate_chunk(df, marketplaces, oor_cost, max_woc, mode="greedy", timer=None, vendors=None):
+    """Evaluate one chunk of catalog rows; returns one result row per input row.
+
+    timer: optional nrp_timing.StageTimer (pivot, engine stages, result_frame).
+    vendors: optional nrp_vendors.VendorTable (see pivot_chunk).
+    """
+    with nrp_timing.stage(timer, "pivot"):
+        asins, records, po_status, lead_time, po_arrival, asin_idx, mp_idx = pivot_chunk(df, marketplaces, vendors)
+        horizon = pivot_horizon(df, records.shape, asin_idx, mp_idx)
+    result = nrp_engine.evaluate_records(
+        records, po_status, lead_time, po_arrival, oor_cost, max_woc, mode, horizon, timer
+    )
+    with nrp_timing.stage(timer, "result_frame"):
+        return result_frame(
+            df["asin"].to_numpy(), df["marketplace"].to_numpy(), result, asin_idx, mp_idx, po_status
+        )
+
+
+def result_frame(asin, marketplace, result, asin_idx, mp_idx, po_status=None):
+    """Per ASIN x marketplace result rows; ASIN-level metrics are repeated.
+
+    po_status: optional per-ASIN PO status codes, added as a label column.
+    """
+    df = pd.DataFrame({
+        "asin": asin,
+        "marketplace": marketplace,
+        "decision": np.asarray(nrp_engine.DECISIONS)[result.decision[asin_idx, mp_idx]],
+        "new_woc": result.new_woc[asin_idx, mp_idx],
+        "pass_cppu": result.pass_cppu[asin_idx, mp_idx],
+        "pass_woc_health": result.pass_woc_health[asin_idx, mp_idx],
+        "pass_depletion": result.pass_depletion[asin_idx, mp_idx],
+        "woc_eu": result.woc_eu[asin_idx],
+        "final_woc": result.final_woc[asin_idx],
+        "t_arrival": result.t_arrival[asin_idx],
+        "cp_before": result.cp_before[asin_idx],
+        "cp_after": result.cp_after[asin_idx],
+        "cbf_units_before": result.cbf_units_before[asin_idx],
+        "cbf_units_after": result.cbf_units_after[asin_idx],
+    })
+    if po_status is not None:
+        df["po_status"] = np.asarray(nrp_engine.PO_STATUSES)[np.asarray(po_status)[asin_idx]]
+    return df
+
+
+def empty_result():
+    """Result frame with no rows and the columns of evaluate_chunk()."""
+    catalog = pd.DataFrame({name: pd.Series(dtype=np.float64) for name in INPUT_COLUMNS})
+    catalog[["asin", "marketplace", "po_status"]] = catalog[["asin", "marketplace", "po_status"]].astype(object)
+    return evaluate_chunk(catalog, list(nrp_engine.MARKETPLACES), 0.0, 0.0)
+
+
+class ResultWriter:
+    """Appends result chunks to a CSV or Parquet file.
+
+    empty: optional frame written on close if no chunk was, so that the
+    output exists (header only) for an empty input.
+    """
+
+    def __init__(self, path, empty=None):
+        self.path = path
+        self.parquet = _is_parquet(path)
+        self.empty = empty
+        self._writer = None
+        self._header = True
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is None and self._header and self.empty is not None:
+            self.write(self.empty)
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run(input_path, output_path, oor_cost, max_woc, marketplaces=None, mode="greedy",
+        chunk_rows=DEFAULT_CHUNK_ROWS, progress=None, timer=None, checkpoint=None, keep_checkpoint=False,
+        vendors=None):
+    """Evaluate a whole catalog file chunk by chunk. Returns run statistics.
+
+    progress: optional callable receiving the stats dict after every chunk.
+    timer: optional nrp_timing.StageTimer; its records carry the chunk number.
+    checkpoint: optional checkpoint directory (see nrp_checkpoint). Chunks
+    are committed there as they finish and compacted into output_path at
+    the end; a run restarted with the same directory skips the committed
+    chunks (counted in stats["resumed_chunks"]).
+    vendors: optional nrp_vendors.VendorTable for catalogs with a VENDOR_ID
+    column.
+    """
+    marketplaces = list(marketplaces or nrp_engine.MARKETPLACES)
+    stats = {"rows": 0, "asins": 0, "chunks": 0, "turned_off": 0, "seconds": 0.0, "rows_per_sec": 0.0,
+             "resumed_chunks": 0}
+    start = time.perf_counter()
+    if checkpoint is not None:
+        import nrp_checkpoint
+        checkpoint = nrp_checkpoint.Checkpoint.open(
+            checkpoint,
+            nrp_checkpoint.run_key(input_path, oor_cost, max_woc, marketplaces, mode, chunk_rows, vendors),
+            output_path
+        )
+    chunks = asin_chunks(read_chunks(input_path, chunk_rows))
+    with ResultWriter(output_path, empty_result()) if checkpoint is None else contextlib.nullcontext() as writer:
+        while True:
+            chunk = stats["chunks"]
+            if timer is not None:
+                timer.context["chunk"] = chunk
+            with nrp_timing.stage(timer, "read"):
+                df = next(chunks, None)
+            if df is None:
+                break
+            if checkpoint is not None and chunk in checkpoint.done:
+                done = checkpoint.done[chunk]
+                rows, asins, turned_off = done["rows"], done["asins"], done["turned_off"]
+                stats["resumed_chunks"] += 1
+            else:
+                out = evaluate_chunk(df, marketplaces, oor_cost, max_woc, mode, timer, vendors)
+                rows, asins = len(df), int(df["asin"].nunique())
+                turned_off = int((out["decision"] == "TURN_OFF").sum())
+                with nrp_timing.stage(timer, "write"):
+                    if checkpoint is None:
+                        writer.write(out)
+                    else:
+                        nrp_checkpoint.write_part(out, checkpoint.part_path(chunk))
+                        checkpoint.commit(chunk, rows, asins, turned_off)
+            stats["rows"] += rows
+            stats["asins"] += asins
+            stats["chunks"] += 1
+            stats["turned_off"] += turned_off
+            stats["seconds"] = time.perf_counter() - start
+            stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+            if progress is not None:
+                progress(stats)
+    if checkpoint is not None:
+        with nrp_timing.stage(timer, "compact"):
+            checkpoint.compact(output_path, stats["chunks"], keep_checkpoint)
+        stats["seconds"] = time.perf_counter() - start
+        stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
+
+
+def add_model_arguments(parser):
+    """Global model parameters shared by the batch command line tools."""
+    parser.add_argument("--oor-cost", type=float, default=1.50, help="OOR cost per unit ($)")
+    parser.add_argument("--max-woc", type=float, default=7, help="Max healthy WoC (weeks)")
+    parser.add_argument("--mode", choices=nrp_engine.MODES, default="greedy", help="Turn-off search")
+    parser.add_argument(
+        "--marketplaces", type=lambda s: s.split(","), default=list(nrp_engine.MARKETPLACES),
+        help="Comma-separated marketplace codes (default: all known)",
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate NRP decisions for a catalog file.")
+    parser.add_argument(
+        "input",
+        help="Catalog CSV/Parquet with columns " + ", ".join(INPUT_COLUMNS) + " (one row per ASIN and marketplace)",
+    )
+    parser.add_argument("output", help="Result CSV/Parquet path")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows read per chunk")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Worker processes (0 = one per CPU); output is identical for any value",
+    )
+    parser.add_argument("--timings", help="Write per-chunk stage timings to this JSON lines file (1 worker only)")
+    parser.add_argument("--profile", help="Write cProfile stats of the run to this file (main process only)")
+    parser.add_argument("--history", help="Also add the results as a run to this history database (nrp_history)")
+    parser.add_argument("--run-date", help="ISO date of the run in the history (default today)")
+    parser.add_argument(
+        "--checkpoint",
+        help="Commit finished chunks to this directory and resume from it when re-run (nrp_checkpoint)",
+    )
+    parser.add_argument("--keep-checkpoint", action="store_true", help="Keep the checkpoint directory at the end")
+    parser.add_argument(
+        "--vendors",
+        help=f"Vendor table (nrp_vendors) joined on the catalog's {VENDOR_ID} column for PO status and lead time",
+    )
+    add_model_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.timings and args.workers != 1:
+        parser.error("--timings needs --workers 1")
+
+    kwargs = dict(marketplaces=args.marketplaces, mode=args.mode, chunk_rows=args.chunk_rows,
+                  checkpoint=args.checkpoint, keep_checkpoint=args.keep_checkpoint)
+    if args.vendors:
+        import nrp_vendors
+        kwargs["vendors"] = nrp_vendors.VendorTable.from_file(args.vendors)
+    timer = nrp_timing.StageTimer() if args.timings else None
+    with nrp_timing.profile(args.profile) if args.profile else contextlib.nullcontext():
+        if args.workers == 1:
+            stats = run(args.input, args.output, args.oor_cost, args.max_woc, timer=timer, **kwargs)
+        else:
+            import nrp_parallel
+            stats = nrp_parallel.run(
+                args.input, args.output, args.oor_cost, args.max_woc, workers=args.workers or None, **kwargs
+            )
+    print(
+        f"{stats['rows']:,} rows ({stats['asins']:,} ASINs, {stats['chunks']} chunks) in "
+        f"{stats['seconds']:.1f}s: {stats['rows_per_sec']:,.0f} rows/sec, "
+        f"{stats['turned_off']:,} MPs turned off"
+    )
+    if stats["resumed_chunks"]:
+        print(f"  resumed: {stats['resumed_chunks']} chunks were already committed in {args.checkpoint}")
+    for pid, worker in sorted(stats.get("per_worker", {}).items()):
+        print(
+            f"  worker {pid}: {worker['chunks']} chunks, {worker['rows']:,} rows, "
+            f"{worker['rows_per_sec']:,.0f} rows/sec"
+        )
+    if timer is not None:
+        timer.write_jsonl(args.timings, input=args.input, mode=args.mode)
+        for name, (calls, seconds) in timer.totals().items():
+            print(f"  {name:>24}: {seconds:8.2f}s ({calls} calls)")
+        print(f"Stage timings written to {args.timings}")
+    if args.profile:
+        print(f"Profile written to {args.profile} (python -m pstats {args.profile})")
+    if args.history:
+        import nrp_history
+        with nrp_history.ResultHistory(args.history) as history:
+            run_id = history.add_file(args.output, args.run_date)
+        print(f"Added to {args.history} as run {run_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Benchmark suite for the decision logic and the app's render path.
+
+Runs every stage on synthetic catalogs (ASIN count, marketplace count, share
+of zero-stock MPs, PO status mix) and records throughput and peak memory
+(tracemalloc) per stage:
+
+- decision: nrp_engine.evaluate() in greedy and optimal mode (NumPy kernel),
+  and decision_jit with the Numba kernels when Numba is installed
+- cp_breakdown: per-MP CP/CBF units (nrp_engine.marketplace_breakdown)
+- reference: the scalar per-ASIN path (nrp_reference), also used to check
+  the engine's results on a sample of every catalog
+- figures, tables: the app's Plotly figures and DataFrames for one ASIN
+
+Results are compared against a stored baseline; a stage whose throughput
+drops or whose peak memory grows by more than the tolerance, or any
+mismatch with the reference, fails the run (exit status 1). Baselines are
+machine specific: save one on the machine that runs the comparison.
+
+    python nrp_bench.py                    # compare with nrp_bench_baseline.json
+    python nrp_bench.py --save-baseline    # record a new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import nrp_engine
+import nrp_figures
+import nrp_jit
+import nrp_reference
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nrp_bench_baseline.json")
+# Millisecond-scale stages (figures, tables) vary by up to ~30% between runs
+DEFAULT_TOLERANCE = 0.40
+
+# Global parameters of every benchmark run
+OOR_COST = 1.50
+MAX_WOC = 7
+
+# Synthetic catalogs: synthetic_catalog() keyword arguments
+CASES = {
+    "4mp": dict(n_asins=200_000, n_marketplaces=4),
+    "9mp": dict(n_asins=200_000, n_marketplaces=9),
+    "4mp_mostly_zero": dict(n_asins=200_000, n_marketplaces=4, zero_stock_share=0.9),
+    "4mp_eol_heavy": dict(n_asins=200_000, n_marketplaces=4, po_mix=(0.1, 0.1, 0.1, 0.7)),
+}
+
+# ASINs run through the scalar reference and renders per figure/table stage
+REFERENCE_SAMPLE = 5_000
+RENDERS = 10
+
+
+def synthetic_catalog(n_asins, n_marketplaces=4, zero_stock_share=0.5, po_mix=(0.4, 0.2, 0.3, 0.1), seed=0):
+    """Random catalog. Returns (records, po_status, lead_time, po_arrival).
+
+    po_mix: relative frequency of each PO status (nrp_engine.PO_STATUSES order).
+    """
+    rng = np.random.default_rng(seed)
+    shape = (n_asins, n_marketplaces)
+    records = nrp_engine.marketplace_inputs(n_asins, n_marketplaces)
+    records["stock"] = np.where(rng.random(shape) < zero_stock_share, 0, rng.integers(1, 300, shape))
+    records["forecast"] = rng.integers(0, 60, shape)
+    records["cppu"] = rng.uniform(0.5, 4.0, shape).round(2)
+    po_mix = np.asarray(po_mix, dtype=np.float64)
+    po_status = rng.choice(len(po_mix), n_asins, p=po_mix / po_mix.sum()).astype(np.int8)
+    lead_time = rng.integers(1, 60, n_asins).astype(np.float64)
+    po_arrival = rng.uniform(0.5, 12.0, n_asins).round(1)
+    return records, po_status, lead_time, po_arrival
+
+
+def measure(fn, items, repeat):
+    """Best-of-repeat wall time and tracemalloc peak of fn(). Returns a stats dict."""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"items": items, "seconds": seconds, "throughput": items / seconds if seconds > 0 else 0.0,
+            "peak_mb": peak / 2**20}
+
+
+def run_case(n_asins, n_marketplaces=4, zero_stock_share=0.5, po_mix=(0.4, 0.2, 0.3, 0.1), repeat=3, seed=0):
+    """Benchmark every stage on one synthetic catalog. Returns (stages, mismatches)."""
+    records, po_status, lead_time, po_arrival = synthetic_catalog(
+        n_asins, n_marketplaces, zero_stock_share, po_mix, seed
+    )
+    params = (po_status, lead_time, po_arrival, OOR_COST, MAX_WOC)
+    marketplaces = list(nrp_engine.MARKETPLACES)[:n_marketplaces]
+    result = nrp_engine.evaluate_records(records, *params, kernel="numpy")
+    breakdown = nrp_engine.marketplace_breakdown(records["stock"], records["forecast"], records["cppu"], result, OOR_COST)
+    sample = range(min(REFERENCE_SAMPLE, n_asins))
+    # The app renders figures and tables only for ASINs with zero-stock MPs
+    renders = np.flatnonzero(result.n_zero > 0)[:RENDERS]
+
+    def reference():
+        for r in sample:
+            nrp_reference.evaluate_asin(
+                records["stock"][r].tolist(), records["forecast"][r].tolist(), records["cppu"][r].tolist(),
+                int(po_status[r]), float(lead_time[r]), float(po_arrival[r]), OOR_COST, MAX_WOC,
+            )
+
+    def figures():
+        for r in renders:
+            nrp_figures.result_figures(records, result, breakdown, marketplaces, MAX_WOC, row=r)
+
+    def tables():
+        for r in renders:
+            nrp_figures.comparison_table(result, marketplaces, OOR_COST, row=r)
+            nrp_figures.detailed_table(records, result, breakdown, marketplaces, row=r)
+
+    stages = {
+        "decision": measure(lambda: nrp_engine.evaluate_records(records, *params, kernel="numpy"), n_asins, repeat),
+        "decision_optimal": measure(
+            lambda: nrp_engine.evaluate_records(records, *params, mode="optimal", kernel="numpy"), n_asins, repeat
+        ),
+        "cp_breakdown": measure(
+            lambda: nrp_engine.marketplace_breakdown(
+                records["stock"], records["forecast"], records["cppu"], result, OOR_COST
+            ),
+            n_asins, repeat,
+        ),
+        "reference": measure(reference, len(sample), 1),
+        "figures": measure(figures, len(renders), repeat),
+        "tables": measure(tables, len(renders), repeat),
+    }
+    mismatches = nrp_reference.mismatches(records, *params, result, sample)
+    if nrp_jit.AVAILABLE:
+        nrp_jit.warm_up()
+        stages["decision_jit"] = measure(
+            lambda: nrp_engine.evaluate_records(records, *params, kernel="jit"), n_asins, repeat
+        )
+        jit_result = nrp_engine.evaluate_records(records, *params, kernel="jit")
+        mismatches += [
+            (row, f"{field} (jit)") for row, field in nrp_reference.mismatches(records, *params, jit_result, sample)
+        ]
+    return stages, mismatches
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regressions of results against a baseline, as readable messages."""
+    regressions = []
+    for case, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(case, {}).get(stage)
+            if base is None:
+                continue
+            if current["throughput"] < base["throughput"] * (1 - tolerance):
+                regressions.append(
+                    f"{case}/{stage}: throughput {current['throughput']:,.0f}/s vs baseline "
+                    f"{base['throughput']:,.0f}/s ({current['throughput'] / base['throughput'] - 1:+.0%})"
+                )
+            # 1 MB of slack for small stages
+            if current["peak_mb"] > base["peak_mb"] * (1 + tolerance) + 1:
+                regressions.append(
+                    f"{case}/{stage}: peak memory {current['peak_mb']:.1f} MB vs baseline {base['peak_mb']:.1f} MB"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the NRP engine and render path against a baseline.")
+    parser.add_argument("--cases", type=lambda s: s.split(","), default=list(CASES),
+                        help="Comma-separated cases (default: all of " + ", ".join(CASES) + ")")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON path")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed throughput drop / peak memory growth (0.4 = 40%%)")
+    parser.add_argument("--output", help="Also write the results to this JSON path")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"Unknown cases {sorted(unknown)}, expected some of {list(CASES)}")
+
+    results = {}
+    failed = False
+    for case in args.cases:
+        stages, mismatches = run_case(repeat=args.repeat, **CASES[case])
+        results[case] = stages
+        for stage, stats in stages.items():
+            print(f"{case:>16} {stage:>16}: {stats['throughput']:>14,.0f} /s  {stats['seconds'] * 1000:>9.1f} ms  "
+                  f"peak {stats['peak_mb']:>8.1f} MB")
+        speedup = stages["decision"]["throughput"] / stages["reference"]["throughput"]
+        print(f"{case:>16} engine vs scalar reference: {speedup:,.0f}x")
+        if mismatches:
+            failed = True
+            print(f"FAIL {case}: {len(mismatches)} mismatches with the scalar reference, e.g. {mismatches[:5]}")
+
+    report = {
+        "machine": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "cases": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["cases"], args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        failed |= bool(regressions)
+        if not regressions:
+            print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Decision boundaries of the NRP checks.
+
+For every evaluated (zero-stock) MP, the input value at which each of the
+three checks flips, in closed form from an engine result:
+
+- CPPU check, ``cppu - oor_cost <= CPPU_avg``: passes for OOR cost >= cppu - CPPU_avg
+- WoC health, ``WoC_new <= max_woc``: passes for max WoC >= WoC_new
+- Depletion, ``WoC_new < T_arrival``: passes for T_arrival > WoC_new, i.e. PO
+  arrival > WoC_new (Incoming PO) or lead time > 7 * WoC_new days
+  (2 * lead time for CR < 25%); never flips for EoL products
+
+WoC_new is taken from the sequential pass (each MP sees F_EU_remaining after
+the MPs evaluated before it), so every threshold holds the decisions of the
+other MPs fixed.
+
+    python nrp_boundaries.py catalog.csv boundaries.csv --tolerance 0.1
+"""
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import nrp_batch
+import nrp_engine
+
+DEFAULT_TOLERANCE = 0.10
+
+
+@dataclass
+class Boundaries:
+    """Flip thresholds, (n_asins, n_marketplaces); NaN where not applicable."""
+    oor_cost: np.ndarray  # CPPU check passes at or above
+    max_woc: np.ndarray  # health check passes at or above
+    t_arrival: np.ndarray  # depletion check passes above (weeks)
+    po_arrival: np.ndarray  # ... as PO arrival (weeks), Incoming PO only
+    lead_time: np.ndarray  # ... as vendor lead time (days), No PO only
+
+
+def decision_boundaries(cppu, po_status, result):
+    """Flip thresholds for every MP evaluated in an engine result."""
+    cppu = np.asarray(cppu, dtype=np.float64)
+    n, m = cppu.shape
+    po_status = np.broadcast_to(np.asarray(po_status), (n,))[:, None]
+    evaluated = ~np.isnan(result.new_woc)
+    woc_new = result.new_woc
+
+    oor_cost = np.where(evaluated, cppu - result.cppu_avg[:, None], np.nan)
+    t_arrival = np.where(evaluated & (po_status != nrp_engine.PO_EOL), woc_new, np.nan)
+    po_arrival = np.where(po_status == nrp_engine.PO_INCOMING, t_arrival, np.nan)
+    lead_time = np.select(
+        [po_status == nrp_engine.PO_NO_PO_HIGH_CR, po_status == nrp_engine.PO_NO_PO_LOW_CR],
+        [t_arrival * 7, t_arrival * 7 / 2],
+        default=np.nan,
+    )
+    return Boundaries(oor_cost=oor_cost, max_woc=woc_new.copy(), t_arrival=t_arrival,
+                      po_arrival=po_arrival, lead_time=lead_time)
+
+
+def _within(value, threshold, tolerance):
+    # |value - threshold| within tolerance (relative to value); NaN thresholds never are
+    value = np.asarray(value, dtype=np.float64)
+    scale = np.maximum(np.abs(value), 1e-12)
+    with np.errstate(invalid="ignore"):
+        return np.abs(value - threshold) <= tolerance * scale
+
+
+def fragile_checks(boundaries, oor_cost, max_woc, lead_time, po_arrival, tolerance=DEFAULT_TOLERANCE):
+    """Which checks have their input within tolerance (e.g. 0.1 = 10%) of the boundary.
+
+    Parameters are scalars or per-ASIN arrays. Returns (cppu, health,
+    depletion) boolean (n, m) arrays; an MP is fragile if any of them is set.
+    """
+    def per_asin(value):
+        return np.asarray(value, dtype=np.float64).reshape(-1, 1)
+
+    cppu = _within(per_asin(oor_cost), boundaries.oor_cost, tolerance)
+    health = _within(per_asin(max_woc), boundaries.max_woc, tolerance)
+    depletion = (
+        _within(per_asin(po_arrival), boundaries.po_arrival, tolerance)
+        | _within(per_asin(lead_time), boundaries.lead_time, tolerance)
+    )
+    return cppu, health, depletion
+
+
+def boundary_frame(asin, marketplace, boundaries, checks, asin_idx, mp_idx):
+    """Per ASIN x marketplace rows with thresholds and fragility flags."""
+    cppu, health, depletion = checks
+    at = (asin_idx, mp_idx)
+    return pd.DataFrame({
+        "asin": asin,
+        "marketplace": marketplace,
+        "oor_cost_threshold": boundaries.oor_cost[at],
+        "max_woc_threshold": boundaries.max_woc[at],
+        "t_arrival_threshold": boundaries.t_arrival[at],
+        "po_arrival_threshold": boundaries.po_arrival[at],
+        "lead_time_threshold": boundaries.lead_time[at],
+        "fragile_cppu": cppu[at],
+        "fragile_woc_health": health[at],
+        "fragile_depletion": depletion[at],
+        "fragile": (cppu | health | depletion)[at],
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decision boundaries and fragile decisions for a catalog file.")
+    parser.add_argument("input", help="Catalog CSV/Parquet with columns " + ", ".join(nrp_batch.INPUT_COLUMNS))
+    parser.add_argument("output", help="Result CSV/Parquet path")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative distance to a boundary flagged as fragile (0.1 = 10%%)")
+    parser.add_argument("--chunk-rows", type=int, default=nrp_batch.DEFAULT_CHUNK_ROWS, help="Rows read per chunk")
+    nrp_batch.add_model_arguments(parser)
+    args = parser.parse_args(argv)
+
+    rows = fragile = 0
+    with nrp_batch.ResultWriter(args.output) as writer:
+        for df in nrp_batch.asin_chunks(nrp_batch.read_chunks(args.input, args.chunk_rows)):
+            _, records, po_status, lead_time, po_arrival, asin_idx, mp_idx = nrp_batch.pivot_chunk(df, args.marketplaces)
+            result = nrp_engine.evaluate_records(
+                records, po_status, lead_time, po_arrival, args.oor_cost, args.max_woc, args.mode
+            )
+            boundaries = decision_boundaries(records["cppu"], po_status, result)
+            checks = fragile_checks(boundaries, args.oor_cost, args.max_woc, lead_time, po_arrival, args.tolerance)
+            out = boundary_frame(
+                df["asin"].to_numpy(), df["marketplace"].to_numpy(), boundaries, checks, asin_idx, mp_idx
+            )
+            writer.write(out)
+            rows += len(out)
+            fragile += int(out["fragile"].sum())
+    print(f"{rows:,} rows, {fragile:,} fragile decisions (within {args.tolerance:.0%} of a boundary)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Catalog-level aggregates and charts of batch results.
+
+Works on result rows as written by ``nrp_batch`` (one row per ASIN x
+marketplace, ASIN metrics repeated). Everything is reduced here, on the
+server: histograms are binned counts, distributions are quantiles, scatter
+plots are a bounded sample drawn with WebGL (Scattergl), and the decision
+table is cut into pages. A chart sends at most a few thousand values to the
+browser whatever the catalog size. No Streamlit, so the aggregates can be
+reused from scripts.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import nrp_engine
+
+# Histogram bins and the share (%) clipped from each tail of a histogram range
+HIST_BINS = 60
+HIST_TAIL = 0.5
+
+QUANTILES = (1, 10, 50, 90, 99)
+
+# Points per scatter plot (uniform sample of ASINs)
+SCATTER_POINTS = 10_000
+
+DEFAULT_PAGE_SIZE = 100
+
+# Result columns read for the dashboard (po_status is optional)
+RESULT_COLUMNS = ["asin", "marketplace", "decision", "new_woc", "pass_cppu", "pass_woc_health", "pass_depletion",
+                  "woc_eu", "final_woc", "t_arrival", "cp_before", "cp_after", "cbf_units_before",
+                  "cbf_units_after", "po_status"]
+
+
+def load_results(path):
+    """Batch result rows from a CSV/Parquet output file (nrp_batch.result_frame() columns)."""
+    if os.path.splitext(path)[1].lower() in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+        names = pq.ParquetFile(path).schema_arrow.names
+        return pd.read_parquet(path, columns=[c for c in RESULT_COLUMNS if c in names])
+    return pd.read_csv(path, usecols=lambda c: c in RESULT_COLUMNS, keep_default_na=False, na_values=[""],
+                       dtype={"asin": str, "marketplace": str})
+
+
+def asin_metrics(rows):
+    """One row per ASIN: its metrics, CP improvement and MPs turned off.
+
+    Rows of one ASIN must be contiguous, as in batch output.
+    """
+    asin = rows["asin"].to_numpy()
+    first = np.flatnonzero(np.r_[True, asin[1:] != asin[:-1]])
+    group = np.cumsum(np.r_[True, asin[1:] != asin[:-1]]) - 1
+    columns = ["asin", "woc_eu", "final_woc", "t_arrival", "cp_before", "cp_after", "cbf_units_before",
+               "cbf_units_after"] + (["po_status"] if "po_status" in rows else [])
+    asins = rows[columns].iloc[first].reset_index(drop=True)
+    asins["cp_improvement"] = asins["cp_after"] - asins["cp_before"]
+    turned_off = (rows["decision"] == "TURN_OFF").to_numpy()
+    asins["n_turned_off"] = np.bincount(group, weights=turned_off, minlength=len(first)).astype(np.int64)
+    return asins
+
+
+def histogram(values, bins=HIST_BINS, tail=HIST_TAIL, value_range=None):
+    """Binned counts of the finite values. Returns (counts, edges, n_outside).
+
+    The range defaults to the [tail, 100 - tail] percentiles, so a few
+    outliers do not squash the bins; n_outside counts the values left out.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if value_range is None:
+        value_range = tuple(np.percentile(values, [tail, 100 - tail])) if len(values) else (0.0, 1.0)
+    if value_range[0] == value_range[1]:
+        value_range = (value_range[0] - 0.5, value_range[1] + 0.5)
+    counts, edges = np.histogram(values, bins=bins, range=value_range)
+    return counts, edges, int(len(values) - counts.sum())
+
+
+def quantile_table(asins):
+    """Quantiles of the ASIN metrics (WoC beyond the NEVER horizon excluded)."""
+    metrics = {
+        "CP Improvement ($)": asins["cp_improvement"].to_numpy(),
+        "CP Before ($)": asins["cp_before"].to_numpy(),
+        "CP After ($)": asins["cp_after"].to_numpy(),
+        "WoC Before (weeks)": asins["woc_eu"].to_numpy(),
+        "WoC After (weeks)": asins["final_woc"].to_numpy(),
+    }
+    table = {}
+    for label, values in metrics.items():
+        values = values[np.isfinite(values) & (values < nrp_engine.NEVER)]
+        table[label] = np.percentile(values, QUANTILES) if len(values) else np.full(len(QUANTILES), np.nan)
+    return pd.DataFrame(table, index=[f"P{q}" for q in QUANTILES]).T
+
+
+def decision_counts(rows):
+    """Marketplace x decision counts."""
+    counts = pd.crosstab(rows["marketplace"], rows["decision"])
+    return counts.reindex(columns=[d for d in nrp_engine.DECISIONS if d in counts.columns])
+
+
+def turn_off_by_po_status(rows):
+    """PO status x marketplace counts of TURN_OFF decisions (None without a po_status column)."""
+    if "po_status" not in rows:
+        return None
+    off = rows[rows["decision"] == "TURN_OFF"]
+    counts = pd.crosstab(off["po_status"], off["marketplace"])
+    return counts.reindex([s for s in nrp_engine.PO_STATUSES if s in counts.index])
+
+
+def filter_rows(rows, marketplaces=None, decisions=None, asin_prefix=""):
+    """Positions of the result rows matching the table filters."""
+    mask = np.ones(len(rows), dtype=bool)
+    if marketplaces:
+        mask &= rows["marketplace"].isin(marketplaces).to_numpy()
+    if decisions:
+        mask &= rows["decision"].isin(decisions).to_numpy()
+    if asin_prefix:
+        mask &= rows["asin"].astype(str).str.startswith(asin_prefix).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def sort_positions(rows, positions, sort_by=None, ascending=True):
+    """positions ordered by a column (stable, NaN last)."""
+    if not sort_by:
+        return positions
+    values = rows[sort_by].to_numpy()[positions]
+    order = np.argsort(values if ascending else _descending(values), kind="stable")
+    return positions[order]
+
+
+def _descending(values):
+    # Sort key for descending order that keeps NaN last
+    if values.dtype.kind in "biuf":
+        return -values.astype(np.float64)
+    return pd.Series(values).rank(method="dense", ascending=False, na_option="bottom").to_numpy()
+
+
+def page(rows, positions, number, page_size=DEFAULT_PAGE_SIZE):
+    """Rows of one page (0-based) of the ordered positions."""
+    return rows.iloc[positions[number * page_size:(number + 1) * page_size]]
+
+
+def _bar_figure(counts, edges, title, xaxis_title, name=None, color="#667eea"):
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), name=name, marker_color=color
+    ))
+    fig.update_layout(title=title, xaxis_title=xaxis_title, yaxis_title="ASINs", bargap=0, height=400)
+    return fig
+
+
+def cp_improvement_figure(asins):
+    """Histogram of the CP improvement per ASIN."""
+    counts, edges, outside = histogram(asins["cp_improvement"])
+    title = "CP Improvement per ASIN" + (f" ({outside:,} outside the range shown)" if outside else "")
+    return _bar_figure(counts, edges, title, "CP Improvement ($)")
+
+
+def woc_figure(asins):
+    """WoC before vs after histograms over common bins (never-depleting ASINs left out)."""
+    import plotly.graph_objects as go
+    before = asins["woc_eu"].to_numpy()
+    after = asins["final_woc"].to_numpy()
+    finite = np.concatenate([before, after])
+    finite = finite[np.isfinite(finite) & (finite < nrp_engine.NEVER)]
+    value_range = tuple(np.percentile(finite, [HIST_TAIL, 100 - HIST_TAIL])) if len(finite) else None
+    fig = go.Figure()
+    for values, name, color in ((before, "Before NRP", "#667eea"), (after, "After NRP", "#28a745")):
+        counts, edges, _ = histogram(values[values < nrp_engine.NEVER], value_range=value_range)
+        fig.add_trace(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), name=name,
+                             marker_color=color, opacity=0.6))
+    fig.update_layout(title="Weeks of Coverage Distribution", xaxis_title="Weeks", yaxis_title="ASINs",
+                      barmode="overlay", bargap=0, height=400)
+    return fig
+
+
+def cp_scatter_figure(asins, points=SCATTER_POINTS, seed=0):
+    """CP before vs after of a uniform ASIN sample, drawn with WebGL."""
+    import plotly.graph_objects as go
+    sample = asins
+    if len(asins) > points:
+        sample = asins.iloc[np.sort(np.random.default_rng(seed).choice(len(asins), points, replace=False))]
+    fig = go.Figure(go.Scattergl(
+        x=sample["cp_before"], y=sample["cp_after"], mode="markers", text=sample["asin"],
+        marker=dict(size=4, color=sample["n_turned_off"], colorscale="Viridis", showscale=True,
+                    colorbar=dict(title="MPs off")),
+    ))
+    limit = float(max(sample["cp_before"].max(), sample["cp_after"].max())) if len(sample) else 1.0
+    fig.add_shape(type="line", x0=0, y0=0, x1=limit, y1=limit, line=dict(dash="dash", color="gray"))
+    shown = f"{len(sample):,} of {len(asins):,} ASINs" if len(sample) < len(asins) else f"{len(asins):,} ASINs"
+    fig.update_layout(title=f"CP Before vs After ({shown})", xaxis_title="CP Before ($)",
+                      yaxis_title="CP After ($)", height=400)
+    return fig
+
+
+def counts_figure(counts, title, xaxis_title):
+    """Stacked bars of a crosstab (index on the x axis, one trace per column)."""
+    import plotly.graph_objects as go
+    colors = {"-": "#adb5bd", "KEEP_ACTIVE": "#ffc107", "TURN_OFF": "#28a745"}
+    fig = go.Figure([
+        go.Bar(x=counts.index.astype(str), y=counts[column], name=str(column), marker_color=colors.get(column))
+        for column in counts.columns
+    ])
+    fig.update_layout(title=title, xaxis_title=xaxis_title, yaxis_title="Count", barmode="stack", height=400)
+    return fig
@@ -0,0 +1,156 @@
+"""Checkpoints of batch runs, so an interrupted run resumes where it stopped.
+
+A checkpoint is a directory holding one result part file per input chunk
+and a ``checkpoint.json`` manifest. A part is written to a temporary name,
+synced and renamed into place, then the manifest listing it (with the
+chunk's statistics) is replaced the same way, so a run killed at any point
+leaves only whole, committed chunks behind. A restart with the same
+checkpoint directory re-reads the catalog but skips evaluating and writing
+the chunks already listed; compaction merges the parts into the output in
+chunk order and removes the directory.
+
+Chunks are those of ``nrp_batch.asin_chunks``, which depend on the input
+file and chunk_rows only, so the manifest records both (and the model
+parameters) and a checkpoint of a different run is refused.
+
+    python nrp_batch.py catalog.csv results.csv --checkpoint results.ckpt
+"""
+import json
+import os
+import shutil
+
+import nrp_batch
+
+MANIFEST = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+
+
+def _fsync(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def _replace(tmp, path):
+    # Rename into place, then sync the directory so the rename itself survives a power loss
+    os.replace(tmp, path)
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _temporary(path):
+    # Same extension, so the writers still pick the format from it
+    root, ext = os.path.splitext(path)
+    return f"{root}.tmp{ext}"
+
+
+def write_part(df, path):
+    """Write a result part file atomically (complete or absent after a crash)."""
+    tmp = _temporary(path)
+    with nrp_batch.ResultWriter(tmp) as writer:
+        writer.write(df)
+    _fsync(tmp)
+    _replace(tmp, path)
+
+
+def run_key(input_path, oor_cost, max_woc, marketplaces, mode, chunk_rows, vendors=None):
+    """What a checkpoint must match to be resumed: the input file and the run settings.
+
+    vendors: optional nrp_vendors.VendorTable, recorded by its fingerprint.
+    """
+    info = os.stat(input_path)
+    key = {
+        "input": os.path.abspath(input_path), "size": info.st_size, "mtime_ns": info.st_mtime_ns,
+        "oor_cost": oor_cost, "max_woc": max_woc, "marketplaces": list(marketplaces), "mode": mode,
+        "chunk_rows": chunk_rows,
+    }
+    if vendors is not None:
+        key["vendors"] = vendors.fingerprint()
+    return key
+
+
+class Checkpoint:
+    """Committed chunks of one batch run.
+
+    done maps chunk number -> {"rows", "asins", "turned_off"} of the chunks
+    whose part file is complete.
+    """
+
+    def __init__(self, directory, key, suffix):
+        self.directory = directory
+        self.key = key
+        self.suffix = suffix
+        self.done = {}
+
+    @classmethod
+    def open(cls, directory, key, output_path):
+        """Resume the checkpoint in directory, or start one.
+
+        Raises ValueError if the directory holds a checkpoint of another
+        input file, settings or output format.
+        """
+        suffix = os.path.splitext(output_path)[1]
+        checkpoint = cls(directory, key, suffix)
+        manifest_path = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("version") != CHECKPOINT_VERSION:
+                raise ValueError(f"Unsupported checkpoint version {manifest.get('version')!r} in {directory}")
+            if manifest["key"] != key or manifest["suffix"] != suffix:
+                changed = sorted(k for k in key.keys() | manifest["key"].keys()
+                                 if manifest["key"].get(k) != key.get(k))
+                if manifest["suffix"] != suffix:
+                    changed.append("output format")
+                raise ValueError(
+                    f"Checkpoint {directory} belongs to another run ({', '.join(changed)} differ); "
+                    "delete it or use another directory"
+                )
+            checkpoint.done = {int(chunk): stats for chunk, stats in manifest["done"].items()}
+        else:
+            os.makedirs(directory, exist_ok=True)
+            checkpoint._save()
+        return checkpoint
+
+    def part_path(self, chunk):
+        return os.path.join(self.directory, f"part-{chunk:06d}{self.suffix}")
+
+    def commit(self, chunk, rows, asins, turned_off):
+        """Record a chunk whose part file has been written."""
+        self.done[chunk] = {"rows": rows, "asins": asins, "turned_off": turned_off}
+        self._save()
+
+    def _save(self):
+        manifest = {"version": CHECKPOINT_VERSION, "key": self.key, "suffix": self.suffix,
+                    "done": {str(chunk): stats for chunk, stats in sorted(self.done.items())}}
+        path = os.path.join(self.directory, MANIFEST)
+        tmp = _temporary(path)
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        _replace(tmp, path)
+
+    def compact(self, output_path, chunks, keep=False):
+        """Merge the parts of chunks 0..chunks-1 into output_path and remove the checkpoint.
+
+        The output is written to a temporary name and renamed, so it is only
+        ever complete; with no chunks it is an empty result. keep=True
+        leaves the checkpoint directory in place.
+        """
+        missing = [chunk for chunk in range(chunks) if chunk not in self.done]
+        if missing:
+            raise ValueError(f"Cannot compact {self.directory}: chunks {missing[:5]} are not committed")
+        if chunks:
+            import nrp_parallel
+            tmp = _temporary(output_path)
+            nrp_parallel.concat_parts([self.part_path(chunk) for chunk in range(chunks)], tmp)
+            _fsync(tmp)
+            _replace(tmp, output_path)
+        else:
+            # Empty input: a header-only result, like nrp_batch.run()
+            write_part(nrp_batch.empty_result(), output_path)
+        if not keep:
+            shutil.rmtree(self.directory, ignore_errors=True)
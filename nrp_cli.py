@@ -0,0 +1,144 @@
+"""Fast headless NRP decisions from the command line.
+
+Loads NumPy and the engine only (no Streamlit, Plotly or pandas), so short
+cron invocations are not dominated by start-up. One ASIN from the command
+line, or JSON lines in the ``POST /decide`` request format of
+``nrp_service`` (one response line per request line):
+
+    python nrp_cli.py --po-status "Incoming PO" --lead-time 14 --po-arrival 8 \\
+        --mp DE=120,30,3.0 --mp FR=80,25,2.8 --mp ES=0,15,2.0
+    python nrp_cli.py --input requests.jsonl > decisions.jsonl
+    python nrp_cli.py --startup-report --max-startup-ms 250 < requests.jsonl
+
+Import time is measured from the first import of this module;
+``python -X importtime nrp_cli.py ...`` breaks it down per module.
+"""
+import time
+
+# The imports below are the CLI's start-up cost
+_import_start = time.perf_counter()
+
+import argparse
+import json
+import sys
+
+import nrp_engine
+import nrp_service
+
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
+# Start-up budget (import time, ms) checked by --max-startup-ms by default
+STARTUP_TARGET_MS = 250.0
+
+# Modules that must not be loaded by a headless decision run
+HEAVY_MODULES = ("streamlit", "plotly", "pandas", "pyarrow", "sklearn", "numba")
+
+# Request lines evaluated per engine call
+DEFAULT_BATCH_LINES = 10_000
+
+
+def parse_mp(value):
+    """--mp CODE=stock,forecast,cppu -> (code, {stock, forecast, cppu})."""
+    code, _, numbers = value.partition("=")
+    try:
+        stock, forecast, cppu = (float(v) for v in numbers.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected CODE=stock,forecast,cppu, got {value!r}")
+    return code.strip().upper(), {"stock": stock, "forecast": forecast, "cppu": cppu}
+
+
+def loaded_heavy_modules():
+    """HEAVY_MODULES currently imported in this process."""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def decide_lines(lines, oor_cost, max_woc, mode="greedy", batch_lines=DEFAULT_BATCH_LINES):
+    """Yield one JSON response line per request line, batch_lines per engine call.
+
+    Invalid lines get an {"error": ...} line in their place. Blank lines are
+    skipped.
+    """
+    marketplaces = list(nrp_engine.MARKETPLACES)
+    batch = []
+
+    def flush():
+        valid = [parsed for parsed in batch if not isinstance(parsed, str)]
+        responses = iter(nrp_service.evaluate_items(valid, mode) if valid else [])
+        for parsed in batch:
+            yield json.dumps({"error": parsed} if isinstance(parsed, str) else next(responses))
+        batch.clear()
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            batch.append(nrp_service.parse_item(json.loads(line), marketplaces, oor_cost, max_woc))
+        except ValueError as exc:  # includes json.JSONDecodeError
+            batch.append(str(exc))
+        if len(batch) >= batch_lines:
+            yield from flush()
+    yield from flush()
+
+
+def print_decision(response):
+    """Human-readable summary of one response."""
+    print(f"WoC {response['woc_eu']:.2f} -> {response['final_woc']:.2f} weeks, "
+          f"CP ${response['cp_before']:.2f} -> ${response['cp_after']:.2f}")
+    for mp, decision in response["decisions"].items():
+        print(f"  {mp}: {decision}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NRP decisions without the app (NumPy only).")
+    parser.add_argument("--mp", type=parse_mp, action="append", default=[], metavar="CODE=STOCK,FORECAST,CPPU",
+                        help="One marketplace of a single ASIN (repeat per MP); omit to read JSON lines")
+    parser.add_argument("--po-status", default=nrp_engine.PO_STATUSES[0],
+                        help="PO status label or code (single ASIN)")
+    parser.add_argument("--lead-time", type=float, default=14, help="Vendor lead time, days (single ASIN)")
+    parser.add_argument("--po-arrival", type=float, default=8, help="PO arrival, weeks (single ASIN)")
+    parser.add_argument("--json", action="store_true", help="Print the single-ASIN response as JSON")
+    parser.add_argument("--input", default="-", help="JSON lines request file (default: stdin)")
+    parser.add_argument("--batch-lines", type=int, default=DEFAULT_BATCH_LINES, help="Request lines per engine call")
+    parser.add_argument("--oor-cost", type=float, default=1.50, help="OOR cost per unit ($)")
+    parser.add_argument("--max-woc", type=float, default=7, help="Max healthy WoC (weeks)")
+    parser.add_argument("--mode", choices=nrp_engine.MODES, default="greedy", help="Turn-off search")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="Print import time and any heavy modules loaded to stderr")
+    parser.add_argument("--max-startup-ms", type=float, nargs="?", const=STARTUP_TARGET_MS,
+                        help=f"Exit with status 2 if import time exceeds this (default {STARTUP_TARGET_MS:g} ms)")
+    args = parser.parse_args(argv)
+
+    startup_ms = IMPORT_SECONDS * 1000
+    if args.startup_report:
+        heavy = loaded_heavy_modules()
+        print(f"import time {startup_ms:.1f} ms; heavy modules loaded: {', '.join(heavy) or 'none'}",
+              file=sys.stderr)
+    if args.max_startup_ms is not None and startup_ms > args.max_startup_ms:
+        print(f"Start-up {startup_ms:.1f} ms exceeds the {args.max_startup_ms:g} ms target", file=sys.stderr)
+        sys.exit(2)
+
+    errors = 0
+    if args.mp:
+        po_status = int(args.po_status) if args.po_status.isdigit() else args.po_status
+        request = {
+            "po_status": po_status, "lead_time": args.lead_time, "po_arrival": args.po_arrival,
+            "marketplaces": dict(args.mp),
+        }
+        response = json.loads(next(decide_lines([json.dumps(request)], args.oor_cost, args.max_woc, args.mode)))
+        errors = "error" in response
+        if args.json or errors:
+            print(json.dumps(response))
+        else:
+            print_decision(response)
+    else:
+        lines = sys.stdin if args.input == "-" else open(args.input)
+        with lines:
+            for line in decide_lines(lines, args.oor_cost, args.max_woc, args.mode, args.batch_lines):
+                errors += line.startswith('{"error"')
+                print(line)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Catalog dashboard for batch results.
+
+    streamlit run nrp_dashboard.py
+
+Loads a batch output file (nrp_batch.py) or a run of a history database
+(nrp_history.py) and shows catalog-level views. Aggregation happens on the
+server (see nrp_catalog); the decision table is paginated.
+"""
+import os
+
+import streamlit as st
+
+import nrp_catalog
+import nrp_engine
+
+# Cached loads and aggregates, keyed on the path and its modification time
+# (shared by all sessions; loaded results are not copied per rerun)
+CACHE_ENTRIES = 8
+HISTORY_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+PAGE_SIZES = (50, 100, 250, 500)
+# Rows of the matching-rows download (the CSV is built in server memory)
+DOWNLOAD_MAX_ROWS = 1_000_000
+TABLE_SORT_COLUMNS = ["asin", "marketplace", "decision", "new_woc", "woc_eu", "final_woc", "cp_before", "cp_after"]
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner="Loading results...")
+def load(path, mtime, run_id=None):
+    """Result rows and per-ASIN metrics of a results file or history run (read only)."""
+    if run_id is None:
+        rows = nrp_catalog.load_results(path)
+    else:
+        import nrp_history
+        with nrp_history.ResultHistory(path) as history:
+            rows = history.run_results(run_id)
+    return rows, nrp_catalog.asin_metrics(rows)
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def aggregates(path, mtime, run_id=None):
+    """Server-side aggregates and figures of one result set."""
+    rows, asins = load(path, mtime, run_id)
+    po_counts = nrp_catalog.turn_off_by_po_status(rows)
+    return {
+        "quantiles": nrp_catalog.quantile_table(asins),
+        "cp_improvement": nrp_catalog.cp_improvement_figure(asins),
+        "woc": nrp_catalog.woc_figure(asins),
+        "scatter": nrp_catalog.cp_scatter_figure(asins),
+        "by_mp": nrp_catalog.counts_figure(
+            nrp_catalog.decision_counts(rows), "Decisions by Marketplace", "Marketplace"
+        ),
+        "by_po_status": None if po_counts is None else nrp_catalog.counts_figure(
+            po_counts, "Turned-off MPs by PO Status", "PO Status"
+        ),
+    }
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def table_positions(path, mtime, run_id, marketplaces, decisions, asin_prefix, sort_by, ascending):
+    """Ordered row positions of the filtered decision table."""
+    rows, _ = load(path, mtime, run_id)
+    positions = nrp_catalog.filter_rows(rows, marketplaces, decisions, asin_prefix)
+    return nrp_catalog.sort_positions(rows, positions, sort_by, ascending)
+
+
+st.set_page_config(page_title="NRP Catalog Dashboard", page_icon="📦", layout="wide")
+st.title("📦 NRP Catalog Dashboard")
+
+with st.sidebar:
+    st.header("📂 Results")
+    path = st.text_input("Results file or history database", placeholder="results.parquet / history.db",
+                         help="nrp_batch.py output (CSV/Parquet) or an nrp_history.py database")
+    run_id = None
+    if path and os.path.exists(path) and path.lower().endswith(HISTORY_SUFFIXES):
+        import nrp_history
+        with nrp_history.ResultHistory(path) as history:
+            runs = history.runs()
+        if runs.empty:
+            st.warning("The history database has no runs.")
+            st.stop()
+        run_id = st.selectbox(
+            "Run", runs["run_id"].tolist()[::-1],
+            format_func=lambda r: f"{runs.set_index('run_id').at[r, 'run_date']} (run {r})"
+        )
+
+if not path:
+    st.info("👈 Enter the path of a batch result file or history database in the **sidebar**.")
+    st.stop()
+if not os.path.exists(path):
+    st.error(f"No such file: {path}")
+    st.stop()
+
+mtime = os.path.getmtime(path)
+rows, asins = load(path, mtime, run_id)
+views = aggregates(path, mtime, run_id)
+
+# ==================== CATALOG SUMMARY ====================
+turned_off = int(asins["n_turned_off"].sum())
+col1, col2, col3, col4, col5 = st.columns(5)
+col1.metric("ASINs", f"{len(asins):,}")
+col2.metric("ASIN x MP Rows", f"{len(rows):,}")
+col3.metric("MPs Turned Off", f"{turned_off:,}")
+col4.metric("ASINs With a Turn-off", f"{int((asins['n_turned_off'] > 0).sum()):,}")
+col5.metric("Total CP Improvement", f"${asins['cp_improvement'].sum():,.0f}")
+
+st.markdown("---")
+st.subheader("📈 Distributions")
+col1, col2 = st.columns(2)
+with col1:
+    st.plotly_chart(views["cp_improvement"], use_container_width=True)
+with col2:
+    st.plotly_chart(views["woc"], use_container_width=True)
+
+col1, col2 = st.columns(2)
+with col1:
+    st.plotly_chart(views["by_mp"], use_container_width=True)
+with col2:
+    if views["by_po_status"] is not None:
+        st.plotly_chart(views["by_po_status"], use_container_width=True)
+    else:
+        st.info("These results have no po_status column; re-run nrp_batch.py for turn-offs by PO status.")
+
+col1, col2 = st.columns(2)
+with col1:
+    st.plotly_chart(views["scatter"], use_container_width=True)
+with col2:
+    st.markdown("**Quantiles**")
+    st.dataframe(views["quantiles"].style.format("{:,.2f}"), use_container_width=True)
+
+# ==================== DECISION TABLE ====================
+st.markdown("---")
+st.subheader("📋 Decisions")
+# Known marketplaces in nrp_engine order, then any other codes of the file
+mp_order = {mp: i for i, mp in enumerate(nrp_engine.MARKETPLACES)}
+marketplaces = sorted(rows["marketplace"].unique().tolist(), key=lambda mp: (mp_order.get(mp, len(mp_order)), mp))
+col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 1])
+with col1:
+    mp_filter = st.multiselect("Marketplaces", marketplaces)
+with col2:
+    decision_filter = st.multiselect("Decisions", nrp_engine.DECISIONS, default=["TURN_OFF"])
+with col3:
+    asin_prefix = st.text_input("ASIN starts with")
+with col4:
+    sort_by = st.selectbox("Sort by", ["(file order)"] + TABLE_SORT_COLUMNS)
+with col5:
+    ascending = st.toggle("Ascending", value=False)
+
+positions = table_positions(
+    path, mtime, run_id, tuple(mp_filter), tuple(decision_filter), asin_prefix.strip(),
+    None if sort_by == "(file order)" else sort_by, ascending
+)
+col1, col2 = st.columns([1, 4])
+with col1:
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1)
+pages = max(1, -(-len(positions) // page_size))
+with col2:
+    page_number = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1)
+st.caption(f"{len(positions):,} matching rows")
+st.dataframe(nrp_catalog.page(rows, positions, page_number - 1, page_size), use_container_width=True,
+             hide_index=True)
+st.download_button(
+    "Download matching rows (CSV)" if len(positions) <= DOWNLOAD_MAX_ROWS
+    else f"Download first {DOWNLOAD_MAX_ROWS:,} matching rows (CSV)",
+    data=lambda: rows.iloc[positions[:DOWNLOAD_MAX_ROWS]].to_csv(index=False),
+    file_name="nrp_decisions.csv", mime="text/csv",
+    disabled=len(positions) == 0,
+)
+if len(positions) > DOWNLOAD_MAX_ROWS:
+    st.caption("Narrow the filters to download every matching row, or use the results file itself.")
@@ -0,0 +1,678 @@
+"""Headless NRP decision engine.
+
+Vectorized version of the calculation in ``nrp_app.py``. Per-marketplace
+inputs are arrays shaped (n_asins, n_marketplaces), per-ASIN inputs are 1-D
+arrays (or scalars, broadcast to every ASIN). Nothing here imports Streamlit,
+so the engine can be used from batch jobs.
+"""
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from nrp_timing import stage
+
+# PO status options (the code is the index into this list)
+PO_STATUSES = ["No PO (CR > 25%)", "No PO (CR < 25%)", "Incoming PO", "EoL Product"]
+PO_NO_PO_HIGH_CR = 0
+PO_NO_PO_LOW_CR = 1
+PO_INCOMING = 2
+PO_EOL = 3
+
+# Confirmation rate (%) above which a vendor without an open PO is expected
+# to confirm the next one within one lead time (two otherwise)
+CR_THRESHOLD = 25.0
+
+# Decision codes (the code is the index into DECISIONS)
+DECISIONS = ["-", "KEEP_ACTIVE", "TURN_OFF"]
+NOT_EVALUATED = 0  # MP has stock, it is not part of the optimization
+KEEP_ACTIVE = 1
+TURN_OFF = 2
+
+# Known marketplaces (code -> name). The MP axis of every array follows the
+# list of codes the caller works with, so adding a MP needs no new code.
+MARKETPLACES = {
+    "DE": "Germany",
+    "FR": "France",
+    "ES": "Spain",
+    "IT": "Italy",
+    "UK": "United Kingdom",
+    "NL": "Netherlands",
+    "PL": "Poland",
+    "SE": "Sweden",
+    "BE": "Belgium",
+}
+
+# Per-MP inputs of one ASIN; an (n_asins, n_marketplaces) array of these
+# records holds a whole batch
+MARKETPLACE_DTYPE = np.dtype([
+    ("stock", np.float64),
+    ("forecast", np.float64),
+    ("cppu", np.float64),
+])
+
+# Sentinel for "never" (EoL arrival, WoC with no remaining forecast)
+NEVER = 999
+
+# Turn-off search modes
+MODES = ("greedy", "optimal")
+
+# Largest number of candidate MPs per ASIN enumerated by the optimal search
+# after pruning (2**n subsets each); rows are processed in blocks of at most
+# SEARCH_BLOCK subsets
+MAX_SEARCH_MPS = 20
+SEARCH_BLOCK = 1 << 20
+
+# Implementations of the greedy pass and CP/CBF totals: "jit" needs Numba
+# (see nrp_jit), "auto" uses it when installed for at least JIT_MIN_ASINS
+# ASINs. The NRP_KERNEL environment variable sets the default.
+KERNELS = ("auto", "numpy", "jit")
+JIT_MIN_ASINS = 10_000
+
+
+@dataclass
+class NRPResult:
+    """Engine output. Per-ASIN fields are (n,), per-MP fields are (n, m)."""
+    # EU totals and global thresholds
+    s_eu: np.ndarray
+    f_eu: np.ndarray
+    woc_eu: np.ndarray
+    t_arrival: np.ndarray
+    cppu_avg: np.ndarray
+    # Per-MP optimization results
+    order: np.ndarray  # MP indices in evaluation order (zero-stock MPs first)
+    n_zero: np.ndarray  # number of zero-stock MPs, i.e. evaluated entries of order
+    decision: np.ndarray
+    cppu_effective: np.ndarray
+    new_woc: np.ndarray  # NaN where not evaluated
+    pass_cppu: np.ndarray
+    pass_woc_health: np.ndarray
+    pass_depletion: np.ndarray
+    # Final state
+    f_remaining: np.ndarray
+    final_woc: np.ndarray
+    cp_before: np.ndarray
+    cp_after: np.ndarray
+    cbf_units_before: np.ndarray
+    cbf_units_after: np.ndarray
+
+    def __len__(self):
+        return len(self.s_eu)
+
+
+def _per_asin(value, n, dtype=np.float64):
+    return np.broadcast_to(np.asarray(value, dtype=dtype), (n,))
+
+
+def t_arrival_weeks(po_status, lead_time, po_arrival):
+    """Weeks until new stock arrives, per ASIN (NEVER for EoL products)."""
+    po_status = np.asarray(po_status)
+    lead_time = np.asarray(lead_time, dtype=np.float64)
+    po_arrival = np.asarray(po_arrival, dtype=np.float64)
+    return np.select(
+        [po_status == PO_EOL, po_status == PO_INCOMING, po_status == PO_NO_PO_LOW_CR],
+        [np.float64(NEVER), po_arrival, (2 * lead_time) / 7],
+        default=lead_time / 7,
+    )
+
+
+def po_status_from_cr(confirmation_rate, po_open=False, eol=False):
+    """PO status codes from the vendor confirmation rate (%), per ASIN.
+
+    EoL products and ASINs with an open PO keep those statuses; otherwise a
+    confirmation rate above CR_THRESHOLD gives "No PO (CR > 25%)".
+    """
+    confirmation_rate = np.asarray(confirmation_rate, dtype=np.float64)
+    return np.select(
+        [np.asarray(eol, dtype=bool), np.asarray(po_open, dtype=bool), confirmation_rate > CR_THRESHOLD],
+        [PO_EOL, PO_INCOMING, PO_NO_PO_HIGH_CR],
+        default=PO_NO_PO_LOW_CR,
+    ).astype(np.int8)
+
+
+def cppu_average(stock, forecast, cppu):
+    """Forecast-weighted CPPU of the MPs that have stock (0 if none)."""
+    has_stock = stock > 0
+    cppu_sum = np.where(has_stock, cppu * forecast, 0.0).sum(axis=1)
+    forecast_sum = np.where(has_stock, forecast, 0.0).sum(axis=1)
+    return _safe_divide(cppu_sum, forecast_sum, 0)
+
+
+def _safe_divide(num, den, fallback):
+    # num / den where den > 0, fallback elsewhere
+    out = np.full(np.broadcast(num, den).shape, fallback, dtype=np.float64)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+def woc_checks(s_eu, f_remaining, max_woc, t_arrival):
+    """WoC with the given active forecast and the two WoC checks.
+
+    Returns (woc, pass_woc_health, pass_depletion).
+    """
+    woc = _safe_divide(s_eu, f_remaining, NEVER)
+    return (woc,) + check_woc(woc, max_woc, t_arrival)
+
+
+def check_woc(woc, max_woc, t_arrival):
+    """(pass_woc_health, pass_depletion) for a given WoC."""
+    health = woc <= max_woc
+    depletion = (t_arrival >= NEVER) | (woc < t_arrival)
+    return health, depletion
+
+
+def _searchsorted_rows(a, v):
+    # np.searchsorted(a[i], v[i]) for every row of a sorted 2-D array (side="left")
+    return (a < v[:, None]).sum(axis=1)
+
+
+def horizon_woc(s_eu, weekly, fallback=NEVER):
+    """WoC of stock s_eu (n,) against time-phased weekly forecasts (n, H).
+
+    Stock depletes week by week along the cumulative forecast (evenly within
+    a week); past the horizon the last week's forecast continues. Equals
+    s_eu / forecast for a flat forecast. fallback is returned where there is
+    no forecast at all, NEVER where the stock outlasts a zero tail.
+    """
+    weekly = np.asarray(weekly, dtype=np.float64)
+    s_eu = np.asarray(s_eu, dtype=np.float64)
+    h = weekly.shape[1]
+    cum = np.cumsum(weekly, axis=1)
+    rows = np.arange(len(weekly))
+    # Depletion week (0-based); the last week extends past the horizon
+    k = np.minimum(_searchsorted_rows(cum, s_eu), h - 1)
+    depleted_before = np.where(k > 0, cum[rows, k - 1], 0.0)
+    rate = weekly[rows, k]
+    woc = k + _safe_divide(s_eu - depleted_before, rate, 0)
+    woc[(rate <= 0) & (s_eu > depleted_before)] = NEVER
+    woc[cum[:, -1] <= 0] = fallback
+    return woc
+
+
+def cumulative_forecast(weekly, weeks):
+    """Forecast demand from week 0 to (fractional) week `weeks`.
+
+    weekly: (..., H) forecasts; weeks: broadcastable to weekly.shape[:-1].
+    Demand is spread evenly within a week and the last week's forecast
+    continues past the horizon, as in horizon_woc().
+    """
+    weekly = np.asarray(weekly, dtype=np.float64)
+    weeks = np.asarray(weeks, dtype=np.float64)
+    shape = np.broadcast_shapes(weekly.shape[:-1], weeks.shape)
+    h = weekly.shape[-1]
+    weekly = np.broadcast_to(weekly, shape + (h,))
+    weeks = np.broadcast_to(weeks, shape)
+    cum = np.cumsum(weekly, axis=-1)
+    k = np.clip(np.floor(weeks), 0, h - 1).astype(np.intp)[..., None]
+    depleted_before = np.where(k > 0, np.take_along_axis(cum, np.maximum(k - 1, 0), -1), 0.0)[..., 0]
+    return depleted_before + (weeks - k[..., 0]) * np.take_along_axis(weekly, k, -1)[..., 0]
+
+
+def turn_off_order(forecast, zero_stock):
+    """MP indices in the order the optimizer evaluates them.
+
+    Zero-stock MPs come first, sorted by forecast ascending; ties go to the
+    MP listed last, as in the original DE/FR/ES/IT implementation.
+    """
+    n, m = forecast.shape
+    reverse_position = np.broadcast_to(-np.arange(m), (n, m))
+    return np.lexsort((reverse_position, forecast, ~zero_stock), axis=-1)
+
+
+def marketplace_inputs(n_asins, n_marketplaces):
+    """Zeroed (n_asins, n_marketplaces) array of MARKETPLACE_DTYPE records."""
+    return np.zeros((n_asins, n_marketplaces), dtype=MARKETPLACE_DTYPE)
+
+
+def evaluate_records(records, po_status, lead_time, po_arrival, oor_cost, max_woc, mode="greedy", horizon=None,
+                     timer=None, kernel=None):
+    """evaluate() on a MARKETPLACE_DTYPE array."""
+    return evaluate(
+        records["stock"], records["forecast"], records["cppu"],
+        po_status, lead_time, po_arrival, oor_cost, max_woc, mode, horizon, timer, kernel,
+    )
+
+
+def _use_jit(kernel, n):
+    # Whether evaluate() runs the Numba kernels for n ASINs
+    kernel = kernel or os.environ.get("NRP_KERNEL", "auto")
+    if kernel not in KERNELS:
+        raise ValueError(f"Unknown kernel {kernel!r}, expected one of {KERNELS}")
+    if kernel == "numpy" or (kernel == "auto" and n < JIT_MIN_ASINS):
+        return False
+    import nrp_jit
+    if kernel == "jit" and not nrp_jit.AVAILABLE:
+        raise ImportError("The jit kernel requires Numba (pip install numba)")
+    return nrp_jit.AVAILABLE
+
+
+def evaluate(stock, forecast, cppu, po_status, lead_time, po_arrival, oor_cost, max_woc, mode="greedy",
+             horizon=None, timer=None, kernel=None):
+    """Run the NRP decision logic for a batch of ASINs.
+
+    stock, forecast, cppu: (n_asins, n_marketplaces) arrays.
+    po_status (PO_* codes), lead_time (days), po_arrival (weeks), oor_cost and
+    max_woc: per-ASIN arrays or scalars.
+    mode: "greedy" (forecast-sorted sequential pass, as in the app) or
+    "optimal" (CP-maximizing turn-off set, see optimal_turn_off).
+    horizon: optional (n_asins, n_marketplaces, n_weeks) weekly forecasts.
+    WoC, the WoC checks and units sold (CP, CBF) then follow the cumulative
+    weekly forecast (see horizon_woc); `forecast` still sets the turn-off
+    order and the CPPU average. Greedy mode only.
+    timer: optional nrp_timing.StageTimer receiving the time of each stage.
+    kernel: one of KERNELS (default: NRP_KERNEL or "auto"); the Numba
+    kernels compute the CP before in the cp_after stage. Flat forecasts only.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+    if horizon is not None:
+        if mode != "greedy":
+            raise ValueError("Time-phased forecast horizons are only supported in greedy mode")
+        return _evaluate_horizon(
+            stock, forecast, cppu, po_status, lead_time, po_arrival, oor_cost, max_woc, horizon, timer
+        )
+    with stage(timer, "inputs"):
+        stock = np.asarray(stock, dtype=np.float64)
+        forecast = np.asarray(forecast, dtype=np.float64)
+        cppu = np.asarray(cppu, dtype=np.float64)
+        n, m = stock.shape
+        oor_cost = _per_asin(oor_cost, n)
+        max_woc = _per_asin(max_woc, n)
+        jit = _use_jit(kernel, n)
+        if jit:
+            import nrp_jit
+
+    # EU Totals
+    with stage(timer, "eu_totals"):
+        s_eu = stock.sum(axis=1)
+        f_eu = forecast.sum(axis=1)
+        woc_eu = _safe_divide(s_eu, f_eu, 0)
+        t_arrival = _per_asin(t_arrival_weeks(po_status, lead_time, po_arrival), n)
+
+    with stage(timer, "cppu_average"):
+        cppu_avg = cppu_average(stock, forecast, cppu)
+
+    # CP BEFORE optimization (OOR penalty on zero-stock MPs)
+    with stage(timer, "cp_before"):
+        zero_stock = stock == 0
+        if not jit:
+            cppu_before = np.where(zero_stock, cppu - oor_cost[:, None], cppu)
+            cp_before = (forecast * woc_eu[:, None] * cppu_before).sum(axis=1)
+
+    # Sequential optimization: one vectorized step per position in the order
+    # (or one compiled pass per ASIN with the Numba kernel)
+    with stage(timer, "sequential_optimization"):
+        cppu_effective = cppu - oor_cost[:, None]
+        pass_cppu = cppu_effective <= cppu_avg[:, None]
+        if jit:
+            order, n_zero, decision, new_woc, pass_woc_health, pass_depletion, f_remaining = (
+                nrp_jit.sequential_pass(stock, forecast, s_eu, f_eu, max_woc, t_arrival, pass_cppu)
+            )
+        else:
+            order = turn_off_order(forecast, zero_stock)
+            n_zero = zero_stock.sum(axis=1)
+            decision = np.zeros((n, m), dtype=np.uint8)
+            new_woc = np.full((n, m), np.nan)
+            pass_woc_health = np.zeros((n, m), dtype=bool)
+            pass_depletion = np.zeros((n, m), dtype=bool)
+            f_remaining = f_eu.copy()
+            rows = np.arange(n)
+
+            for k in range(m):
+                live = k < n_zero
+                if not live.any():
+                    break
+                r = rows[live]
+                mp = order[live, k]
+                remaining = f_remaining[r] - forecast[r, mp]
+                woc_new, health, depletion = woc_checks(s_eu[r], remaining, max_woc[r], t_arrival[r])
+                turn_off = pass_cppu[r, mp] & health & depletion
+
+                new_woc[r, mp] = woc_new
+                pass_woc_health[r, mp] = health
+                pass_depletion[r, mp] = depletion
+                decision[r, mp] = np.where(turn_off, TURN_OFF, KEEP_ACTIVE)
+                f_remaining[r[turn_off]] = remaining[turn_off]
+
+    if mode == "optimal":
+        with stage(timer, "optimal_search"):
+            turn_off = optimal_turn_off(
+                forecast, cppu, s_eu, f_eu, pass_cppu & zero_stock,
+                max_woc, t_arrival, incumbent=decision == TURN_OFF,
+            )
+            r = np.flatnonzero((turn_off != (decision == TURN_OFF)).any(axis=1))
+            if len(r):
+                # Re-run the checks against the final state of the new set; kept
+                # MPs report the WoC they would give if turned off on top of it
+                f_remaining[r] = f_eu[r] - np.where(turn_off[r], forecast[r], 0.0).sum(axis=1)
+                remaining = f_remaining[r, None] - np.where(turn_off[r], 0.0, forecast[r])
+                woc_new, health, depletion = woc_checks(
+                    s_eu[r, None], remaining, max_woc[r, None], t_arrival[r, None]
+                )
+                evaluated = zero_stock[r]
+                new_woc[r] = np.where(evaluated, woc_new, np.nan)
+                pass_woc_health[r] = health & evaluated
+                pass_depletion[r] = depletion & evaluated
+                decision[r] = np.where(evaluated, np.where(turn_off[r], TURN_OFF, KEEP_ACTIVE), NOT_EVALUATED)
+
+    # CP AFTER optimization: stock is shared among the MPs still active
+    with stage(timer, "cp_after"):
+        if jit:
+            final_woc, cp_before, cp_after, cbf_units_before, cbf_units_after = nrp_jit.cp_cbf(
+                stock, forecast, cppu, oor_cost, s_eu, woc_eu, f_remaining, decision
+            )
+        else:
+            active = decision != TURN_OFF
+            active_forecast = np.where(active, forecast, 0.0)
+            f_total_after = active_forecast.sum(axis=1)
+            share = _safe_divide(active_forecast, f_total_after[:, None], 0)
+            cp_after = (share * s_eu[:, None] * cppu).sum(axis=1)
+
+            final_woc = _safe_divide(s_eu, f_remaining, NEVER)
+
+            # CBF units: zero-stock MPs are served cross-border while active
+            cbf_units_before = np.where(zero_stock, forecast * woc_eu[:, None], 0.0).sum(axis=1)
+            cbf_units_after = np.where(zero_stock & active, forecast * final_woc[:, None], 0.0).sum(axis=1)
+
+    return NRPResult(
+        s_eu=s_eu,
+        f_eu=f_eu,
+        woc_eu=woc_eu,
+        t_arrival=t_arrival.copy(),
+        cppu_avg=cppu_avg,
+        order=order,
+        n_zero=n_zero,
+        decision=decision,
+        cppu_effective=cppu_effective,
+        new_woc=new_woc,
+        pass_cppu=pass_cppu & zero_stock,
+        pass_woc_health=pass_woc_health,
+        pass_depletion=pass_depletion,
+        f_remaining=f_remaining,
+        final_woc=final_woc,
+        cp_before=cp_before,
+        cp_after=cp_after,
+        cbf_units_before=cbf_units_before,
+        cbf_units_after=cbf_units_after,
+    )
+
+
+def _active_weekly(horizon, active):
+    # EU weekly forecast (n, H) of the active MPs
+    return np.einsum("imh,im->ih", horizon, active.astype(np.float64))
+
+
+def _evaluate_horizon(stock, forecast, cppu, po_status, lead_time, po_arrival, oor_cost, max_woc, horizon,
+                      timer=None):
+    # Greedy pass of evaluate() with WoC taken from weekly forecast horizons
+    with stage(timer, "inputs"):
+        stock = np.asarray(stock, dtype=np.float64)
+        forecast = np.asarray(forecast, dtype=np.float64)
+        cppu = np.asarray(cppu, dtype=np.float64)
+        horizon = np.asarray(horizon, dtype=np.float64)
+        n, m = stock.shape
+        if horizon.shape[:2] != (n, m):
+            raise ValueError(f"Forecast horizon shape {horizon.shape} does not match inputs {(n, m)}")
+        oor_cost = _per_asin(oor_cost, n)
+        max_woc = _per_asin(max_woc, n)
+
+    with stage(timer, "eu_totals"):
+        s_eu = stock.sum(axis=1)
+        f_eu = forecast.sum(axis=1)
+        woc_eu = horizon_woc(s_eu, _active_weekly(horizon, np.ones((n, m), dtype=bool)), 0)
+        t_arrival = _per_asin(t_arrival_weeks(po_status, lead_time, po_arrival), n)
+
+    with stage(timer, "cppu_average"):
+        cppu_avg = cppu_average(stock, forecast, cppu)
+
+    with stage(timer, "cp_before"):
+        zero_stock = stock == 0
+        units_before = cumulative_forecast(horizon, woc_eu[:, None])
+        cp_before = (units_before * np.where(zero_stock, cppu - oor_cost[:, None], cppu)).sum(axis=1)
+
+    with stage(timer, "sequential_optimization"):
+        cppu_effective = cppu - oor_cost[:, None]
+        pass_cppu = cppu_effective <= cppu_avg[:, None]
+        order = turn_off_order(forecast, zero_stock)
+        n_zero = zero_stock.sum(axis=1)
+
+        decision = np.zeros((n, m), dtype=np.uint8)
+        new_woc = np.full((n, m), np.nan)
+        pass_woc_health = np.zeros((n, m), dtype=bool)
+        pass_depletion = np.zeros((n, m), dtype=bool)
+        f_remaining = f_eu.copy()
+        active = np.ones((n, m), dtype=bool)
+        rows = np.arange(n)
+
+        for k in range(m):
+            live = k < n_zero
+            if not live.any():
+                break
+            r = rows[live]
+            mp = order[live, k]
+            candidate = active[r]
+            candidate[np.arange(len(r)), mp] = False
+            # Summed rather than subtracted, so removed MPs leave no rounding residue
+            remaining = _active_weekly(horizon[r], candidate)
+            woc_new = horizon_woc(s_eu[r], remaining)
+            health, depletion = check_woc(woc_new, max_woc[r], t_arrival[r])
+            turn_off = pass_cppu[r, mp] & health & depletion
+
+            new_woc[r, mp] = woc_new
+            pass_woc_health[r, mp] = health
+            pass_depletion[r, mp] = depletion
+            decision[r, mp] = np.where(turn_off, TURN_OFF, KEEP_ACTIVE)
+            active[r[turn_off], mp[turn_off]] = False
+            f_remaining[r[turn_off]] -= forecast[r[turn_off], mp[turn_off]]
+
+    with stage(timer, "cp_after"):
+        final_woc = horizon_woc(s_eu, _active_weekly(horizon, active))
+        units_after = np.where(active, cumulative_forecast(horizon, final_woc[:, None]), 0.0)
+        cp_after = (units_after * cppu).sum(axis=1)
+
+    return NRPResult(
+        s_eu=s_eu,
+        f_eu=f_eu,
+        woc_eu=woc_eu,
+        t_arrival=t_arrival.copy(),
+        cppu_avg=cppu_avg,
+        order=order,
+        n_zero=n_zero,
+        decision=decision,
+        cppu_effective=cppu_effective,
+        new_woc=new_woc,
+        pass_cppu=pass_cppu & zero_stock,
+        pass_woc_health=pass_woc_health,
+        pass_depletion=pass_depletion,
+        f_remaining=f_remaining,
+        final_woc=final_woc,
+        cp_before=cp_before,
+        cp_after=cp_after,
+        cbf_units_before=np.where(zero_stock, units_before, 0.0).sum(axis=1),
+        cbf_units_after=np.where(zero_stock, units_after, 0.0).sum(axis=1),
+    )
+
+
+def marketplace_breakdown(stock, forecast, cppu, result, oor_cost, horizon=None):
+    """Per-MP units sold and CP, before and after optimization.
+
+    horizon: the weekly forecasts the result was evaluated with, if any.
+    Returns (units_before, cp_before, units_after, cp_after), each (n, m).
+    """
+    stock = np.asarray(stock, dtype=np.float64)
+    forecast = np.asarray(forecast, dtype=np.float64)
+    cppu = np.asarray(cppu, dtype=np.float64)
+    oor_cost = _per_asin(oor_cost, len(result))[:, None]
+    active = result.decision != TURN_OFF
+
+    if horizon is None:
+        s_eu = result.s_eu[:, None]
+        units_before = _safe_divide(forecast, result.f_eu[:, None], 0) * s_eu
+        active_forecast = np.where(active, forecast, 0.0)
+        f_total_after = active_forecast.sum(axis=1, keepdims=True)
+        units_after = _safe_divide(active_forecast, f_total_after, 0) * s_eu
+    else:
+        units_before = cumulative_forecast(horizon, result.woc_eu[:, None])
+        units_after = np.where(active, cumulative_forecast(horizon, result.final_woc[:, None]), 0.0)
+
+    cp_before = units_before * np.where(stock == 0, cppu - oor_cost, cppu)
+    cp_after = units_after * cppu
+    return units_before, cp_before, units_after, cp_after
+
+
+def _cp_after_removal(s_eu, f_eu, total_fc, removed_f, removed_fc):
+    # CP after turning off MPs with total forecast removed_f and sum(forecast * cppu) removed_fc
+    return s_eu * _safe_divide(total_fc - removed_fc, f_eu - removed_f, 0)
+
+
+def optimal_turn_off(forecast, cppu, s_eu, f_eu, candidates, max_woc, t_arrival, incumbent):
+    """Turn-off set maximizing cp_after under the WoC health and depletion checks.
+
+    candidates: (n, m) mask of MPs allowed off (zero stock, CPPU check passed).
+    incumbent: a feasible (n, m) turn-off set, e.g. the greedy decisions; it is
+    kept unless a set with strictly higher CP exists. Returns an (n, m) mask.
+
+    Both WoC checks only get harder as more forecast is turned off, so a set is
+    feasible when its final WoC passes, and an MP failing on its own can be
+    dropped. A fractional relaxation (lowest CPPU off first, up to the
+    removable forecast) bounds the best CP per ASIN: ASINs whose incumbent or
+    best CPPU prefix reaches the bound are done, MPs with CPPU above the
+    bounding average are never worth turning off, and only the remaining
+    candidates are enumerated exhaustively.
+    """
+    n, m = forecast.shape
+    max_woc = _per_asin(max_woc, n)
+    t_arrival = _per_asin(t_arrival, n)
+    total_fc = (forecast * cppu).sum(axis=1)
+    best = incumbent.copy()
+
+    def cp_of(removed_f, removed_fc, r):
+        return _cp_after_removal(s_eu[r], f_eu[r], total_fc[r], removed_f, removed_fc)
+
+    def feasible(removed_f, r):
+        _, health, depletion = woc_checks(s_eu[r], f_eu[r] - removed_f, max_woc[r], t_arrival[r])
+        return health & depletion
+
+    def tolerance(cp):
+        return 1e-9 * np.maximum(1.0, np.abs(cp))
+
+    best_cp = cp_of(
+        np.where(incumbent, forecast, 0.0).sum(axis=1),
+        np.where(incumbent, forecast * cppu, 0.0).sum(axis=1),
+        slice(None),
+    )
+    # Turning nothing off is always allowed
+    empty_cp = cp_of(0.0, 0.0, slice(None))
+    empty = empty_cp > best_cp + tolerance(best_cp)
+    best[empty] = False
+    best_cp[empty] = empty_cp[empty]
+
+    # Candidates that matter: positive forecast and feasible on their own
+    candidates = candidates & (forecast > 0) & feasible(forecast, (slice(None), None))
+    r = np.flatnonzero(candidates.any(axis=1) & (s_eu > 0))
+    if len(r) == 0:
+        return best
+
+    # Removable forecast: active forecast must stay above S/max_woc and S/T
+    s = s_eu[r]
+    min_active = np.maximum(
+        _safe_divide(s, max_woc[r], 0),
+        np.where(t_arrival[r] >= NEVER, 0.0, _safe_divide(s, t_arrival[r], 0)),
+    )
+    capacity = (f_eu[r] - min_active) * (1 + 1e-9)
+
+    # Candidates sorted by CPPU ascending, the relaxation removes them in this order
+    cand = candidates[r]
+    by_cppu = np.argsort(np.where(cand, cppu[r], np.inf), axis=1, kind="stable")
+    f_sorted = np.take_along_axis(np.where(cand, forecast[r], 0.0), by_cppu, axis=1)
+    c_sorted = np.take_along_axis(np.where(cand, cppu[r], 0.0), by_cppu, axis=1)
+    fc_sorted = f_sorted * c_sorted
+    cum_f = np.cumsum(f_sorted, axis=1)
+    cum_fc = np.cumsum(fc_sorted, axis=1)
+
+    # Integral prefixes that pass the checks, and the fractional bound
+    prefix_cp = cp_of(cum_f, cum_fc, r[:, None])
+    prefix_ok = (f_sorted > 0) & feasible(cum_f, r[:, None])
+    prefix_cp = np.where(prefix_ok, prefix_cp, -np.inf)
+    best_prefix = prefix_cp.argmax(axis=1)
+    best_prefix_cp = prefix_cp[np.arange(len(r)), best_prefix]
+
+    within = (cum_f <= capacity[:, None]) & (f_sorted > 0)
+    k = within.sum(axis=1)  # first item that does not fully fit
+    rows = np.arange(len(r))
+    prev_f = np.where(k > 0, cum_f[rows, k - 1], 0.0)
+    prev_fc = np.where(k > 0, cum_fc[rows, k - 1], 0.0)
+    next_f = np.where(k < m, f_sorted[rows, np.minimum(k, m - 1)], 0.0)
+    next_c = np.where(k < m, c_sorted[rows, np.minimum(k, m - 1)], 0.0)
+    partial = np.clip(capacity - prev_f, 0.0, next_f)
+    bound = np.maximum.reduce([
+        best_cp[r],
+        np.where(within, cp_of(cum_f, cum_fc, r[:, None]), -np.inf).max(axis=1),
+        cp_of(prev_f + partial, prev_fc + partial * next_c, r),
+    ])
+
+    # A feasible prefix reaching the bound is optimal
+    take_prefix = (best_prefix_cp > best_cp[r] + tolerance(best_cp[r])) & (
+        best_prefix_cp >= bound - tolerance(bound)
+    )
+    for i in np.flatnonzero(take_prefix):
+        best[r[i]] = False
+        best[r[i], by_cppu[i, :best_prefix[i] + 1]] = True
+    best_cp[r[take_prefix]] = best_prefix_cp[take_prefix]
+
+    # Search whatever the incumbent does not already bound
+    open_rows = (bound > best_cp[r] + tolerance(best_cp[r])) & ~take_prefix
+    if not open_rows.any():
+        return best
+    r = r[open_rows]
+    bound_avg = _safe_divide(bound[open_rows], s_eu[r], 0)
+    cand = candidates[r] & (cppu[r] < bound_avg[:, None])
+    n_cand = cand.sum(axis=1)
+    if n_cand.max() > MAX_SEARCH_MPS:
+        raise ValueError(f"Optimal search supports up to {MAX_SEARCH_MPS} candidate MPs per ASIN")
+
+    for size in np.unique(n_cand):
+        if size == 0:
+            continue
+        group = np.flatnonzero(n_cand == size)
+        block = max(1, SEARCH_BLOCK >> int(size))
+        for start in range(0, len(group), block):
+            g = group[start:start + block]
+            rg = r[g]
+            # Candidate MP indices first, in MP order
+            idx = np.argsort(~cand[g], axis=1, kind="stable")[:, :size]
+            f = np.take_along_axis(forecast[rg], idx, axis=1)
+            fc = f * np.take_along_axis(cppu[rg], idx, axis=1)
+            removed_f = np.zeros((len(g), 1))
+            removed_fc = np.zeros((len(g), 1))
+            for j in range(size):
+                removed_f = np.concatenate([removed_f, removed_f + f[:, j:j + 1]], axis=1)
+                removed_fc = np.concatenate([removed_fc, removed_fc + fc[:, j:j + 1]], axis=1)
+            subset_cp = cp_of(removed_f, removed_fc, rg[:, None])
+            subset_cp = np.where(feasible(removed_f, rg[:, None]), subset_cp, -np.inf)
+            subset = subset_cp.argmax(axis=1)
+            top = subset_cp[np.arange(len(g)), subset]
+            better = top > best_cp[rg] + tolerance(best_cp[rg])
+            if not better.any():
+                continue
+            bits = (subset[better, None] >> np.arange(size)) & 1
+            chosen = np.zeros((better.sum(), m), dtype=bool)
+            np.put_along_axis(chosen, idx[better], bits.astype(bool), axis=1)
+            best[rg[better]] = chosen
+            best_cp[rg[better]] = top[better]
+    return best
+
+
+def compare_modes(greedy, optimal):
+    """Summary of how often the optimal turn-off set differs from the greedy one."""
+    differs = (greedy.decision != optimal.decision).any(axis=1)
+    gain = optimal.cp_after - greedy.cp_after
+    n = len(greedy)
+    return {
+        "asins": n,
+        "disagree": int(differs.sum()),
+        "disagree_pct": float(differs.mean() * 100) if n else 0.0,
+        "cp_gain_total": float(gain.sum()),
+        "cp_gain_mean_when_disagree": float(gain[differs].mean()) if differs.any() else 0.0,
+        "cp_gain_max": float(gain.max()) if n else 0.0,
+    }
@@ -0,0 +1,255 @@
+"""Result charts and tables of the calculator.
+
+Plotly figures and pandas DataFrames built from an engine result, without
+Streamlit, so the app's render path can be reused and benchmarked. Every
+function renders one ASIN (row) of a result. Plotly is imported on the first
+chart, so table-only callers do not load it.
+"""
+import numpy as np
+import pandas as pd
+
+import nrp_engine
+from nrp_timing import stage
+
+
+def result_figures(mp_inputs, result, breakdown, marketplaces, max_woc, horizon=None, row=0, timer=None):
+    """The four result charts: WoC, CP by MP, depletion timeline, decision matrix.
+
+    breakdown: nrp_engine.marketplace_breakdown() output; horizon: the weekly
+    forecasts the result was evaluated with, if any; timer: optional
+    nrp_timing.StageTimer receiving the build time of each chart.
+    """
+    import plotly.graph_objects as go
+
+    _, cp_by_mp_before, _, cp_by_mp_after = breakdown
+    all_mps = list(marketplaces)
+
+    S_EU = result.s_eu[row]
+    WoC_EU = result.woc_eu[row]
+    T_arrival_weeks = result.t_arrival[row]
+    final_woc = result.final_woc[row]
+    decisions = [
+        {
+            "MP": all_mps[i],
+            "Pass CPPU": result.pass_cppu[row, i],
+            "Pass WoC Health": result.pass_woc_health[row, i],
+            "Pass Depletion": result.pass_depletion[row, i],
+        }
+        for i in result.order[row, :result.n_zero[row]]
+    ]
+
+    # WoC Comparison Chart
+    with stage(timer, "figure_woc"):
+        fig_woc = go.Figure()
+        fig_woc.add_trace(go.Bar(
+            x=["Before NRP", "After NRP"],
+            y=[WoC_EU, final_woc],
+            text=[f"{WoC_EU:.2f}w", f"{final_woc:.2f}w"],
+            textposition='auto',
+            marker_color=['#667eea', '#28a745']
+        ))
+
+        fig_woc.add_hline(y=max_woc, line_dash="dash", line_color="red",
+                      annotation_text=f"Max Healthy WoC ({max_woc})")
+
+        if T_arrival_weeks < 999:
+            fig_woc.add_hline(y=T_arrival_weeks, line_dash="dash", line_color="orange",
+                          annotation_text=f"PO Arrival ({T_arrival_weeks:.1f}w)")
+
+        fig_woc.update_layout(
+            title="Weeks of Coverage Comparison",
+            yaxis_title="Weeks",
+            showlegend=False,
+            height=400
+        )
+
+    # CP Breakdown by Marketplace
+    with stage(timer, "figure_cp"):
+        mp_labels = all_mps
+        cp_breakdown_before = cp_by_mp_before[row]
+        cp_breakdown_after = cp_by_mp_after[row]
+
+        fig_cp = go.Figure()
+        fig_cp.add_trace(go.Bar(
+            name='Before NRP',
+            x=mp_labels,
+            y=cp_breakdown_before,
+            marker_color='#667eea'
+        ))
+        fig_cp.add_trace(go.Bar(
+            name='After NRP',
+            x=mp_labels,
+            y=cp_breakdown_after,
+            marker_color='#28a745'
+        ))
+
+        fig_cp.update_layout(
+            title="Contribution Profit by Marketplace",
+            yaxis_title="CP ($)",
+            barmode='group',
+            height=400
+        )
+
+    # Stock Depletion Timeline
+    with stage(timer, "figure_timeline"):
+        weeks = np.arange(0, int(max(final_woc, WoC_EU, T_arrival_weeks if T_arrival_weeks < 999 else 10)) + 2)
+        weekly = (horizon if horizon is not None else mp_inputs["forecast"][..., None])[row]
+        weekly_active = np.where((result.decision[row] != nrp_engine.TURN_OFF)[:, None], weekly, 0.0)
+        stock_before = np.maximum(0, S_EU - nrp_engine.cumulative_forecast(weekly.sum(axis=0), weeks))
+        stock_after = np.maximum(0, S_EU - nrp_engine.cumulative_forecast(weekly_active.sum(axis=0), weeks))
+
+        fig_timeline = go.Figure()
+        fig_timeline.add_trace(go.Scatter(
+            x=weeks,
+            y=stock_before,
+            mode='lines+markers',
+            name='Before NRP',
+            line=dict(color='#667eea', width=3)
+        ))
+        fig_timeline.add_trace(go.Scatter(
+            x=weeks,
+            y=stock_after,
+            mode='lines+markers',
+            name='After NRP',
+            line=dict(color='#28a745', width=3)
+        ))
+
+        if T_arrival_weeks < 999:
+            fig_timeline.add_vline(x=T_arrival_weeks, line_dash="dash", line_color="orange",
+                               annotation_text="PO Arrival")
+
+        fig_timeline.update_layout(
+            title="Stock Depletion Timeline",
+            xaxis_title="Weeks",
+            yaxis_title="Remaining Stock (units)",
+            height=400
+        )
+
+    # Decision Matrix Heatmap
+    with stage(timer, "figure_heatmap"):
+        decision_matrix = []
+        for d in decisions:
+            decision_matrix.append({
+                "MP": d["MP"],
+                "CPPU Check": 1 if d["Pass CPPU"] else 0,
+                "WoC Health": 1 if d["Pass WoC Health"] else 0,
+                "Depletion Timing": 1 if d["Pass Depletion"] else 0,
+            })
+
+        df_matrix = pd.DataFrame(decision_matrix)
+
+        fig_heatmap = go.Figure(data=go.Heatmap(
+            z=df_matrix[["CPPU Check", "WoC Health", "Depletion Timing"]].values.T,
+            x=df_matrix["MP"],
+            y=["CPPU Check", "WoC Health", "Depletion Timing"],
+            colorscale=[[0, '#dc3545'], [1, '#28a745']],
+            text=[["✗" if val == 0 else "✓" for val in row] for row in df_matrix[["CPPU Check", "WoC Health", "Depletion Timing"]].values.T],
+            texttemplate="%{text}",
+            textfont={"size": 20, "color": "white"},
+            showscale=False
+        ))
+
+        fig_heatmap.update_layout(
+            title="Decision Matrix: Check Results",
+            height=400
+        )
+
+    return {"woc": fig_woc, "cp": fig_cp, "timeline": fig_timeline, "heatmap": fig_heatmap}
+
+
+def comparison_table(result, marketplaces, oor_cost, row=0):
+    """Before vs after comparison table."""
+    all_mps = list(marketplaces)
+    turned_off = [mp for mp, d in zip(all_mps, result.decision[row]) if d == nrp_engine.TURN_OFF]
+    kept_active = [mp for mp in all_mps if mp not in turned_off]
+
+    S_EU = result.s_eu[row]
+    F_EU = result.f_eu[row]
+    WoC_EU = result.woc_eu[row]
+    F_EU_remaining = result.f_remaining[row]
+    final_woc = result.final_woc[row]
+    cp_before = result.cp_before[row]
+    cp_after = result.cp_after[row]
+
+    # CBF units BEFORE: All units sold to zero-stock MPs require cross-border shipment
+    # CBF units AFTER: Only active zero-stock MPs need CBF (turned-off MPs = 0 CBF)
+    cbf_units_before = result.cbf_units_before[row]
+    cbf_units_after = result.cbf_units_after[row]
+
+    cbf_savings = (cbf_units_before - cbf_units_after) * oor_cost
+    cp_improvement = cp_after - cp_before
+    cp_improvement_pct = (cp_improvement / cp_before * 100) if cp_before > 0 else 0
+
+    comparison_data = {
+        "Metric": [
+            "Total Stock (units)",
+            "Active Forecast (units/week)",
+            "Weeks of Coverage",
+            "Active Marketplaces",
+            "Cross-Border Units",
+            "OOR Shipping Cost",
+            "Total Contribution Profit",
+            "CP Improvement"
+        ],
+        "Before NRP": [
+            f"{S_EU:.0f}",
+            f"{F_EU:.1f}",
+            f"{WoC_EU:.2f}",
+            ", ".join(all_mps),
+            f"{cbf_units_before:.0f}",  # ← FIX 2: Integer display
+            f"${cbf_units_before * oor_cost:.2f}",
+            f"${cp_before:.2f}",
+            "-"
+        ],
+        "After NRP": [
+            f"{S_EU:.0f}",
+            f"{F_EU_remaining:.1f}",
+            f"{final_woc:.2f}",
+            ", ".join(kept_active),  # ← FIX 1: Now correct
+            f"{cbf_units_after:.0f}",  # ← FIX 2: Integer display
+            f"${cbf_units_after * oor_cost:.2f}",
+            f"${cp_after:.2f}",
+            f"+${cp_improvement:.2f} ({cp_improvement_pct:+.1f}%)"
+        ],
+        "Change": [
+            "0",
+            f"{F_EU_remaining - F_EU:.1f}",
+            f"{final_woc - WoC_EU:+.2f}",
+            f"{len(turned_off)} turned off",
+            f"{int(cbf_units_after - cbf_units_before)}",  # ← FIX 2: Integer
+            f"-${cbf_savings:.2f}",
+            f"+${cp_improvement:.2f}",
+            f"{cp_improvement_pct:+.1f}%"
+        ]
+    }
+
+    return pd.DataFrame(comparison_data)
+
+
+def detailed_table(mp_inputs, result, breakdown, marketplaces, row=0):
+    """Per-marketplace calculation metrics table."""
+    units_before, cp_by_mp_before, units_after, cp_by_mp_after = breakdown
+    stock = mp_inputs["stock"]
+    forecast = mp_inputs["forecast"]
+    cppu = mp_inputs["cppu"]
+
+    detailed_metrics = []
+    for i, mp_name in enumerate(marketplaces):
+        is_turned_off = result.decision[row, i] == nrp_engine.TURN_OFF
+        cp_before_mp = cp_by_mp_before[row, i]
+        cp_after_mp = cp_by_mp_after[row, i]
+
+        detailed_metrics.append({
+            "Marketplace": f"{mp_name}",
+            "Stock": f"{stock[row, i]:g}",
+            "Forecast": f"{forecast[row, i]:g}",
+            "CPPU": f"${cppu[row, i]:.2f}",
+            "Status": "❌ Turned Off" if is_turned_off else "✅ Active",
+            "Units Sold (Before)": f"{int(units_before[row, i])}",  # ← FIX 2: Integer
+            "Units Sold (After)": f"{int(units_after[row, i])}",   # ← FIX 2: Integer
+            "CP Before": f"${cp_before_mp:.2f}",
+            "CP After": f"${cp_after_mp:.2f}",
+            "CP Change": f"+${cp_after_mp - cp_before_mp:.2f}"
+        })
+
+    return pd.DataFrame(detailed_metrics)
@@ -0,0 +1,314 @@
+"""Run history of batch results, indexed by ASIN.
+
+Every batch run's per ASIN x marketplace results (decision, check flags,
+new WoC, CP before/after, CBF units) are kept in one SQLite database:
+
+- results are clustered by (asin, marketplace, run), so the history of one
+  ASIN is a single index range read, independent of the number of runs;
+- each row also holds the decision of the same ASIN x MP in the previous
+  run, and a partial index covers only the rows where it changed, so the
+  decisions that flipped since the previous run are read without scanning
+  the run (diffs between any two runs join on the primary key instead).
+
+Runs are keyed by run date (one run per date and source; adding a run for
+an existing date replaces it). Adding, replacing or deleting a run relinks
+the run that follows it by date, so backfilled runs keep the chain intact.
+
+    python nrp_batch.py catalog.csv results.csv --history history.db
+    python nrp_history.py history.db add results.csv --run-date 2026-10-16
+    python nrp_history.py history.db asin B000123456
+    python nrp_history.py history.db flips
+    python nrp_history.py history.db runs
+"""
+import argparse
+import datetime
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import nrp_engine
+import nrp_store
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    run_date TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    previous_run_id INTEGER,
+    created_at TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (run_date, source)
+);
+CREATE TABLE IF NOT EXISTS results (
+    asin TEXT NOT NULL,
+    marketplace TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    decision INTEGER NOT NULL,
+    previous INTEGER,
+    checks INTEGER NOT NULL,
+    new_woc REAL,
+    woc_eu REAL,
+    final_woc REAL,
+    t_arrival REAL,
+    cp_before REAL,
+    cp_after REAL,
+    cbf_units_before REAL,
+    cbf_units_after REAL,
+    PRIMARY KEY (asin, marketplace, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+CREATE INDEX IF NOT EXISTS results_flips ON results (run_id, asin, marketplace)
+    WHERE previous IS NOT NULL AND previous != decision;
+"""
+
+# Result values stored per row, after asin, marketplace and run_id
+VALUE_COLUMNS = ["decision", "checks", "new_woc", "woc_eu", "final_woc", "t_arrival", "cp_before", "cp_after",
+                 "cbf_units_before", "cbf_units_after"]
+
+# Rows per insert statement batch
+INSERT_ROWS = 100_000
+
+
+def _decision_labels(codes):
+    return np.asarray(nrp_engine.DECISIONS, dtype=object)[np.asarray(codes, dtype=np.int64)]
+
+
+def _frame(rows, columns):
+    df = pd.DataFrame(rows, columns=columns)
+    for column in ("decision", "previous"):
+        if column in df:
+            known = df[column].notna()
+            df[column] = df[column].astype(object)
+            df.loc[known, column] = _decision_labels(df.loc[known, column].to_numpy(dtype=np.int64))
+    if "checks" in df:
+        checks = df.pop("checks").to_numpy(dtype=np.uint8)
+        for name, values in zip(("pass_cppu", "pass_woc_health", "pass_depletion"), nrp_store.unpack_checks(checks)):
+            df[name] = values
+    return df
+
+
+class ResultHistory:
+    """SQLite store of batch results across runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_run(self, frames, run_date=None, source=""):
+        """Store a run from result frames (nrp_batch.result_frame() columns). Returns its run_id.
+
+        frames: iterable of DataFrames, e.g. the chunks of a batch output file.
+        run_date: ISO date (default today); the previous run is the latest one
+        of the same source with an earlier date.
+        """
+        run_date = run_date or datetime.date.today().isoformat()
+        with self.db:
+            old = self.db.execute(
+                "SELECT run_id FROM runs WHERE run_date = ? AND source = ?", (run_date, source)
+            ).fetchone()
+            if old is not None:
+                self._delete(old[0], relink=False)
+            previous = self.db.execute(
+                "SELECT run_id FROM runs WHERE source = ? AND run_date < ? ORDER BY run_date DESC LIMIT 1",
+                (source, run_date),
+            ).fetchone()
+            previous = previous[0] if previous else None
+            run_id = self.db.execute(
+                "INSERT INTO runs (run_date, source, previous_run_id, created_at) VALUES (?, ?, ?, ?)",
+                (run_date, source, previous, datetime.datetime.now().isoformat(timespec="seconds")),
+            ).lastrowid
+            self.db.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS staging (asin TEXT, marketplace TEXT, "
+                + ", ".join(VALUE_COLUMNS) + ")"
+            )
+            rows = 0
+            for df in frames:
+                for start in range(0, len(df), INSERT_ROWS):
+                    rows += self._insert(df.iloc[start:start + INSERT_ROWS], run_id, previous)
+            self.db.execute("UPDATE runs SET rows = ? WHERE run_id = ?", (rows, run_id))
+            self._relink(source, run_date)
+        return run_id
+
+    def _relink(self, source, run_date):
+        # The next run after run_date compares against the latest run before it
+        following = self.db.execute(
+            "SELECT run_id, run_date FROM runs WHERE source = ? AND run_date > ? ORDER BY run_date LIMIT 1",
+            (source, run_date),
+        ).fetchone()
+        if following is None:
+            return
+        run_id, following_date = following
+        previous = self.db.execute(
+            "SELECT run_id FROM runs WHERE source = ? AND run_date < ? ORDER BY run_date DESC LIMIT 1",
+            (source, following_date),
+        ).fetchone()
+        previous = previous[0] if previous else None
+        self.db.execute("UPDATE runs SET previous_run_id = ? WHERE run_id = ?", (previous, run_id))
+        self.db.execute(
+            "UPDATE results SET previous = (SELECT p.decision FROM results p WHERE p.asin = results.asin "
+            "AND p.marketplace = results.marketplace AND p.run_id = ?) WHERE run_id = ?",
+            (previous, run_id),
+        )
+
+    def _insert(self, df, run_id, previous):
+        # Staged, then copied with the previous run's decision looked up by primary key
+        df = df.sort_values(["asin", "marketplace"])
+        decision = pd.Categorical(df["decision"], categories=nrp_engine.DECISIONS).codes
+        checks = nrp_store.pack_checks(df["pass_cppu"], df["pass_woc_health"], df["pass_depletion"])
+        values = pd.DataFrame({"asin": df["asin"].astype(str).to_numpy(),
+                               "marketplace": df["marketplace"].astype(str).to_numpy(),
+                               "decision": decision.astype(np.int64), "checks": checks.astype(np.int64)})
+        for column in VALUE_COLUMNS[2:]:
+            values[column] = df[column].to_numpy(dtype=np.float64)
+        self.db.execute("DELETE FROM staging")
+        # NaN (e.g. new_woc of MPs with stock) is stored as NULL
+        self.db.executemany(
+            f"INSERT INTO staging VALUES ({', '.join('?' * (2 + len(VALUE_COLUMNS)))})",
+            zip(*(values[column].tolist() for column in values.columns)),
+        )
+        self.db.execute(
+            "INSERT INTO results (asin, marketplace, run_id, previous, " + ", ".join(VALUE_COLUMNS) + ") "
+            "SELECT s.asin, s.marketplace, ?, p.decision, " + ", ".join(f"s.{c}" for c in VALUE_COLUMNS)
+            + " FROM staging s LEFT JOIN results p"
+            " ON p.asin = s.asin AND p.marketplace = s.marketplace AND p.run_id = ?",
+            (run_id, previous),
+        )
+        return len(values)
+
+    def add_file(self, path, run_date=None, source="", chunk_rows=1_000_000):
+        """add_run() from a batch output file (CSV/Parquet)."""
+        import nrp_batch
+        if nrp_batch._is_parquet(path):
+            import pyarrow.parquet as pq
+            frames = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows))
+        else:
+            frames = pd.read_csv(path, chunksize=chunk_rows, keep_default_na=False, na_values=[""],
+                                 dtype={"asin": str, "marketplace": str})
+        return self.add_run(frames, run_date, source)
+
+    def _delete(self, run_id, relink=True):
+        run = self.db.execute("SELECT source, run_date FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        self.db.execute("DELETE FROM results WHERE run_id = ?", (run_id,))
+        self.db.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+        if run is not None and relink:
+            self._relink(*run)
+
+    def delete_run(self, run_id):
+        with self.db:
+            self._delete(run_id)
+
+    def runs(self):
+        """All runs, oldest first."""
+        return pd.read_sql_query("SELECT * FROM runs ORDER BY run_date, run_id", self.db)
+
+    def latest_run(self, source=""):
+        row = self.db.execute(
+            "SELECT run_id FROM runs WHERE source = ? ORDER BY run_date DESC LIMIT 1", (source,)
+        ).fetchone()
+        if row is None:
+            raise LookupError(f"No runs for source {source!r} in {self.path}")
+        return row[0]
+
+    def run_results(self, run_id):
+        """All results of one run in nrp_batch.result_frame() layout, ordered by ASIN."""
+        cursor = self.db.execute(
+            "SELECT asin, marketplace, decision, checks, " + ", ".join(VALUE_COLUMNS[2:])
+            + " FROM results WHERE run_id = ? ORDER BY asin, marketplace",
+            (run_id,),
+        )
+        return _frame(cursor.fetchall(), [d[0] for d in cursor.description])
+
+    def asin_history(self, asin, marketplace=None):
+        """Results of one ASIN (optionally one MP) in every run, oldest first."""
+        query = ("SELECT r.run_date, x.marketplace, x.decision, x.previous, x.checks, "
+                 + ", ".join(f"x.{c}" for c in VALUE_COLUMNS[2:])
+                 + " FROM results x JOIN runs r USING (run_id) WHERE x.asin = ?")
+        params = [asin]
+        if marketplace is not None:
+            query += " AND x.marketplace = ?"
+            params.append(marketplace)
+        cursor = self.db.execute(query + " ORDER BY r.run_date, x.marketplace", params)
+        return _frame(cursor.fetchall(), [d[0] for d in cursor.description])
+
+    def flips(self, run_id=None, since_run_id=None):
+        """ASIN x MPs whose decision differs between two runs.
+
+        run_id: default the latest run; since_run_id: default its previous
+        run, answered from the flip index. Returns asin, marketplace,
+        previous and decision.
+        """
+        run_id = run_id if run_id is not None else self.latest_run()
+        previous = self.db.execute("SELECT previous_run_id FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if previous is None:
+            raise LookupError(f"Unknown run {run_id}")
+        if since_run_id is None or since_run_id == previous[0]:
+            cursor = self.db.execute(
+                "SELECT asin, marketplace, previous, decision FROM results "
+                "WHERE run_id = ? AND previous IS NOT NULL AND previous != decision ORDER BY asin, marketplace",
+                (run_id,),
+            )
+        else:
+            cursor = self.db.execute(
+                "SELECT x.asin, x.marketplace, p.decision AS previous, x.decision FROM results x "
+                "JOIN results p ON p.asin = x.asin AND p.marketplace = x.marketplace AND p.run_id = ? "
+                "WHERE x.run_id = ? AND p.decision != x.decision ORDER BY x.asin, x.marketplace",
+                (since_run_id, run_id),
+            )
+        return _frame(cursor.fetchall(), ["asin", "marketplace", "previous", "decision"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run history of NRP batch results.")
+    parser.add_argument("db", help="History SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add a batch output file as a run")
+    add.add_argument("results", help="nrp_batch.py output CSV/Parquet")
+    add.add_argument("--run-date", help="ISO date of the run (default today)")
+    add.add_argument("--source", default="", help="Run source, e.g. a catalog name")
+    asin = commands.add_parser("asin", help="History of one ASIN")
+    asin.add_argument("asin")
+    asin.add_argument("--marketplace")
+    flips = commands.add_parser("flips", help="Decisions that changed between two runs")
+    flips.add_argument("--run", type=int, help="Run id (default: latest)")
+    flips.add_argument("--since", type=int, help="Earlier run id (default: the run's previous run)")
+    flips.add_argument("--output", help="Write the flips to this CSV instead of printing them")
+    commands.add_parser("runs", help="List runs")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with ResultHistory(args.db) as history:
+        if args.command == "add":
+            run_id = history.add_file(args.results, args.run_date, args.source)
+            rows = history.db.execute("SELECT rows FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+            print(f"Run {run_id}: {rows:,} rows added in {time.perf_counter() - start:.1f}s")
+        elif args.command == "asin":
+            df = history.asin_history(args.asin, args.marketplace)
+            print(df.to_string(index=False) if len(df) else f"No results for {args.asin}")
+            print(f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+        elif args.command == "flips":
+            df = history.flips(args.run, args.since)
+            if args.output:
+                df.to_csv(args.output, index=False)
+            else:
+                print(df.to_string(index=False))
+            print(f"{len(df):,} flipped decisions ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        else:
+            print(history.runs().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
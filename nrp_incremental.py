@@ -0,0 +1,260 @@
+"""Incremental NRP re-evaluation on stock and forecast change events.
+
+Keeps the inputs and the full engine result of a catalog in memory. A batch
+of delta events (stock receipt, sale, forecast update, PO created) is applied
+to the inputs, and only the ASINs it touches are re-evaluated: O(MPs) per
+affected ASIN instead of a full batch run. The per-ASIN state (S_EU, F_EU,
+CPPU_avg, the sorted zero-stock order, decisions, ...) is the stored
+NRPResult, updated row by row. Only decisions that changed are emitted.
+With a vendor table (nrp_vendors), a reload of the vendor file likewise
+re-evaluates only the ASINs of the vendors that changed.
+
+    python nrp_incremental.py catalog.csv events.csv changes.csv
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import nrp_batch
+import nrp_engine
+
+# Event types: value is units (receipt, sale), the new weekly forecast
+# (forecast) or the PO arrival in weeks (po, which sets the status to
+# Incoming PO; its marketplace is ignored)
+EVENT_TYPES = ("receipt", "sale", "forecast", "po")
+RECEIPT, SALE, FORECAST, PO_CREATED = range(len(EVENT_TYPES))
+
+EVENT_COLUMNS = ["asin", "marketplace", "event", "value"]
+
+DEFAULT_BATCH_EVENTS = 10_000
+
+# Catalog PO statuses an ASIN keeps over its vendor's (see nrp_vendors)
+OWN_PO_STATUSES = (nrp_engine.PO_EOL, nrp_engine.PO_INCOMING)
+
+
+def apply_stock_events(stock, rows, mps, delta):
+    """Add stock deltas to an (n_asins, n_marketplaces) array in order, flooring at zero after each.
+
+    Equivalent to applying the events one at a time, whatever the batch:
+    the final stock of an MP with running delta sums P_1..P_n is
+    P_n + max(stock, -min(P_j)), computed with one grouped cumulative sum.
+    """
+    if not len(delta):
+        return
+    cell = rows * stock.shape[1] + mps
+    order = np.argsort(cell, kind="stable")
+    cell = cell[order]
+    delta = delta[order]
+    starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    ends = np.r_[starts[1:], len(cell)] - 1
+    running = np.cumsum(delta)
+    running -= np.repeat(running[starts] - delta[starts], ends - starts + 1)
+    r, m = np.divmod(cell[starts], stock.shape[1])
+    stock[r, m] = running[ends] + np.maximum(stock[r, m], -np.minimum.reduceat(running, starts))
+
+
+class IncrementalEvaluator:
+    """Catalog state that is kept up to date by delta events."""
+
+    def __init__(self, asins, marketplaces, records, po_status, lead_time, po_arrival, oor_cost, max_woc,
+                 mode="greedy", vendor_ids=None, own_po=None):
+        """vendor_ids: optional vendor ID per ASIN, for refresh_vendors();
+        own_po marks the ASINs whose PO status is their own (EoL or an
+        Incoming PO of the catalog) rather than their vendor's.
+        """
+        n = len(asins)
+        self.asins = pd.Index(asins)
+        self.marketplaces = list(marketplaces)
+        self.records = records
+        self.po_status = np.array(np.broadcast_to(po_status, (n,)), dtype=np.int8)
+        self.lead_time = np.array(np.broadcast_to(lead_time, (n,)), dtype=np.float64)
+        self.po_arrival = np.array(np.broadcast_to(po_arrival, (n,)), dtype=np.float64)
+        self.oor_cost = np.array(np.broadcast_to(oor_cost, (n,)), dtype=np.float64)
+        self.max_woc = np.array(np.broadcast_to(max_woc, (n,)), dtype=np.float64)
+        self.mode = mode
+        self.vendor_codes = self.vendor_ids = None
+        if vendor_ids is not None:
+            self.vendor_codes, vendor_ids = pd.factorize(np.asarray(vendor_ids))
+            self.vendor_ids = pd.Index(vendor_ids)
+        self.own_po = np.zeros(n, dtype=bool) if own_po is None else np.array(own_po, dtype=bool)
+        self.result = self._evaluate(slice(None))
+        self.events = 0
+
+    @classmethod
+    def from_catalog(cls, path, oor_cost, max_woc, marketplaces=None, mode="greedy",
+                     chunk_rows=nrp_batch.DEFAULT_CHUNK_ROWS, vendors=None):
+        """Load and evaluate a whole catalog file (see nrp_batch.INPUT_COLUMNS).
+
+        vendors: optional nrp_vendors.VendorTable joined on the catalog's
+        vendor ID column (see nrp_batch.pivot_chunk).
+        """
+        marketplaces = list(marketplaces or nrp_engine.MARKETPLACES)
+        parts = [[], [nrp_engine.marketplace_inputs(0, len(marketplaces))], [], [], [], [], []]
+        for df in nrp_batch.asin_chunks(nrp_batch.read_chunks(path, chunk_rows)):
+            for part, arrays in zip(parts[:5], nrp_batch.pivot_chunk(df, marketplaces, vendors)):
+                part.append(np.asarray(arrays))
+            if vendors is not None:
+                per_asin = df.drop_duplicates("asin")
+                parts[5].append(per_asin[nrp_batch.VENDOR_ID].to_numpy(dtype=str))
+                own = np.zeros(len(per_asin), dtype=bool)
+                if "po_status" in per_asin:
+                    own = np.isin(nrp_batch.po_status_codes(per_asin["po_status"]), OWN_PO_STATUSES)
+                parts[6].append(own)
+        asins, records, po_status, lead_time, po_arrival = (np.concatenate(part) for part in parts[:5])
+        vendor_ids, own_po = (np.concatenate(part) for part in parts[5:]) if vendors is not None else (None, None)
+        return cls(asins, marketplaces, records, po_status, lead_time, po_arrival, oor_cost, max_woc, mode,
+                   vendor_ids, own_po)
+
+    def __len__(self):
+        return len(self.asins)
+
+    def _evaluate(self, rows):
+        return nrp_engine.evaluate_records(
+            self.records[rows], self.po_status[rows], self.lead_time[rows], self.po_arrival[rows],
+            self.oor_cost[rows], self.max_woc[rows], self.mode,
+        )
+
+    def apply(self, asin, marketplace, event, value):
+        """Apply a batch of events (equal-length arrays) and re-evaluate the ASINs touched.
+
+        event: EVENT_TYPES labels or codes. Receipts and sales are applied in
+        order with stock floored at zero after each one, so the result does
+        not depend on the batching; for forecast and PO events the last one
+        of the batch wins. Returns the changed
+        decisions as a DataFrame (one row per ASIN x MP whose decision changed).
+        """
+        rows = self.asins.get_indexer(asin)
+        if (rows < 0).any():
+            raise ValueError(f"Unknown ASIN {np.asarray(asin)[rows < 0][0]!r}")
+        event = np.asarray(event)
+        if event.dtype.kind in "iu":
+            codes = event
+        else:
+            codes = pd.Categorical(event, categories=EVENT_TYPES).codes
+        if ((codes < 0) | (codes >= len(EVENT_TYPES))).any():
+            raise ValueError(f"Unknown event {event[(codes < 0) | (codes >= len(EVENT_TYPES))][0]!r}, "
+                             f"expected one of {EVENT_TYPES}")
+        value = np.asarray(value, dtype=np.float64)
+
+        is_po = codes == PO_CREATED
+        mps = np.zeros(len(rows), dtype=np.intp)
+        mps[~is_po] = pd.Categorical(np.asarray(marketplace)[~is_po], categories=self.marketplaces).codes
+        if (mps < 0).any():
+            raise ValueError(f"Unknown marketplace {np.asarray(marketplace)[mps < 0][0]!r}, "
+                             f"expected one of {self.marketplaces}")
+
+        stock_event = (codes == RECEIPT) | (codes == SALE)
+        apply_stock_events(self.records["stock"], rows[stock_event], mps[stock_event],
+                           np.where(codes[stock_event] == SALE, -value[stock_event], value[stock_event]))
+        # Fancy assignment keeps the last of duplicate indices
+        forecast_event = codes == FORECAST
+        self.records["forecast"][rows[forecast_event], mps[forecast_event]] = value[forecast_event]
+        self.po_status[rows[is_po]] = nrp_engine.PO_INCOMING
+        self.po_arrival[rows[is_po]] = value[is_po]
+        self.own_po[rows[is_po]] = True
+        self.events += len(rows)
+        return self._reevaluate(np.unique(rows))
+
+    def refresh_vendors(self, vendors, changed):
+        """Re-join and re-evaluate the ASINs of the changed vendors.
+
+        vendors: the nrp_vendors.VendorTable after refresh(); changed: the
+        vendor IDs it returned. ASINs keep a PO status of their own.
+        Returns the changed decisions (see apply()).
+        """
+        if self.vendor_ids is None:
+            raise ValueError("Catalog was loaded without a vendor table")
+        hit = self.vendor_ids.isin(changed)
+        touched = np.flatnonzero(hit[self.vendor_codes])
+        own = self.own_po[touched]
+        self.po_status[touched], self.lead_time[touched], self.po_arrival[touched], _ = vendors.join(
+            self.vendor_ids[self.vendor_codes[touched]],
+            np.where(own, self.po_status[touched], -1),
+            self.po_arrival[touched],
+        )
+        return self._reevaluate(touched)
+
+    def _reevaluate(self, touched):
+        # Re-evaluate the rows touched and return their changed decisions
+        before = self.result.decision[touched]
+        update = self._evaluate(touched)
+        for field in self.result.__dataclass_fields__:
+            getattr(self.result, field)[touched] = getattr(update, field)
+
+        changed_row, changed_mp = np.nonzero(update.decision != before)
+        return pd.DataFrame({
+            "asin": self.asins[touched[changed_row]],
+            "marketplace": np.asarray(self.marketplaces, dtype=object)[changed_mp],
+            "previous": np.asarray(nrp_engine.DECISIONS)[before[changed_row, changed_mp]],
+            "decision": np.asarray(nrp_engine.DECISIONS)[update.decision[changed_row, changed_mp]],
+            "new_woc": update.new_woc[changed_row, changed_mp],
+            "final_woc": update.final_woc[changed_row],
+            "cp_before": update.cp_before[changed_row],
+            "cp_after": update.cp_after[changed_row],
+        })
+
+    def apply_frame(self, events):
+        """apply() on a DataFrame with EVENT_COLUMNS."""
+        return self.apply(events["asin"].to_numpy(), events["marketplace"].to_numpy(),
+                          events["event"].to_numpy(), events["value"].to_numpy())
+
+
+def read_events(path, batch_events=DEFAULT_BATCH_EVENTS):
+    """Yield an event file (CSV/Parquet with EVENT_COLUMNS) in batches."""
+    if nrp_batch._is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_events, columns=EVENT_COLUMNS):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=EVENT_COLUMNS, chunksize=batch_events,
+                               dtype={"asin": str, "marketplace": str}, keep_default_na=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay change events against a catalog and emit changed decisions.")
+    parser.add_argument("catalog", help="Catalog CSV/Parquet with columns " + ", ".join(nrp_batch.INPUT_COLUMNS))
+    parser.add_argument("events", help="Event CSV/Parquet with columns " + ", ".join(EVENT_COLUMNS))
+    parser.add_argument("output", help="Changed decisions CSV/Parquet path")
+    parser.add_argument("--batch-events", type=int, default=DEFAULT_BATCH_EVENTS,
+                        help="Events applied per re-evaluation (1 = one at a time)")
+    parser.add_argument("--vendors", help="Vendor table (nrp_vendors) joined on the catalog's vendor ID column")
+    parser.add_argument("--refresh-vendors",
+                        help="New version of the vendor table, applied after the events (needs --vendors)")
+    nrp_batch.add_model_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.refresh_vendors and not args.vendors:
+        parser.error("--refresh-vendors needs --vendors")
+
+    start = time.perf_counter()
+    vendors = None
+    if args.vendors:
+        import nrp_vendors
+        vendors = nrp_vendors.VendorTable.from_file(args.vendors)
+    state = IncrementalEvaluator.from_catalog(args.catalog, args.oor_cost, args.max_woc, args.marketplaces, args.mode,
+                                              vendors=vendors)
+    print(f"{len(state):,} ASINs loaded and evaluated in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    changes = 0
+    with nrp_batch.ResultWriter(args.output) as writer:
+        for events in read_events(args.events, args.batch_events):
+            out = state.apply_frame(events)
+            writer.write(out)
+            changes += len(out)
+        seconds = time.perf_counter() - start
+        rate = state.events / seconds if seconds > 0 else 0.0
+        print(f"{state.events:,} events in {seconds:.1f}s: {rate:,.0f} events/sec, {changes:,} decisions changed")
+
+        if args.refresh_vendors:
+            start = time.perf_counter()
+            changed = vendors.refresh(args.refresh_vendors)
+            out = state.refresh_vendors(vendors, changed)
+            writer.write(out)
+            print(f"{len(changed):,} vendors changed, {len(out):,} decisions changed in "
+                  f"{time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Optional Numba kernels for the per-ASIN loops of the engine.
+
+The greedy turn-off pass is sequential within an ASIN (every accepted MP
+lowers the remaining EU forecast seen by the next one), so the NumPy engine
+steps through the evaluation order one position at a time over all ASINs.
+These kernels instead sort the few MPs of one ASIN, run its whole pass and
+then its CP/CBF totals in registers, one ASIN at a time, with ASINs spread
+over all cores (``prange``). Results match the NumPy path up to floating point summation
+order.
+
+Numba is optional: ``nrp_engine.evaluate`` uses these kernels only when it
+is installed (see nrp_engine.KERNELS). Compiled code is cached on disk
+(``cache=True``, in __pycache__ or NUMBA_CACHE_DIR), so only the first run
+after an install or a change of this file pays the compilation.
+
+    python nrp_jit.py    # compile (or load) the kernels and report the time
+"""
+import time
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Values shared with nrp_engine (kept literal: the kernels compile them in)
+NEVER = 999.0
+KEEP_ACTIVE = 1
+TURN_OFF = 2
+
+AVAILABLE = numba is not None
+
+
+def _jit(function):
+    return numba.njit(parallel=True, cache=True)(function) if AVAILABLE else None
+
+
+def _before(stock, forecast, i, a, b):
+    # Whether MP a comes before MP b in the turn-off order (nrp_engine.turn_off_order)
+    zero_a = stock[i, a] == 0
+    zero_b = stock[i, b] == 0
+    if zero_a != zero_b:
+        return zero_a
+    fa = forecast[i, a]
+    fb = forecast[i, b]
+    if fa != fb and not (np.isnan(fa) and np.isnan(fb)):
+        if np.isnan(fa):
+            return False
+        return np.isnan(fb) or fa < fb
+    return a > b
+
+
+def _sequential_pass(stock, forecast, s_eu, f_eu, max_woc, t_arrival, pass_cppu,
+                     order, n_zero, decision, new_woc, pass_woc_health, pass_depletion, f_remaining):
+    # Turn-off order and greedy pass of every ASIN; outputs are filled in place
+    m = stock.shape[1]
+    for i in numba.prange(stock.shape[0]):
+        # Insertion sort of the (few) MPs
+        zeros = 0
+        for j in range(m):
+            zeros += stock[i, j] == 0
+            k = j
+            while k > 0 and _before(stock, forecast, i, j, order[i, k - 1]):
+                order[i, k] = order[i, k - 1]
+                k -= 1
+            order[i, k] = j
+        n_zero[i] = zeros
+
+        remaining_total = f_eu[i]
+        for k in range(zeros):
+            mp = order[i, k]
+            remaining = remaining_total - forecast[i, mp]
+            woc = s_eu[i] / remaining if remaining > 0 else NEVER
+            health = woc <= max_woc[i]
+            depletion = t_arrival[i] >= NEVER or woc < t_arrival[i]
+            new_woc[i, mp] = woc
+            pass_woc_health[i, mp] = health
+            pass_depletion[i, mp] = depletion
+            if pass_cppu[i, mp] and health and depletion:
+                decision[i, mp] = TURN_OFF
+                remaining_total = remaining
+            else:
+                decision[i, mp] = KEEP_ACTIVE
+        f_remaining[i] = remaining_total
+
+
+def _cp_cbf(stock, forecast, cppu, oor_cost, s_eu, woc_eu, f_remaining, decision,
+            final_woc, cp_before, cp_after, cbf_before, cbf_after):
+    # CP and cross-border units before/after the decisions, per ASIN
+    for i in numba.prange(stock.shape[0]):
+        m = stock.shape[1]
+        final = s_eu[i] / f_remaining[i] if f_remaining[i] > 0 else NEVER
+        active_total = 0.0
+        for j in range(m):
+            if decision[i, j] != TURN_OFF:
+                active_total += forecast[i, j]
+        before = 0.0
+        after = 0.0
+        units_before = 0.0
+        units_after = 0.0
+        for j in range(m):
+            zero = stock[i, j] == 0
+            active = decision[i, j] != TURN_OFF
+            before += forecast[i, j] * woc_eu[i] * (cppu[i, j] - oor_cost[i] if zero else cppu[i, j])
+            if active and active_total > 0:
+                after += forecast[i, j] / active_total * s_eu[i] * cppu[i, j]
+            if zero:
+                units_before += forecast[i, j] * woc_eu[i]
+                if active:
+                    units_after += forecast[i, j] * final
+        final_woc[i] = final
+        cp_before[i] = before
+        cp_after[i] = after
+        cbf_before[i] = units_before
+        cbf_after[i] = units_after
+
+
+_before = numba.njit(cache=True)(_before) if AVAILABLE else None
+_sequential_pass_jit = _jit(_sequential_pass)
+_cp_cbf_jit = _jit(_cp_cbf)
+
+
+def _contiguous(*arrays):
+    return [np.ascontiguousarray(a) for a in arrays]
+
+
+def sequential_pass(stock, forecast, s_eu, f_eu, max_woc, t_arrival, pass_cppu):
+    """Turn-off order and greedy pass (the sequential_optimization stage of nrp_engine.evaluate).
+
+    Returns (order, n_zero, decision, new_woc, pass_woc_health,
+    pass_depletion, f_remaining).
+    """
+    n, m = forecast.shape
+    order = np.empty((n, m), dtype=np.int64)
+    n_zero = np.empty(n, dtype=np.int64)
+    decision = np.zeros((n, m), dtype=np.uint8)
+    new_woc = np.full((n, m), np.nan)
+    pass_woc_health = np.zeros((n, m), dtype=np.bool_)
+    pass_depletion = np.zeros((n, m), dtype=np.bool_)
+    f_remaining = np.empty(n)
+    _sequential_pass_jit(
+        *_contiguous(stock, forecast, s_eu, f_eu, max_woc, t_arrival, pass_cppu),
+        order, n_zero, decision, new_woc, pass_woc_health, pass_depletion, f_remaining,
+    )
+    return order, n_zero, decision, new_woc, pass_woc_health, pass_depletion, f_remaining
+
+
+def cp_cbf(stock, forecast, cppu, oor_cost, s_eu, woc_eu, f_remaining, decision):
+    """Final WoC, CP and CBF units of the decisions.
+
+    Returns (final_woc, cp_before, cp_after, cbf_units_before, cbf_units_after).
+    """
+    n = len(stock)
+    outputs = [np.empty(n) for _ in range(5)]
+    _cp_cbf_jit(*_contiguous(stock, forecast, cppu, oor_cost, s_eu, woc_eu, f_remaining, decision), *outputs)
+    return tuple(outputs)
+
+
+def warm_up():
+    """Compile the kernels, or load them from the cache. Returns the seconds taken."""
+    start = time.perf_counter()
+    stock = np.zeros((1, 2))
+    forecast = np.ones((1, 2))
+    one = np.ones(1)
+    *_, decision, _, _, _, f_remaining = sequential_pass(
+        stock, forecast, one, 2 * one, one, one, np.ones((1, 2), dtype=np.bool_)
+    )
+    cp_cbf(stock, forecast, forecast, one, one, one, f_remaining, decision)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    if not AVAILABLE:
+        print("Numba is not installed; nrp_engine uses the NumPy kernels (pip install numba)")
+    else:
+        seconds = warm_up()
+        print(f"Numba {numba.__version__}: kernels ready in {seconds:.2f}s "
+              f"({numba.get_num_threads()} threads; a cached load takes well under a second)")
@@ -0,0 +1,165 @@
+"""Background batch jobs.
+
+Runs ``nrp_batch.run`` (or ``nrp_parallel.run``) on a worker thread so a
+Streamlit session stays responsive while a catalog is evaluated. The job
+object keeps the latest chunk statistics; the page polls snapshot() and
+reads rows done, rows/sec and ETA from it. cancel() stops the run after
+the chunk in flight; the partial output is deleted.
+
+No Streamlit here: keep the job in st.session_state and poll it from the
+page. Worker threads must not call Streamlit.
+"""
+import os
+import threading
+import time
+
+import nrp_batch
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+FINISHED = (DONE, CANCELLED, FAILED)
+
+# Rows per chunk: smaller than nrp_batch's default for finer progress and quicker cancellation
+DEFAULT_CHUNK_ROWS = 200_000
+
+# Bytes read from the head of a CSV to estimate its row count
+ROW_SAMPLE_BYTES = 1 << 20
+
+
+class Cancelled(Exception):
+    """Raised inside the worker thread to stop a cancelled run."""
+
+
+def estimate_rows(path):
+    """Number of catalog rows in a CSV/Parquet file (estimated for CSV).
+
+    Parquet row counts come from the file metadata; CSV rows are estimated
+    from the file size and the mean length of the lines in its first
+    ROW_SAMPLE_BYTES, so the estimate is instant whatever the file size.
+    """
+    if nrp_batch._is_parquet(path):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        sample = f.read(ROW_SAMPLE_BYTES)
+    lines = sample.count(b"\n")
+    if len(sample) < ROW_SAMPLE_BYTES:
+        return lines + (not sample.endswith(b"\n") and len(sample) > 0)
+    return round((size - len(header)) / (len(sample) / lines)) if lines else 1
+
+
+class BatchJob:
+    """One catalog evaluation on a background thread.
+
+    Arguments are those of nrp_batch.run(), with DEFAULT_CHUNK_ROWS;
+    workers > 1 (or 0 for one per CPU) runs nrp_parallel.run() instead,
+    whose processes do the work, so the thread only waits on them.
+    """
+
+    def __init__(self, input_path, output_path, oor_cost, max_woc, marketplaces=None, mode="greedy",
+                 chunk_rows=DEFAULT_CHUNK_ROWS, workers=1, total_rows=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.kwargs = dict(marketplaces=marketplaces, mode=mode, chunk_rows=chunk_rows)
+        self.params = (oor_cost, max_woc)
+        self.workers = workers
+        self.total_rows = total_rows
+        self.state = QUEUED
+        self.stats = {}
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="nrp-batch-job", daemon=True)
+
+    def start(self):
+        """Start the worker thread. Returns the job."""
+        self.started = time.time()
+        self.state = RUNNING
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Ask the run to stop after the chunk in flight."""
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    @property
+    def done(self):
+        return self.state in FINISHED
+
+    def _progress(self, stats):
+        with self._lock:
+            self.stats = dict(stats)
+        if self._cancel.is_set():
+            raise Cancelled()
+
+    def _run(self):
+        try:
+            if self.total_rows is None:
+                self.total_rows = estimate_rows(self.input_path)
+            if self._cancel.is_set():
+                raise Cancelled()
+            if self.workers == 1:
+                stats = nrp_batch.run(self.input_path, self.output_path, *self.params, progress=self._progress,
+                                      **self.kwargs)
+            else:
+                import nrp_parallel
+                stats = nrp_parallel.run(self.input_path, self.output_path, *self.params,
+                                         workers=self.workers or None, progress=self._progress, **self.kwargs)
+            with self._lock:
+                self.stats = dict(stats)
+            self.state = DONE
+        except Cancelled:
+            self.state = CANCELLED
+            self._remove_output()
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+            self.state = FAILED
+            self._remove_output()
+        finally:
+            self.finished = time.time()
+
+    def _remove_output(self):
+        try:
+            os.remove(self.output_path)
+        except OSError:
+            pass
+
+    def snapshot(self):
+        """Progress as a dict: state, rows, total_rows, fraction, rows_per_sec, eta, elapsed, ...
+
+        fraction and eta (seconds) are None until the first chunk is done
+        or while the row total is unknown; the ETA extrapolates the mean
+        rate so far.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        rows = stats.get("rows", 0)
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        rows_per_sec = rows / elapsed if elapsed > 0 else 0.0
+        total = self.total_rows
+        if self.state == DONE:
+            total = rows
+        fraction = eta = None
+        if total and rows:
+            fraction = min(rows / total, 1.0)
+            eta = max(total - rows, 0) / rows_per_sec if rows_per_sec > 0 and not self.done else 0.0
+        return {
+            "state": self.state, "rows": rows, "total_rows": total, "fraction": fraction,
+            "rows_per_sec": rows_per_sec, "eta": eta, "elapsed": elapsed,
+            "asins": stats.get("asins", 0), "chunks": stats.get("chunks", 0),
+            "turned_off": stats.get("turned_off", 0), "error": self.error,
+        }
@@ -0,0 +1,117 @@
+"""Load test for the NRP decision service (nrp_service.py).
+
+Opens `concurrency` keep-alive connections to a running instance, sends
+random single-ASIN (or bulk) requests and reports throughput and client-side
+latency percentiles. Exits with status 1 if p99 exceeds the target.
+
+    python nrp_service.py &
+    python nrp_loadtest.py --requests 20000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+import nrp_engine
+import nrp_service
+
+
+def random_items(n, marketplaces, rng):
+    """n random request objects over a random subset of marketplaces each."""
+    items = []
+    for i in range(n):
+        mps = rng.choice(marketplaces, size=rng.integers(2, len(marketplaces) + 1), replace=False)
+        items.append({
+            "asin": f"B{i:09d}",
+            "po_status": int(rng.integers(len(nrp_engine.PO_STATUSES))),
+            "lead_time": int(rng.integers(1, 60)),
+            "po_arrival": round(float(rng.uniform(0.5, 12)), 1),
+            "marketplaces": {
+                mp: {
+                    "stock": int(rng.integers(0, 300)) if rng.random() < 0.6 else 0,
+                    "forecast": int(rng.integers(0, 60)),
+                    "cppu": round(float(rng.uniform(0.5, 4)), 2),
+                }
+                for mp in mps
+            },
+        })
+    return items
+
+
+async def _request(reader, writer, host, path, body):
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run(host, port, bodies, path, concurrency):
+    """Send all bodies over `concurrency` connections. Returns (latencies, errors, seconds)."""
+    latencies = []
+    errors = 0
+    queue = iter(bodies)
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for body in queue:
+                start = time.perf_counter()
+                status = await _request(reader, writer, host, path, body)
+                latencies.append(time.perf_counter() - start)
+                errors += status != 200
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return np.array(latencies), errors, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running NRP decision service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent keep-alive connections")
+    parser.add_argument("--bulk", type=int, default=0, help="ASINs per /decide/bulk request (0 = use /decide)")
+    parser.add_argument("--p99-target-ms", type=float, default=nrp_service.P99_TARGET_MS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    items = random_items(args.requests * max(args.bulk, 1), list(nrp_engine.MARKETPLACES)[:4], rng)
+    if args.bulk:
+        path = "/decide/bulk"
+        bodies = [json.dumps(items[i:i + args.bulk]).encode() for i in range(0, len(items), args.bulk)]
+    else:
+        path = "/decide"
+        bodies = [json.dumps(item).encode() for item in items]
+
+    latencies, errors, seconds = asyncio.run(run(args.host, args.port, bodies, path, args.concurrency))
+    p50, p90, p99 = np.percentile(latencies * 1000, [50, 90, 99])
+    print(f"{len(latencies):,} requests ({len(items):,} ASINs) in {seconds:.1f}s: "
+          f"{len(latencies) / seconds:,.0f} requests/sec, {len(items) / seconds:,.0f} ASINs/sec, {errors} errors")
+    print(f"latency p50 {p50:.2f} ms, p90 {p90:.2f} ms, p99 {p99:.2f} ms, max {latencies.max() * 1000:.2f} ms "
+          f"(p99 target {args.p99_target_ms:g} ms)")
+    if p99 > args.p99_target_ms or errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Monte Carlo forecast uncertainty.
+
+Draws forecast scenarios per marketplace around the point forecasts and runs
+the full NRP decision logic on every draw as one batch: each ASIN is repeated
+once per draw, like the grid points of ``nrp_sweep``.
+
+    python nrp_montecarlo.py catalog.csv risk.csv --draws 1000 --cv 0.3
+"""
+import argparse
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import nrp_batch
+import nrp_engine
+
+DISTRIBUTIONS = ("gamma", "lognormal", "normal")
+QUANTILES = (10, 50, 90)
+
+# Max ASIN x draw rows per engine call
+SIMULATION_BLOCK = 1 << 20
+
+
+@dataclass
+class SimulationResult:
+    """Simulation summary per ASIN (and per MP for p_turn_off)."""
+    p_turn_off: np.ndarray  # (n, m) share of draws with TURN_OFF
+    cp_improvement_quantiles: np.ndarray  # (n, len(QUANTILES)), P10/P50/P90
+    p_stockout: np.ndarray  # (n,) share of draws where stock runs out before T_arrival
+    cp_improvement: np.ndarray = None  # (n, draws), only with keep_draws=True
+
+
+def forecast_draws(forecast, draws, cv, distribution="gamma", rng=None):
+    """Forecast scenarios with mean forecast and coefficient of variation cv.
+
+    forecast: (n, m); cv: scalar or broadcastable to (n, m). Returns
+    (n, draws, m); zero forecasts stay zero.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    forecast = np.asarray(forecast, dtype=np.float64)[:, None, :]
+    cv = np.broadcast_to(np.asarray(cv, dtype=np.float64), forecast.shape[:1] + forecast.shape[2:])[:, None, :]
+    shape = (forecast.shape[0], draws, forecast.shape[2])
+    if distribution == "gamma":
+        k = 1 / np.maximum(cv, 1e-12) ** 2
+        multiplier = rng.gamma(np.broadcast_to(k, shape), 1 / np.broadcast_to(k, shape))
+    elif distribution == "lognormal":
+        sigma2 = np.log1p(cv ** 2)
+        multiplier = rng.lognormal(-sigma2 / 2, np.sqrt(sigma2), shape)
+    elif distribution == "normal":
+        multiplier = np.maximum(rng.normal(1.0, cv, shape), 0.0)
+    else:
+        raise ValueError(f"Unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+    return forecast * multiplier
+
+
+def simulate(records, po_status, lead_time, po_arrival, oor_cost, max_woc, draws=1000, cv=0.3,
+             distribution="gamma", seed=None, mode="greedy", keep_draws=False):
+    """Run the decision logic on `draws` forecast scenarios per ASIN.
+
+    records: (n_asins, n_marketplaces) MARKETPLACE_DTYPE inputs; stock and
+    CPPU are kept, forecasts are drawn. Other parameters as in evaluate().
+    """
+    rng = np.random.default_rng(seed)
+    n, m = records.shape
+    per_asin = {
+        "po_status": np.broadcast_to(np.asarray(po_status), (n,)),
+        "lead_time": np.broadcast_to(np.asarray(lead_time, dtype=np.float64), (n,)),
+        "po_arrival": np.broadcast_to(np.asarray(po_arrival, dtype=np.float64), (n,)),
+        "oor_cost": np.broadcast_to(np.asarray(oor_cost, dtype=np.float64), (n,)),
+        "max_woc": np.broadcast_to(np.asarray(max_woc, dtype=np.float64), (n,)),
+    }
+    cv = np.broadcast_to(np.asarray(cv, dtype=np.float64), (n, m))
+
+    p_turn_off = np.empty((n, m))
+    quantiles = np.empty((n, len(QUANTILES)))
+    p_stockout = np.empty(n)
+    cp_improvement = np.empty((n, draws)) if keep_draws else None
+
+    step = max(1, SIMULATION_BLOCK // draws)
+    for start in range(0, n, step):
+        asins = slice(start, min(start + step, n))
+        k = asins.stop - asins.start
+        scenarios = np.repeat(records[asins], draws, axis=0)
+        scenarios["forecast"] = forecast_draws(
+            records["forecast"][asins], draws, cv[asins], distribution, rng
+        ).reshape(k * draws, m)
+        result = nrp_engine.evaluate_records(
+            scenarios, mode=mode, **{name: np.repeat(value[asins], draws) for name, value in per_asin.items()}
+        )
+        turned_off = (result.decision == nrp_engine.TURN_OFF).reshape(k, draws, m)
+        improvement = (result.cp_after - result.cp_before).reshape(k, draws)
+        stockout = (result.final_woc < result.t_arrival).reshape(k, draws)
+
+        p_turn_off[asins] = turned_off.mean(axis=1)
+        quantiles[asins] = np.percentile(improvement, QUANTILES, axis=1).T
+        p_stockout[asins] = stockout.mean(axis=1)
+        if keep_draws:
+            cp_improvement[asins] = improvement
+
+    return SimulationResult(
+        p_turn_off=p_turn_off,
+        cp_improvement_quantiles=quantiles,
+        p_stockout=p_stockout,
+        cp_improvement=cp_improvement,
+    )
+
+
+def simulation_frame(asin, marketplace, result, asin_idx, mp_idx):
+    """Per ASIN x marketplace rows; ASIN-level risk metrics are repeated."""
+    columns = {
+        "asin": asin,
+        "marketplace": marketplace,
+        "p_turn_off": result.p_turn_off[asin_idx, mp_idx],
+    }
+    for q, values in zip(QUANTILES, result.cp_improvement_quantiles.T):
+        columns[f"cp_improvement_p{q}"] = values[asin_idx]
+    columns["p_stockout"] = result.p_stockout[asin_idx]
+    return pd.DataFrame(columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Forecast-uncertainty simulation for a catalog file.")
+    parser.add_argument("input", help="Catalog CSV/Parquet with columns " + ", ".join(nrp_batch.INPUT_COLUMNS))
+    parser.add_argument("output", help="Result CSV/Parquet path")
+    parser.add_argument("--draws", type=int, default=1000, help="Forecast scenarios per ASIN")
+    parser.add_argument("--cv", type=float, default=0.3, help="Forecast coefficient of variation")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="gamma")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="Catalog rows read per chunk")
+    nrp_batch.add_model_arguments(parser)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    asin_count = 0
+    seeds = np.random.SeedSequence(args.seed)  # one independent stream per chunk
+    with nrp_batch.ResultWriter(args.output) as writer:
+        for df in nrp_batch.asin_chunks(nrp_batch.read_chunks(args.input, args.chunk_rows)):
+            asins, records, po_status, lead_time, po_arrival, asin_idx, mp_idx = nrp_batch.pivot_chunk(
+                df, args.marketplaces
+            )
+            result = simulate(
+                records, po_status, lead_time, po_arrival, args.oor_cost, args.max_woc,
+                draws=args.draws, cv=args.cv, distribution=args.distribution,
+                seed=seeds.spawn(1)[0], mode=args.mode,
+            )
+            writer.write(simulation_frame(
+                df["asin"].to_numpy(), df["marketplace"].to_numpy(), result, asin_idx, mp_idx
+            ))
+            asin_count += len(asins)
+    seconds = time.perf_counter() - start
+    print(f"{asin_count:,} ASINs x {args.draws:,} draws in {seconds:.1f}s "
+          f"({asin_count * args.draws / seconds:,.0f} scenarios/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Multi-core batch NRP evaluation.
+
+Shards the catalog by input chunk across a process pool. The main process
+only reads and re-cuts chunks (see ``nrp_batch.asin_chunks``) and copies
+their columns into shared memory; each worker attaches to its chunk,
+evaluates it and writes a numbered part file. Parts are concatenated in chunk
+order at the end, so the output does not depend on the number of workers.
+With a checkpoint directory (see nrp_checkpoint) the parts are committed
+there instead and chunks committed by an earlier attempt are not re-sent.
+Workers run single-threaded (Numba kernels, BLAS and OpenMP): the pool
+already uses every core.
+"""
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import nrp_batch
+import nrp_checkpoint
+import nrp_engine
+
+# Chunks in flight per worker (bounds memory of the main process)
+CHUNKS_PER_WORKER = 2
+
+# Thread pool sizes of the native libraries, set to 1 in every worker
+THREAD_LIMIT_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+
+def _init_worker():
+    # One thread per worker process: workers x threads would oversubscribe the cores
+    for name in THREAD_LIMIT_VARS:
+        os.environ[name] = "1"
+    import nrp_jit
+    if nrp_jit.AVAILABLE:
+        nrp_jit.numba.set_num_threads(1)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        # Libraries loaded before the environment variables were set
+        threadpool_limits(1)
+
+
+def share_arrays(arrays):
+    """Copy a dict of arrays into one shared memory block.
+
+    Returns (shm, spec); pass (shm.name, spec) to attach_arrays().
+    """
+    spec = []
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        offset = -(-offset // 64) * 64  # align every array to 64 bytes
+        spec.append((name, arr.dtype.str, arr.shape, offset))
+        offset += arr.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (name, dtype, shape, start), arr in zip(spec, arrays.values()):
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)[...] = arr
+    return shm, spec
+
+
+def attach_arrays(name, spec):
+    """Attach to a block made by share_arrays(). Returns (shm, dict of arrays).
+
+    The creator owns the block and unlinks it; attachers only close() it.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = {
+        field: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)
+        for field, dtype, shape, start in spec
+    }
+    return shm, arrays
+
+
+def chunk_arrays(df):
+    """Catalog chunk as plain NumPy columns (strings as fixed-width unicode)."""
+    arrays = {
+        "asin": np.asarray(df["asin"], dtype=str),
+        "marketplace": np.asarray(df["marketplace"], dtype=str),
+        "stock": df["stock"].to_numpy(dtype=np.float64),
+        "forecast": df["forecast"].to_numpy(dtype=np.float64),
+        "cppu": df["cppu"].to_numpy(dtype=np.float64),
+    }
+    # Optional with a vendor table (see nrp_batch.VENDOR_ID)
+    if "po_status" in df:
+        arrays["po_status"] = nrp_batch.po_status_codes(df["po_status"])
+    for column in ("lead_time", "po_arrival"):
+        if column in df:
+            arrays[column] = df[column].to_numpy(dtype=np.float64)
+    if nrp_batch.VENDOR_ID in df:
+        arrays[nrp_batch.VENDOR_ID] = np.asarray(df[nrp_batch.VENDOR_ID], dtype=str)
+    for column in df.columns:
+        if nrp_batch.horizon_week(column) is not None:
+            arrays[column] = df[column].to_numpy(dtype=np.float64)
+    return arrays
+
+
+def _evaluate_part(shm_name, spec, part_path, marketplaces, oor_cost, max_woc, mode, atomic=False, vendors=None):
+    # Worker: evaluate one shared chunk and write it as a part file (atomically for checkpoints)
+    start = time.perf_counter()
+    shm, arrays = attach_arrays(shm_name, spec)
+    try:
+        df = pd.DataFrame(arrays)
+        out = nrp_batch.evaluate_chunk(df, marketplaces, oor_cost, max_woc, mode, vendors=vendors)
+        del df, arrays
+    finally:
+        shm.close()
+    if atomic:
+        nrp_checkpoint.write_part(out, part_path)
+    else:
+        with nrp_batch.ResultWriter(part_path) as writer:
+            writer.write(out)
+    turned_off = int((out["decision"] == "TURN_OFF").sum())
+    return os.getpid(), len(out), turned_off, time.perf_counter() - start
+
+
+def concat_parts(parts, output_path):
+    """Concatenate part files (same format as output_path) in order."""
+    if nrp_batch._is_parquet(output_path):
+        import pyarrow.parquet as pq
+        writer = None
+        for part in parts:
+            table = pq.read_table(part)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    else:
+        with open(output_path, "wb") as out:
+            for i, part in enumerate(parts):
+                with open(part, "rb") as f:
+                    if i > 0:
+                        f.readline()  # header
+                    shutil.copyfileobj(f, out)
+
+
+def run(input_path, output_path, oor_cost, max_woc, marketplaces=None, mode="greedy",
+        chunk_rows=nrp_batch.DEFAULT_CHUNK_ROWS, workers=None, progress=None, checkpoint=None,
+        keep_checkpoint=False, vendors=None):
+    """Parallel version of nrp_batch.run(). Returns run and per-worker statistics.
+
+    vendors (an nrp_vendors.VendorTable) is pickled to the workers with every chunk.
+    """
+    marketplaces = list(marketplaces or nrp_engine.MARKETPLACES)
+    workers = workers or os.cpu_count()
+    stats = {"rows": 0, "asins": 0, "chunks": 0, "turned_off": 0, "seconds": 0.0, "rows_per_sec": 0.0,
+             "resumed_chunks": 0, "workers": workers, "per_worker": {}}
+    start = time.perf_counter()
+    if checkpoint is not None:
+        checkpoint = nrp_checkpoint.Checkpoint.open(
+            checkpoint,
+            nrp_checkpoint.run_key(input_path, oor_cost, max_woc, marketplaces, mode, chunk_rows, vendors),
+            output_path
+        )
+        part_dir = checkpoint.directory
+    else:
+        part_dir = tempfile.mkdtemp(prefix="nrp_parts_", dir=os.path.dirname(os.path.abspath(output_path)))
+    suffix = os.path.splitext(output_path)[1]
+    parts = []
+    pending = deque()
+
+    def collect():
+        chunk, asins, shm, future = pending.popleft()
+        try:
+            pid, rows, turned_off, seconds = future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+        if checkpoint is not None:
+            checkpoint.commit(chunk, rows, asins, turned_off)
+        worker = stats["per_worker"].setdefault(pid, {"chunks": 0, "rows": 0, "seconds": 0.0})
+        worker["chunks"] += 1
+        worker["rows"] += rows
+        worker["seconds"] += seconds
+        worker["rows_per_sec"] = worker["rows"] / worker["seconds"] if worker["seconds"] > 0 else 0.0
+        stats["rows"] += rows
+        stats["chunks"] += 1
+        stats["turned_off"] += turned_off
+        stats["seconds"] = time.perf_counter() - start
+        stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        if progress is not None:
+            progress(stats)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for df in nrp_batch.asin_chunks(nrp_batch.read_chunks(input_path, chunk_rows)):
+                chunk = len(parts)
+                part = os.path.join(part_dir, f"part-{chunk:06d}{suffix}")
+                parts.append(part)
+                if checkpoint is not None and chunk in checkpoint.done:
+                    done = checkpoint.done[chunk]
+                    stats["asins"] += done["asins"]
+                    stats["rows"] += done["rows"]
+                    stats["turned_off"] += done["turned_off"]
+                    stats["chunks"] += 1
+                    stats["resumed_chunks"] += 1
+                    continue
+                asins = int(df["asin"].nunique())
+                stats["asins"] += asins
+                shm, spec = share_arrays(chunk_arrays(df))
+                future = pool.submit(_evaluate_part, shm.name, spec, part, marketplaces, oor_cost, max_woc, mode,
+                                     checkpoint is not None, vendors)
+                pending.append((chunk, asins, shm, future))
+                del df
+                while len(pending) >= workers * CHUNKS_PER_WORKER:
+                    collect()
+            while pending:
+                collect()
+        if checkpoint is not None:
+            checkpoint.compact(output_path, len(parts), keep_checkpoint)
+        elif parts:
+            concat_parts(parts, output_path)
+        else:
+            with nrp_batch.ResultWriter(output_path, nrp_batch.empty_result()):
+                pass
+    finally:
+        for _, _, shm, future in pending:
+            future.cancel()
+            shm.close()
+            shm.unlink()
+        if checkpoint is None:
+            shutil.rmtree(part_dir, ignore_errors=True)
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
@@ -0,0 +1,355 @@
+"""Cross-marketplace stock rebalancing, compared with turning MPs off.
+
+The engine's only lever is TURN_OFF vs KEEP_ACTIVE: every unit sold to a
+zero-stock MP ships cross-border at the OOR cost. Rebalancing instead moves
+stock once, before it is needed, from MPs holding more than they sell until
+the EU stock runs out (WoC_EU weeks) to the zero-stock MPs. Per ASIN
+
+- the surplus of a stocked MP i is u_i = max(stock_i - forecast_i * WoC_EU, 0);
+- the demand a transfer can cover at zero-stock MP j is
+  v_j = forecast_j * max(WoC_EU - transfer_weeks, 0) (sales during the
+  transfer still ship cross-border);
+- moving x_ij units from i to j costs lane_cost_ij per unit and saves the
+  OOR cost of x_ij cross-border units.
+
+Maximizing the saving sum((oor_cost - lane_cost_ij) * x_ij) under the
+surplus and demand limits is a small transportation problem. When an ASIN
+has a single surplus MP, a single zero-stock MP or one cost on all its
+lanes, filling its lanes cheapest first is optimal (the closed form, one
+vectorized step per lane). The other ASINs are solved exactly as a min-cost
+flow by successive shortest paths, vectorized over those ASINs.
+
+The rebalanced CP is the engine's CP before plus the saving; the turn-off
+CP is its CP after less the OOR cost of its CBF units after, so the three
+actions (ACTIONS) are compared on the same accounting.
+
+    python nrp_rebalance.py catalog.csv rebalance.csv --transfer-cost 0.6 --transfers transfers.csv
+"""
+import argparse
+import contextlib
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import nrp_batch
+import nrp_engine
+from nrp_timing import stage
+
+# Per unit cost of moving stock between two MPs, when no lane cost is given
+DEFAULT_TRANSFER_COST = 0.60
+
+# Weeks a transfer takes to arrive
+DEFAULT_TRANSFER_WEEKS = 1.0
+
+# Actions compared per ASIN (the code is the index); ties go to the first
+ACTIONS = ("keep", "turn_off", "rebalance")
+KEEP, TURN_OFF, REBALANCE = range(len(ACTIONS))
+
+# How the transfers of an ASIN were found (the code is the index)
+METHODS = ("none", "closed_form", "min_cost_flow")
+NO_TRANSFER, CLOSED_FORM, MIN_COST_FLOW = range(len(METHODS))
+
+# Units below which a residual capacity counts as exhausted
+EPSILON = 1e-9
+
+LANE_COLUMNS = ["source", "destination", "cost"]
+
+
+@dataclass
+class RebalanceResult:
+    """Transfers (n, m, m) from MP i to MP j, and per-ASIN (n,) totals and comparison."""
+    transfer: np.ndarray
+    units_moved: np.ndarray
+    transfer_cost: np.ndarray
+    oor_units_after: np.ndarray  # cross-border units left after the transfers
+    cp_keep: np.ndarray  # the engine's CP before
+    cp_turn_off: np.ndarray  # the engine's CP after, less the OOR cost of its CBF units after
+    cp_rebalance: np.ndarray
+    best: np.ndarray  # ACTIONS codes
+    method: np.ndarray  # METHODS codes
+
+    def __len__(self):
+        return len(self.units_moved)
+
+
+def lane_costs(marketplaces, transfer_cost=DEFAULT_TRANSFER_COST, lanes=None):
+    """(m, m) per unit transfer cost between marketplaces (inf on the diagonal).
+
+    lanes: optional {(source, destination): cost} overriding transfer_cost;
+    lanes between marketplaces outside the list are ignored.
+    """
+    position = {mp: i for i, mp in enumerate(marketplaces)}
+    cost = np.full((len(marketplaces), len(marketplaces)), float(transfer_cost))
+    for (source, destination), value in (lanes or {}).items():
+        if source in position and destination in position:
+            cost[position[source], position[destination]] = value
+    np.fill_diagonal(cost, np.inf)
+    return cost
+
+
+def read_lanes(path):
+    """Lane cost CSV (LANE_COLUMNS) as a {(source, destination): cost} dict."""
+    df = pd.read_csv(path, usecols=LANE_COLUMNS, dtype={"source": str, "destination": str})
+    return dict(zip(zip(df["source"], df["destination"]), df["cost"].to_numpy(dtype=np.float64)))
+
+
+def surplus_and_demand(stock, forecast, transfer_weeks=DEFAULT_TRANSFER_WEEKS):
+    """Per MP surplus u (stocked MPs) and transferable demand v (zero-stock MPs), both (n, m)."""
+    s_eu = stock.sum(axis=1)
+    woc_eu = nrp_engine._safe_divide(s_eu, forecast.sum(axis=1), 0)
+    surplus = np.where(stock > 0, np.maximum(stock - forecast * woc_eu[:, None], 0.0), 0.0)
+    demand = np.where(stock == 0, forecast * np.maximum(woc_eu - transfer_weeks, 0.0)[:, None], 0.0)
+    return surplus, demand
+
+
+def greedy_transfers(surplus, demand, cost):
+    """Fill the lanes of every ASIN cheapest first (cost: (n, m, m), negative = saving).
+
+    Optimal when an ASIN has one source, one destination or one lane cost.
+    """
+    n, m, _ = cost.shape
+    surplus = surplus.copy()
+    demand = demand.copy()
+    transfer = np.zeros((n, m, m))
+    lanes = np.argsort(cost.reshape(n, m * m), axis=1, kind="stable")
+    rows = np.arange(n)
+    for k in range(m * m):
+        i, j = np.divmod(lanes[:, k], m)
+        saving = cost[rows, i, j] < 0
+        if not saving.any():
+            break
+        amount = np.where(saving, np.minimum(surplus[rows, i], demand[rows, j]), 0.0)
+        transfer[rows, i, j] = amount
+        surplus[rows, i] -= amount
+        demand[rows, j] -= amount
+    return transfer
+
+
+def min_cost_transfers(surplus, demand, cost):
+    """Exact transfers by successive shortest paths, vectorized over ASINs.
+
+    Every round finds, for all ASINs at once, the cheapest path from a
+    source with surplus left to a destination with demand left in the
+    residual graph (Bellman-Ford over the 2m MP nodes; lanes with flow can
+    be undone at minus their cost) and pushes its bottleneck while the path
+    still saves money. Each round exhausts a source, a destination or a lane.
+    """
+    n, m, _ = cost.shape
+    surplus = surplus.copy()
+    demand = demand.copy()
+    transfer = np.zeros((n, m, m))
+    rows = np.arange(n)
+    live = np.ones(n, dtype=bool)
+    for _ in range(2 * m * m):
+        r = rows[live]
+        if not len(r):
+            break
+        w = cost[r]
+        undo_cost = np.where(transfer[r] > EPSILON, -w, np.inf)  # cost of undoing a lane's flow
+        # Distances to the source (dist_src) and destination (dist_dst) MP nodes
+        dist_src = np.where(surplus[r] > EPSILON, 0.0, np.inf)
+        pred_src = np.full(dist_src.shape, -1)  # destination the path came back from, -1 = start
+        dist_dst = np.full(dist_src.shape, np.inf)
+        pred_dst = np.zeros(dist_src.shape, dtype=np.intp)
+        for _ in range(2 * m):
+            reach = dist_src[:, :, None] + w
+            via = reach.argmin(axis=1)
+            best = np.take_along_axis(reach, via[:, None, :], axis=1)[:, 0]
+            better_dst = best < dist_dst - EPSILON
+            dist_dst = np.where(better_dst, best, dist_dst)
+            pred_dst = np.where(better_dst, via, pred_dst)
+            back = dist_dst[:, None, :] + undo_cost
+            via = back.argmin(axis=2)
+            best = np.take_along_axis(back, via[:, :, None], axis=2)[:, :, 0]
+            better_src = best < dist_src - EPSILON
+            dist_src = np.where(better_src, best, dist_src)
+            pred_src = np.where(better_src, via, pred_src)
+            if not (better_dst.any() or better_src.any()):
+                break
+
+        open_dst = np.where(demand[r] > EPSILON, dist_dst, np.inf)
+        end = open_dst.argmin(axis=1)
+        saves = open_dst[np.arange(len(r)), end] < -EPSILON
+        live[r[~saves]] = False
+        r, end = r[saves], end[saves]
+        if not len(r):
+            break
+        steps, open_path = _path_steps(pred_src[saves], pred_dst[saves], end, m)
+
+        # Push the bottleneck of every path: the destination's demand left,
+        # the starting source's surplus and the flows the path undoes
+        bottleneck = np.where(open_path, 0.0, demand[r, end])
+        live[r[open_path]] = False
+        for walking, src, dst, back_to in steps:
+            start = walking & (back_to < 0)
+            undo = walking & (back_to >= 0)
+            bottleneck[start] = np.minimum(bottleneck[start], surplus[r[start], src[start]])
+            bottleneck[undo] = np.minimum(bottleneck[undo], transfer[r[undo], src[undo], back_to[undo]])
+        demand[r, end] -= bottleneck
+        for walking, src, dst, back_to in steps:
+            start = walking & (back_to < 0)
+            undo = walking & (back_to >= 0)
+            transfer[r[walking], src[walking], dst[walking]] += bottleneck[walking]
+            surplus[r[start], src[start]] -= bottleneck[start]
+            transfer[r[undo], src[undo], back_to[undo]] -= bottleneck[undo]
+    return np.maximum(transfer, 0.0)
+
+
+def _path_steps(pred_src, pred_dst, end, m):
+    # Shortest paths walked back from their destination: a list of (walking,
+    # source, destination, back_to) per step, where back_to is the destination
+    # whose flow from source the path undoes (-1 at the start), and the rows
+    # whose walk did not reach a start within m steps
+    k = np.arange(len(end))
+    steps = []
+    dst = end
+    walking = np.ones(len(end), dtype=bool)
+    for _ in range(m):
+        src = pred_dst[k, dst]
+        back_to = pred_src[k, src]
+        steps.append((walking, src, dst, back_to))
+        walking = walking & (back_to >= 0)
+        if not walking.any():
+            break
+        dst = np.where(walking, back_to, dst)
+    return steps, walking
+
+
+def rebalance(stock, forecast, result, oor_cost, lane_cost, transfer_weeks=DEFAULT_TRANSFER_WEEKS, timer=None):
+    """Transfers of every ASIN and their CP next to keeping and turning off.
+
+    result: the nrp_engine.NRPResult of the same stock and forecast;
+    lane_cost: (m, m) or (n, m, m) per unit costs (see lane_costs()).
+    """
+    stock = np.asarray(stock, dtype=np.float64)
+    forecast = np.asarray(forecast, dtype=np.float64)
+    n, m = stock.shape
+    oor_cost = nrp_engine._per_asin(oor_cost, n)
+
+    with stage(timer, "surplus"):
+        surplus, demand = surplus_and_demand(stock, forecast, transfer_weeks)
+        # Per unit cost net of the OOR cost it saves (negative = worth moving)
+        cost = np.broadcast_to(lane_cost, (n, m, m)) - oor_cost[:, None, None]
+        usable = (surplus[:, :, None] > 0) & (demand[:, None, :] > 0) & (cost < 0)
+        sources = usable.any(axis=2).sum(axis=1)
+        destinations = usable.any(axis=1).sum(axis=1)
+        lane_min = np.where(usable, cost, np.inf).min(axis=(1, 2))
+        lane_max = np.where(usable, cost, -np.inf).max(axis=(1, 2))
+        method = np.where(
+            ~usable.any(axis=(1, 2)), NO_TRANSFER,
+            np.where((sources <= 1) | (destinations <= 1) | (lane_min == lane_max), CLOSED_FORM, MIN_COST_FLOW)
+        ).astype(np.uint8)
+        cost = np.where(usable, cost, np.inf)
+
+    transfer = np.zeros((n, m, m))
+    with stage(timer, "closed_form"):
+        r = np.flatnonzero(method == CLOSED_FORM)
+        if len(r):
+            transfer[r] = greedy_transfers(surplus[r], demand[r], cost[r])
+    with stage(timer, "min_cost_flow"):
+        r = np.flatnonzero(method == MIN_COST_FLOW)
+        if len(r):
+            transfer[r] = min_cost_transfers(surplus[r], demand[r], cost[r])
+
+    with stage(timer, "compare"):
+        units_moved = transfer.sum(axis=(1, 2))
+        saving = (np.where(transfer > 0, -cost, 0.0) * transfer).sum(axis=(1, 2))
+        transfer_cost = oor_cost * units_moved - saving
+        cp_turn_off = result.cp_after - oor_cost * result.cbf_units_after
+        cp_rebalance = result.cp_before + saving
+        best = np.stack([result.cp_before, cp_turn_off, cp_rebalance], axis=1).argmax(axis=1).astype(np.uint8)
+    return RebalanceResult(
+        transfer=transfer,
+        units_moved=units_moved,
+        transfer_cost=transfer_cost,
+        oor_units_after=result.cbf_units_before - units_moved,
+        cp_keep=result.cp_before,
+        cp_turn_off=cp_turn_off,
+        cp_rebalance=cp_rebalance,
+        best=best,
+        method=method,
+    )
+
+
+def evaluate_records(records, po_status, lead_time, po_arrival, oor_cost, max_woc, lane_cost,
+                     transfer_weeks=DEFAULT_TRANSFER_WEEKS, mode="greedy", timer=None):
+    """Engine decision and rebalancing of MARKETPLACE_DTYPE records. Returns (NRPResult, RebalanceResult)."""
+    result = nrp_engine.evaluate_records(records, po_status, lead_time, po_arrival, oor_cost, max_woc, mode,
+                                         timer=timer)
+    return result, rebalance(records["stock"], records["forecast"], result, oor_cost, lane_cost, transfer_weeks,
+                             timer)
+
+
+def rebalance_frame(asins, result):
+    """One row per ASIN: CP of each action, the best one and the transfers' totals."""
+    return pd.DataFrame({
+        "asin": asins,
+        "best_action": np.asarray(ACTIONS)[result.best],
+        "cp_keep": result.cp_keep,
+        "cp_turn_off": result.cp_turn_off,
+        "cp_rebalance": result.cp_rebalance,
+        "units_moved": result.units_moved,
+        "transfer_cost": result.transfer_cost,
+        "oor_units_after": result.oor_units_after,
+        "method": np.asarray(METHODS)[result.method],
+    })
+
+
+def transfer_frame(asins, marketplaces, result):
+    """One row per ASIN and lane with units to move."""
+    row, source, destination = np.nonzero(result.transfer > EPSILON)
+    marketplaces = np.asarray(marketplaces, dtype=object)
+    return pd.DataFrame({
+        "asin": np.asarray(asins)[row],
+        "source": marketplaces[source],
+        "destination": marketplaces[destination],
+        "units": result.transfer[row, source, destination],
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare stock rebalancing with turning MPs off for a catalog file.")
+    parser.add_argument("input", help="Catalog CSV/Parquet with columns " + ", ".join(nrp_batch.INPUT_COLUMNS))
+    parser.add_argument("output", help="Per ASIN comparison CSV/Parquet path")
+    parser.add_argument("--transfers", help="Also write the transfers (one row per ASIN and lane) to this file")
+    parser.add_argument("--transfer-cost", type=float, default=DEFAULT_TRANSFER_COST,
+                        help="Per unit transfer cost ($) of lanes not in --lane-costs")
+    parser.add_argument("--lane-costs", help="CSV with columns " + ", ".join(LANE_COLUMNS) + " (marketplace codes)")
+    parser.add_argument("--transfer-weeks", type=float, default=DEFAULT_TRANSFER_WEEKS,
+                        help="Weeks a transfer takes to arrive")
+    parser.add_argument("--chunk-rows", type=int, default=nrp_batch.DEFAULT_CHUNK_ROWS,
+                        help="Catalog rows read per chunk")
+    nrp_batch.add_model_arguments(parser)
+    args = parser.parse_args(argv)
+
+    lanes = read_lanes(args.lane_costs) if args.lane_costs else None
+    lane_cost = lane_costs(args.marketplaces, args.transfer_cost, lanes)
+    start = time.perf_counter()
+    asin_count = 0
+    actions = np.zeros(len(ACTIONS), dtype=np.int64)
+    methods = np.zeros(len(METHODS), dtype=np.int64)
+    cp = np.zeros(len(ACTIONS))
+    with nrp_batch.ResultWriter(args.output) as writer, \
+            nrp_batch.ResultWriter(args.transfers) if args.transfers else contextlib.nullcontext() as transfers:
+        for df in nrp_batch.asin_chunks(nrp_batch.read_chunks(args.input, args.chunk_rows)):
+            asins, records, po_status, lead_time, po_arrival, _, _ = nrp_batch.pivot_chunk(df, args.marketplaces)
+            _, result = evaluate_records(records, po_status, lead_time, po_arrival, args.oor_cost, args.max_woc,
+                                         lane_cost, args.transfer_weeks, args.mode)
+            writer.write(rebalance_frame(asins, result))
+            if args.transfers:
+                transfers.write(transfer_frame(asins, args.marketplaces, result))
+            asin_count += len(asins)
+            actions += np.bincount(result.best, minlength=len(ACTIONS))
+            methods += np.bincount(result.method, minlength=len(METHODS))
+            cp += [result.cp_keep.sum(), result.cp_turn_off.sum(), result.cp_rebalance.sum()]
+    seconds = time.perf_counter() - start
+    print(f"{asin_count:,} ASINs in {seconds:.1f}s ({asin_count / seconds if seconds > 0 else 0:,.0f} ASINs/sec)")
+    for action, count, total in zip(ACTIONS, actions, cp):
+        print(f"  {action:>10}: CP ${total:,.0f}, best for {count:,} ASINs")
+    print("  transfers by " + ", ".join(f"{method}: {count:,}" for method, count in zip(METHODS, methods)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Scalar reference implementation of the NRP decision logic.
+
+The original per-ASIN calculation of the app, one ASIN at a time in plain
+Python (loops and if/else, no NumPy), generalized from DE/FR/ES/IT to any
+list of marketplaces. The OOR penalty applies to every zero-stock MP, as in
+``nrp_engine``. It is slow on purpose and only used to check the vectorized
+engine (greedy mode, flat forecasts).
+"""
+import math
+
+import nrp_engine
+
+
+def evaluate_asin(stock, forecast, cppu, po_status, lead_time, po_arrival, oor_cost, max_woc):
+    """Decision logic for one ASIN; stock, forecast, cppu are per-MP lists.
+
+    Returns a dict with the per-ASIN NRPResult fields and per-MP lists
+    "decision" (codes) and "new_woc" (NaN where not evaluated).
+    """
+    m = len(stock)
+
+    # EU Totals
+    S_EU = sum(stock)
+    F_EU = sum(forecast)
+    WoC_EU = S_EU / F_EU if F_EU > 0 else 0
+
+    # T_arrival calculation
+    if po_status == nrp_engine.PO_EOL:
+        T_arrival_weeks = nrp_engine.NEVER
+    elif po_status == nrp_engine.PO_INCOMING:
+        T_arrival_weeks = po_arrival
+    elif po_status == nrp_engine.PO_NO_PO_LOW_CR:
+        T_arrival_weeks = (2 * lead_time) / 7
+    else:
+        T_arrival_weeks = lead_time / 7
+
+    # CPPU_avg for MPs with stock
+    cppu_sum = 0
+    forecast_sum = 0
+    for i in range(m):
+        if stock[i] > 0:
+            cppu_sum += cppu[i] * forecast[i]
+            forecast_sum += forecast[i]
+    CPPU_avg = cppu_sum / forecast_sum if forecast_sum > 0 else 0
+
+    # CP BEFORE optimization (OOR penalty for zero-stock MPs)
+    cp_before = 0
+    if F_EU > 0:
+        for i in range(m):
+            cp_before += forecast[i] * WoC_EU * (cppu[i] - oor_cost if stock[i] == 0 else cppu[i])
+
+    # Zero-stock MPs, last listed first, stable-sorted by forecast
+    zero_stock_mps = [i for i in reversed(range(m)) if stock[i] == 0]
+    zero_stock_mps.sort(key=lambda i: forecast[i])
+
+    # Sequential optimization
+    F_EU_remaining = F_EU
+    decision = [nrp_engine.NOT_EVALUATED] * m
+    new_woc = [math.nan] * m
+    for i in zero_stock_mps:
+        pass_cppu = cppu[i] - oor_cost <= CPPU_avg
+        WoC_new = S_EU / (F_EU_remaining - forecast[i]) if (F_EU_remaining - forecast[i]) > 0 else nrp_engine.NEVER
+        pass_woc_health = WoC_new <= max_woc
+        pass_depletion = T_arrival_weeks >= nrp_engine.NEVER or WoC_new < T_arrival_weeks
+        new_woc[i] = WoC_new
+        if pass_cppu and pass_woc_health and pass_depletion:
+            decision[i] = nrp_engine.TURN_OFF
+            F_EU_remaining -= forecast[i]
+        else:
+            decision[i] = nrp_engine.KEEP_ACTIVE
+
+    # CP AFTER optimization: stock is shared among the MPs still active
+    active = [decision[i] != nrp_engine.TURN_OFF for i in range(m)]
+    f_total_after = sum(forecast[i] for i in range(m) if active[i])
+    cp_after = 0
+    if f_total_after > 0:
+        for i in range(m):
+            if active[i]:
+                cp_after += (forecast[i] / f_total_after) * S_EU * cppu[i]
+
+    final_woc = S_EU / F_EU_remaining if F_EU_remaining > 0 else nrp_engine.NEVER
+
+    # CBF units: zero-stock MPs are served cross-border while active
+    cbf_units_before = sum(forecast[i] * WoC_EU for i in range(m) if stock[i] == 0)
+    cbf_units_after = sum(forecast[i] * final_woc for i in range(m) if stock[i] == 0 and active[i])
+
+    return {
+        "s_eu": S_EU,
+        "f_eu": F_EU,
+        "woc_eu": WoC_EU,
+        "t_arrival": T_arrival_weeks,
+        "cppu_avg": CPPU_avg,
+        "decision": decision,
+        "new_woc": new_woc,
+        "f_remaining": F_EU_remaining,
+        "final_woc": final_woc,
+        "cp_before": cp_before,
+        "cp_after": cp_after,
+        "cbf_units_before": cbf_units_before,
+        "cbf_units_after": cbf_units_after,
+    }
+
+
+def _close(a, b, rel_tol=1e-9, abs_tol=1e-9):
+    return (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=rel_tol, abs_tol=abs_tol)
+
+
+def mismatches(records, po_status, lead_time, po_arrival, oor_cost, max_woc, result, rows):
+    """ASIN rows where an engine result differs from the scalar reference.
+
+    Parameters as in nrp_engine.evaluate_records() (scalars or per-ASIN
+    arrays); result: its output. Returns a list of (row, field) pairs.
+    """
+    n = len(records)
+    params = [
+        nrp_engine._per_asin(value, n, dtype)
+        for value, dtype in ((po_status, int), (lead_time, float), (po_arrival, float), (oor_cost, float), (max_woc, float))
+    ]
+    found = []
+    for r in rows:
+        expected = evaluate_asin(
+            records["stock"][r].tolist(), records["forecast"][r].tolist(), records["cppu"][r].tolist(),
+            *(p[r].item() for p in params),
+        )
+        for field, value in expected.items():
+            actual = getattr(result, field)[r]
+            if field == "decision":
+                ok = actual.tolist() == value
+            elif field == "new_woc":
+                ok = all(_close(a, b) for a, b in zip(actual.tolist(), value))
+            else:
+                ok = _close(float(actual), value)
+            if not ok:
+                found.append((int(r), field))
+    return found
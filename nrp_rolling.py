@@ -0,0 +1,291 @@
+"""Rolling-horizon simulation of NRP decisions, week by week.
+
+Steps the whole catalog through a 26-52 week horizon at once: the state of
+every ASIN is a row of a few arrays (EU stock pool, local stock share per
+MP, turned-off flags), updated by one vectorized step per week. Each week
+
+1. POs land at the start of the week that reaches T_arrival: the pool gains
+   the PO units, every MP gets local stock and turned-off MPs re-activate;
+2. the policy turns MPs off (see POLICIES);
+3. active MPs sell their weekly forecast from the shared EU pool, pro rata
+   when the pool runs short, as in nrp_engine. Units sold to MPs without
+   local stock are cross-border and pay the OOR cost.
+
+CP and OOR cost accumulate per ASIN and per week. The model is the engine's
+extended in time: with no PO in the horizon, the "none" policy sells the
+engine's units before and earns its CP before, and "static" earns the CP
+after less the OOR cost of its CBF units after.
+
+    python nrp_rolling.py catalog.csv rolling.csv --weeks 52 --policy rolling
+"""
+import argparse
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import nrp_batch
+import nrp_engine
+
+# none: every MP stays active; static: the week-0 engine decision holds
+# until the PO lands; rolling: the engine re-runs every week on the current
+# stock and remaining time to arrival, turned-off MPs stay off until the PO
+POLICIES = ("none", "static", "rolling")
+
+MIN_WEEKS = 26
+MAX_WEEKS = 52
+
+# PO size when none is given: weeks of EU forecast
+DEFAULT_PO_COVER_WEEKS = 8
+
+
+@dataclass
+class RollingResult:
+    """Simulation totals: catalog per week (weeks,), per ASIN (n,) and per MP (n, m)."""
+    policy: str
+    weekly_cp: np.ndarray
+    weekly_oor_cost: np.ndarray
+    weekly_units: np.ndarray
+    weekly_lost_units: np.ndarray  # forecast demand not sold (turned off or out of stock)
+    weekly_stock: np.ndarray  # EU stock at the end of each week
+    weekly_mps_off: np.ndarray
+    cp: np.ndarray
+    oor_cost: np.ndarray
+    units: np.ndarray
+    lost_units: np.ndarray
+    stockout_week: np.ndarray  # first week with unmet active demand, NaN if none
+    arrival_week: np.ndarray  # week the PO lands, NaN if not within the horizon
+    weeks_off: np.ndarray  # (n, m) weeks each MP was turned off
+    asin_weekly_cp: np.ndarray = field(default=None)  # (n, weeks), only with keep_weekly=True
+    asin_weekly_stock: np.ndarray = field(default=None)
+
+    @property
+    def weeks(self):
+        return len(self.weekly_cp)
+
+
+def weekly_forecast(forecast, horizon, week):
+    """(n, m) forecasts of one week: flat, or from horizon (the last week continues)."""
+    if horizon is None:
+        return forecast
+    return horizon[:, :, min(week, horizon.shape[2] - 1)]
+
+
+def arrival_weeks(t_arrival, weeks):
+    """Week in which each PO lands (its stock sells from that week on); NaN past the horizon."""
+    week = np.ceil(np.maximum(t_arrival, 0.0))
+    return np.where((t_arrival < nrp_engine.NEVER) & (week < weeks), week, np.nan)
+
+
+def simulate(records, po_status, lead_time, po_arrival, oor_cost, max_woc, weeks=MAX_WEEKS, policy="rolling",
+             po_units=None, po_cover_weeks=DEFAULT_PO_COVER_WEEKS, horizon=None, mode="greedy",
+             keep_weekly=False):
+    """Simulate `weeks` weeks of a policy for a batch of ASINs.
+
+    records: (n_asins, n_marketplaces) MARKETPLACE_DTYPE inputs; other
+    parameters as in nrp_engine.evaluate() (scalars or per-ASIN arrays).
+    po_units: units each PO brings (default po_cover_weeks of EU forecast),
+    spread over the MPs by forecast. horizon: optional (n, m, H) weekly
+    forecasts. keep_weekly keeps per-ASIN weekly CP and stock.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+    if not MIN_WEEKS <= weeks <= MAX_WEEKS:
+        raise ValueError(f"weeks must be between {MIN_WEEKS} and {MAX_WEEKS}")
+    n, m = records.shape
+    stock = records["stock"].astype(np.float64)
+    forecast = records["forecast"].astype(np.float64)
+    cppu = records["cppu"].astype(np.float64)
+    po_status = np.broadcast_to(np.asarray(po_status), (n,))
+    lead_time = np.broadcast_to(np.asarray(lead_time, dtype=np.float64), (n,))
+    oor_cost = np.broadcast_to(np.asarray(oor_cost, dtype=np.float64), (n,))
+    max_woc = np.broadcast_to(np.asarray(max_woc, dtype=np.float64), (n,))
+    t_arrival = np.broadcast_to(nrp_engine.t_arrival_weeks(po_status, lead_time, po_arrival), (n,))
+    if po_units is None:
+        po_units = po_cover_weeks * forecast.sum(axis=1)
+    po_units = np.broadcast_to(np.asarray(po_units, dtype=np.float64), (n,))
+    eol = po_status == nrp_engine.PO_EOL
+
+    # State
+    pool = stock.sum(axis=1)
+    local_share = nrp_engine._safe_divide(stock, pool[:, None], 0)
+    turned_off = np.zeros((n, m), dtype=bool)
+    arrival = arrival_weeks(t_arrival, weeks)
+    arrived = np.zeros(n, dtype=bool)
+    forecast_share = nrp_engine._safe_divide(forecast, forecast.sum(axis=1, keepdims=True), 1 / m)
+
+    totals = {name: np.zeros(weeks) for name in ("cp", "oor_cost", "units", "lost_units", "stock", "mps_off")}
+    cp = np.zeros(n)
+    oor = np.zeros(n)
+    units = np.zeros(n)
+    lost = np.zeros(n)
+    weeks_off = np.zeros((n, m), dtype=np.int32)
+    stockout_week = np.full(n, np.nan)
+    asin_weekly_cp = np.zeros((n, weeks)) if keep_weekly else None
+    asin_weekly_stock = np.zeros((n, weeks)) if keep_weekly else None
+
+    for week in range(weeks):
+        demand = weekly_forecast(forecast, horizon, week)
+
+        # 1. PO arrivals: new stock everywhere, turned-off MPs re-activate
+        landing = arrival == week
+        if landing.any():
+            r = np.flatnonzero(landing)
+            new_pool = pool[r] + po_units[r]
+            local_share[r] = nrp_engine._safe_divide(
+                pool[r, None] * local_share[r] + po_units[r, None] * forecast_share[r], new_pool[:, None], 0
+            )
+            pool[r] = new_pool
+            turned_off[r] = False
+            arrived[r] = True
+
+        # 2. Turn-off decisions (sticky until the PO lands)
+        if policy == "static" and week == 0:
+            turned_off = nrp_engine.evaluate(
+                stock, forecast, cppu, po_status, lead_time, po_arrival, oor_cost, max_woc, mode,
+                horizon=horizon,
+            ).decision == nrp_engine.TURN_OFF
+            turned_off &= ~arrived[:, None]
+        elif policy == "rolling":
+            no_local = local_share == 0
+            r = np.flatnonzero(~arrived & (pool > 0) & (no_local & ~turned_off).any(axis=1))
+            if len(r):
+                # Already turned-off MPs are out of the active forecast
+                active_demand = np.where(turned_off[r], 0.0, demand[r])
+                window = None
+                if horizon is not None:
+                    window = np.where(turned_off[r, :, None], 0.0, horizon[r, :, min(week, horizon.shape[2] - 1):])
+                result = nrp_engine.evaluate(
+                    pool[r, None] * local_share[r], active_demand, cppu[r],
+                    np.where(eol[r], nrp_engine.PO_EOL, nrp_engine.PO_INCOMING), lead_time[r],
+                    np.maximum(t_arrival[r] - week, 0.0), oor_cost[r], max_woc[r], mode, horizon=window,
+                )
+                turned_off[r] |= result.decision == nrp_engine.TURN_OFF
+
+        # 3. Sales from the shared pool; MPs without local stock are served cross-border
+        active_demand = np.where(turned_off, 0.0, demand)
+        wanted = active_demand.sum(axis=1)
+        sold = np.minimum(pool, wanted)
+        sold_units = active_demand * nrp_engine._safe_divide(sold, wanted, 0)[:, None]
+        cross_border = local_share == 0
+        week_oor = oor_cost * np.where(cross_border, sold_units, 0.0).sum(axis=1)
+        week_cp = (sold_units * cppu).sum(axis=1) - week_oor
+        pool -= sold
+
+        short = (sold < wanted) & np.isnan(stockout_week)
+        stockout_week[short] = week
+        week_lost = demand.sum(axis=1) - sold
+        cp += week_cp
+        oor += week_oor
+        units += sold
+        lost += week_lost
+        weeks_off += turned_off
+
+        totals["cp"][week] = week_cp.sum()
+        totals["oor_cost"][week] = week_oor.sum()
+        totals["units"][week] = sold.sum()
+        totals["lost_units"][week] = week_lost.sum()
+        totals["stock"][week] = pool.sum()
+        totals["mps_off"][week] = turned_off.sum()
+        if keep_weekly:
+            asin_weekly_cp[:, week] = week_cp
+            asin_weekly_stock[:, week] = pool
+
+    return RollingResult(
+        policy=policy,
+        weekly_cp=totals["cp"],
+        weekly_oor_cost=totals["oor_cost"],
+        weekly_units=totals["units"],
+        weekly_lost_units=totals["lost_units"],
+        weekly_stock=totals["stock"],
+        weekly_mps_off=totals["mps_off"],
+        cp=cp,
+        oor_cost=oor,
+        units=units,
+        lost_units=lost,
+        stockout_week=stockout_week,
+        arrival_week=arrival,
+        weeks_off=weeks_off,
+        asin_weekly_cp=asin_weekly_cp,
+        asin_weekly_stock=asin_weekly_stock,
+    )
+
+
+def rolling_frame(asin, marketplace, result, asin_idx, mp_idx):
+    """Per ASIN x marketplace rows; ASIN-level totals are repeated."""
+    return pd.DataFrame({
+        "asin": asin,
+        "marketplace": marketplace,
+        "weeks_off": result.weeks_off[asin_idx, mp_idx],
+        "cp": result.cp[asin_idx],
+        "oor_cost": result.oor_cost[asin_idx],
+        "units": result.units[asin_idx],
+        "lost_units": result.lost_units[asin_idx],
+        "stockout_week": result.stockout_week[asin_idx],
+        "arrival_week": result.arrival_week[asin_idx],
+    })
+
+
+def weekly_frame(results):
+    """Catalog totals per week, one column group per policy result."""
+    df = pd.DataFrame({"week": np.arange(1, results[0].weeks + 1)})
+    for result in results:
+        for name in ("cp", "oor_cost", "units", "lost_units", "stock", "mps_off"):
+            df[f"{result.policy}_{name}"] = getattr(result, f"weekly_{name}")
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Week-by-week NRP simulation of a catalog file.")
+    parser.add_argument("input", help="Catalog CSV/Parquet with columns " + ", ".join(nrp_batch.INPUT_COLUMNS))
+    parser.add_argument("output", help="Per ASIN x MP result CSV/Parquet path (the --policy run)")
+    parser.add_argument("--weeks", type=int, default=MAX_WEEKS, help=f"Horizon ({MIN_WEEKS}-{MAX_WEEKS} weeks)")
+    parser.add_argument("--policy", choices=POLICIES, default="rolling", help="Turn-off policy")
+    parser.add_argument("--po-cover-weeks", type=float, default=DEFAULT_PO_COVER_WEEKS,
+                        help="PO size in weeks of EU forecast")
+    parser.add_argument("--weekly", help="Also write catalog totals per week of every policy to this CSV")
+    parser.add_argument("--chunk-rows", type=int, default=nrp_batch.DEFAULT_CHUNK_ROWS,
+                        help="Catalog rows read per chunk")
+    nrp_batch.add_model_arguments(parser)
+    args = parser.parse_args(argv)
+
+    policies = list(POLICIES) if args.weekly else [args.policy]
+    weekly = {policy: None for policy in policies}
+    start = time.perf_counter()
+    asin_count = 0
+    with nrp_batch.ResultWriter(args.output) as writer:
+        for df in nrp_batch.asin_chunks(nrp_batch.read_chunks(args.input, args.chunk_rows)):
+            asins, records, po_status, lead_time, po_arrival, asin_idx, mp_idx = nrp_batch.pivot_chunk(
+                df, args.marketplaces
+            )
+            horizon = nrp_batch.pivot_horizon(df, records.shape, asin_idx, mp_idx)
+            for policy in policies:
+                result = simulate(
+                    records, po_status, lead_time, po_arrival, args.oor_cost, args.max_woc, args.weeks, policy,
+                    po_cover_weeks=args.po_cover_weeks, horizon=horizon, mode=args.mode,
+                )
+                if policy == args.policy:
+                    writer.write(rolling_frame(
+                        df["asin"].to_numpy(), df["marketplace"].to_numpy(), result, asin_idx, mp_idx
+                    ))
+                if weekly[policy] is None:
+                    weekly[policy] = result
+                else:
+                    for name in ("cp", "oor_cost", "units", "lost_units", "stock", "mps_off"):
+                        totals = getattr(weekly[policy], f"weekly_{name}")
+                        totals += getattr(result, f"weekly_{name}")
+            asin_count += len(asins)
+    seconds = time.perf_counter() - start
+    print(f"{asin_count:,} ASINs x {args.weeks} weeks x {len(policies)} policies in {seconds:.1f}s")
+    for policy, result in weekly.items():
+        if result is not None:
+            print(f"  {policy:>8}: CP ${result.weekly_cp.sum():,.0f}, OOR cost ${result.weekly_oor_cost.sum():,.0f}, "
+                  f"{result.weekly_lost_units.sum():,.0f} units of demand lost")
+    if args.weekly:
+        weekly_frame([result for result in weekly.values() if result is not None]).to_csv(args.weekly, index=False)
+        print(f"Weekly totals written to {args.weekly}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Saved scenarios: calculator inputs with their results, for side-by-side comparison.
+
+A scenario is one input tuple of the calculator (see nrp_app) with the
+compute() results (engine result, greedy comparison, CP breakdown) and the
+result figures. Scenarios are stored once per content hash of their inputs
+(scenario_key), so saving the same inputs under two names, or from two
+sessions, keeps one copy, and a later session with identical inputs reads
+the stored results instead of recomputing them.
+
+The store is one SQLite database shared by every session of a server. It is
+bounded in entries and bytes: the least recently used scenarios are evicted
+first, those without a name before named ones. Payloads are pickles written
+by the app itself; do not point the store at an untrusted file.
+
+    python nrp_scenarios.py list
+    python nrp_scenarios.py compare "Incoming PO" "EoL"
+    python nrp_scenarios.py delete "EoL"
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import nrp_engine
+
+# Bumped when the stored results change shape; part of every key
+SCENARIO_VERSION = 1
+
+DEFAULT_PATH = os.environ.get("NRP_SCENARIO_DB", os.path.join(os.path.expanduser("~"), ".nrp_scenarios.db"))
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_BYTES = 256 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    key TEXT PRIMARY KEY,
+    inputs TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    bytes INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scenarios_used ON scenarios (used_at);
+CREATE TABLE IF NOT EXISTS names (
+    name TEXT PRIMARY KEY,
+    key TEXT NOT NULL REFERENCES scenarios (key) ON DELETE CASCADE,
+    saved_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS names_key ON names (key);
+"""
+
+# Input tuple fields (nrp_app current_inputs order)
+INPUT_FIELDS = ("po_status", "po_arrival", "lead_time", "oor_cost", "max_woc", "search_mode", "marketplaces",
+                "mp_rows", "seasonality")
+
+
+def scenario_key(inputs):
+    """Content hash of an input tuple (hex)."""
+    text = json.dumps([SCENARIO_VERSION, list(inputs)], separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@dataclass
+class Scenario:
+    """Inputs, compute() results and result figures of one calculation."""
+    inputs: tuple
+    results: tuple  # (mp_inputs, result, greedy, breakdown)
+    figures: dict = field(default=None)
+    key: str = field(default=None)
+
+    def __post_init__(self):
+        self.inputs = tuple(self.inputs)
+        if self.key is None:
+            self.key = scenario_key(self.inputs)
+
+    @property
+    def params(self):
+        return dict(zip(INPUT_FIELDS, self.inputs))
+
+
+def summary(scenario):
+    """Headline inputs and metrics of a scenario as a dict (one comparison column)."""
+    params = scenario.params
+    _, result, _, _ = scenario.results
+    marketplaces = list(params["marketplaces"])
+    turned_off = [mp for mp, code in zip(marketplaces, result.decision[0]) if code == nrp_engine.TURN_OFF]
+    t_arrival = result.t_arrival[0]
+    return {
+        "PO Status": params["po_status"],
+        "PO Arrival (weeks)": params["po_arrival"],
+        "Lead Time (days)": params["lead_time"],
+        "OOR Cost ($)": params["oor_cost"],
+        "Max Healthy WoC": params["max_woc"],
+        "Search": params["search_mode"],
+        "Stock Arrival (weeks)": "Never (EoL)" if t_arrival >= nrp_engine.NEVER else round(float(t_arrival), 2),
+        "WoC Before": round(float(result.woc_eu[0]), 2),
+        "WoC After": round(float(result.final_woc[0]), 2),
+        "CP Before ($)": round(float(result.cp_before[0]), 2),
+        "CP After ($)": round(float(result.cp_after[0]), 2),
+        "CP Improvement ($)": round(float(result.cp_after[0] - result.cp_before[0]), 2),
+        "CBF Units Before": round(float(result.cbf_units_before[0]), 1),
+        "CBF Units After": round(float(result.cbf_units_after[0]), 1),
+        "Turned Off": ", ".join(turned_off) or "None",
+    }
+
+
+def compare(scenarios):
+    """Metrics (rows) of named scenarios (columns); scenarios: {name: Scenario}."""
+    return pd.DataFrame({name: summary(scenario) for name, scenario in scenarios.items()}).astype(str)
+
+
+def decision_grid(scenarios):
+    """Decision of every marketplace (rows) in every named scenario (columns)."""
+    columns = {}
+    for name, scenario in scenarios.items():
+        _, result, _, _ = scenario.results
+        marketplaces = list(scenario.params["marketplaces"])
+        columns[name] = pd.Series(np.asarray(nrp_engine.DECISIONS)[result.decision[0]], index=marketplaces)
+    return pd.DataFrame(columns).fillna("")
+
+
+class ScenarioStore:
+    """Bounded SQLite store of scenarios by content hash, with names.
+
+    Safe to share between the threads of a server (one connection behind a lock).
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, key):
+        """The scenario stored under a content hash, or None. Marks it used."""
+        with self._lock, self.db:
+            row = self.db.execute("SELECT payload FROM scenarios WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE scenarios SET used_at = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, scenario):
+        """Store a scenario unless its inputs are already stored. Returns True if it was new."""
+        with self._lock, self.db:
+            return self._put(scenario)
+
+    def _put(self, scenario):
+        now = time.time()
+        if self.db.execute("UPDATE scenarios SET used_at = ? WHERE key = ?", (now, scenario.key)).rowcount:
+            return False
+        payload = pickle.dumps(scenario, protocol=pickle.HIGHEST_PROTOCOL)
+        self.db.execute(
+            "INSERT INTO scenarios (key, inputs, payload, bytes, created_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (scenario.key, json.dumps(list(scenario.inputs)), payload, len(payload),
+             datetime.datetime.now().isoformat(timespec="seconds"), now),
+        )
+        self._evict(keep=scenario.key)
+        return True
+
+    def _evict(self, keep):
+        # Least recently used first, scenarios without a name before named ones
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM scenarios").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        candidates = self.db.execute(
+            "SELECT key, bytes FROM scenarios s WHERE key != ? "
+            "ORDER BY EXISTS (SELECT 1 FROM names n WHERE n.key = s.key), used_at",
+            (keep,),
+        )
+        evict = []
+        for key, size in candidates:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evict.append((key,))
+            count -= 1
+            total -= size
+        self.db.executemany("DELETE FROM scenarios WHERE key = ?", evict)
+
+    def save(self, name, scenario):
+        """Store a scenario under a name (replacing the name's previous scenario).
+
+        Returns the names the same inputs were already saved under (empty if new).
+        """
+        with self._lock, self.db:
+            self._put(scenario)
+            aliases = [row[0] for row in self.db.execute(
+                "SELECT name FROM names WHERE key = ? AND name != ? ORDER BY saved_at", (scenario.key, name)
+            )]
+            self.db.execute(
+                "INSERT OR REPLACE INTO names (name, key, saved_at) VALUES (?, ?, ?)",
+                (name, scenario.key, datetime.datetime.now().isoformat(timespec="seconds")),
+            )
+        return aliases
+
+    def load(self, name):
+        """The scenario saved under a name; raises KeyError if there is none."""
+        row = self.db.execute("SELECT key FROM names WHERE name = ?", (name,)).fetchone()
+        scenario = self.get(row[0]) if row is not None else None
+        if scenario is None:
+            raise KeyError(f"No scenario named {name!r} in {self.path}")
+        return scenario
+
+    def delete(self, name):
+        """Remove a name; the scenario goes with its last name."""
+        with self._lock, self.db:
+            row = self.db.execute("DELETE FROM names WHERE name = ? RETURNING key", (name,)).fetchone()
+            if row is not None:
+                self.db.execute(
+                    "DELETE FROM scenarios WHERE key = ? AND NOT EXISTS (SELECT 1 FROM names WHERE key = ?)",
+                    (row[0], row[0]),
+                )
+        return row is not None
+
+    def names(self):
+        """Saved names, newest first: name, key, saved_at and the scenario's size."""
+        return pd.read_sql_query(
+            "SELECT n.name, n.key, n.saved_at, s.bytes FROM names n JOIN scenarios s USING (key) "
+            "ORDER BY n.saved_at DESC, n.name",
+            self.db,
+        )
+
+    def stats(self):
+        """Stored scenarios and bytes."""
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM scenarios").fetchone()
+        return {"scenarios": count, "bytes": total}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Saved NRP calculator scenarios.")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="Scenario SQLite database (default: NRP_SCENARIO_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List saved scenarios")
+    compare_parser = commands.add_parser("compare", help="Compare saved scenarios side by side")
+    compare_parser.add_argument("names", nargs="+")
+    delete = commands.add_parser("delete", help="Delete a saved scenario name")
+    delete.add_argument("name")
+    args = parser.parse_args(argv)
+
+    with ScenarioStore(args.db) as store:
+        if args.command == "list":
+            names = store.names()
+            stats = store.stats()
+            print(names.to_string(index=False) if len(names) else "No saved scenarios")
+            print(f"{stats['scenarios']} stored scenarios, {stats['bytes'] / 1e6:.1f} MB in {args.db}")
+        elif args.command == "compare":
+            scenarios = {name: store.load(name) for name in args.names}
+            print(compare(scenarios).to_string())
+            print()
+            print(decision_grid(scenarios).to_string())
+        else:
+            print(f"Deleted {args.name}" if store.delete(args.name) else f"No scenario named {args.name!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""HTTP decision service.
+
+Serves the NRP decision logic over HTTP/1.1 (asyncio, standard library
+only). Concurrent requests are coalesced into micro-batches: a batch is
+evaluated in one vectorized engine call once it holds max_batch_size ASINs
+or max_wait has passed since its first request.
+
+    python nrp_service.py --port 8080 --max-batch-size 512 --max-wait-ms 2
+
+Endpoints (JSON):
+
+- ``POST /decide``: one ASIN, e.g. ``{"asin": "B0001", "po_status": "Incoming
+  PO", "lead_time": 14, "po_arrival": 8, "marketplaces": {"DE": {"stock": 120,
+  "forecast": 30, "cppu": 3.0}, "ES": {"stock": 0, "forecast": 15, "cppu":
+  2.0}}}``; ``oor_cost`` and ``max_woc`` default to the server settings
+- ``POST /decide/bulk``: a list of such objects, answered in order
+- ``GET /stats``: request count, batch sizes and latency percentiles
+- ``GET /health``
+
+Latency target: P99_TARGET_MS at the default batching settings, checked with
+``nrp_loadtest.py`` against a local instance.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import numpy as np
+
+import nrp_engine
+
+DEFAULT_MAX_BATCH_SIZE = 512
+DEFAULT_MAX_WAIT_MS = 2.0
+
+# Service-level objective for POST /decide, end to end on the server (ms)
+P99_TARGET_MS = 25.0
+
+# Requests kept for the latency percentiles in /stats
+LATENCY_WINDOW = 10_000
+
+MAX_BODY_BYTES = 16 << 20
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+def _po_status_code(value):
+    # PO status label or code -> code (scalar version of nrp_batch.po_status_codes)
+    if isinstance(value, str):
+        if value not in nrp_engine.PO_STATUSES:
+            raise ValueError(f"Unknown PO status {value!r}")
+        return nrp_engine.PO_STATUSES.index(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < len(nrp_engine.PO_STATUSES):
+        raise ValueError(f"Unknown PO status {value!r}")
+    return value
+
+
+def parse_item(item, marketplaces, oor_cost, max_woc):
+    """Validate one request object. Returns (asin, mp_inputs, per-ASIN parameters)."""
+    if not isinstance(item, dict):
+        raise ValueError("Expected a JSON object per ASIN")
+    mp_inputs = item.get("marketplaces")
+    if not isinstance(mp_inputs, dict) or not mp_inputs:
+        raise ValueError("'marketplaces' must map marketplace codes to {stock, forecast, cppu}")
+    unknown = [mp for mp in mp_inputs if mp not in marketplaces]
+    if unknown:
+        raise ValueError(f"Unknown marketplace {unknown[0]!r}, expected some of {marketplaces}")
+    try:
+        rows = {mp: (float(v["stock"]), float(v["forecast"]), float(v["cppu"])) for mp, v in mp_inputs.items()}
+        params = (
+            _po_status_code(item["po_status"]),
+            float(item.get("lead_time", 0)),
+            float(item.get("po_arrival", 0)),
+            float(item.get("oor_cost", oor_cost)),
+            float(item.get("max_woc", max_woc)),
+        )
+    except (KeyError, TypeError) as exc:
+        raise ValueError(f"Invalid request: missing or malformed {exc}")
+    return item.get("asin"), rows, params
+
+
+def evaluate_items(items, mode="greedy"):
+    """Evaluate parsed items in one engine call; returns one response dict per item."""
+    used = {mp for _, rows, _ in items for mp in rows}
+    marketplaces = [mp for mp in nrp_engine.MARKETPLACES if mp in used]
+    position = {mp: i for i, mp in enumerate(marketplaces)}
+    records = nrp_engine.marketplace_inputs(len(items), len(marketplaces))
+    for i, (_, rows, _) in enumerate(items):
+        for mp, values in rows.items():
+            records[i, position[mp]] = values
+    po_status, lead_time, po_arrival, oor_cost, max_woc = (np.array(p) for p in zip(*(p for _, _, p in items)))
+    result = nrp_engine.evaluate_records(records, po_status, lead_time, po_arrival, oor_cost, max_woc, mode)
+
+    decisions = np.asarray(nrp_engine.DECISIONS)[result.decision].tolist()
+    responses = []
+    for i, (asin, rows, _) in enumerate(items):
+        responses.append({
+            "asin": asin,
+            "decisions": {mp: decisions[i][position[mp]] for mp in rows},
+            "turned_off": [mp for mp in rows if decisions[i][position[mp]] == "TURN_OFF"],
+            "woc_eu": float(result.woc_eu[i]),
+            "final_woc": float(result.final_woc[i]),
+            "t_arrival": float(result.t_arrival[i]),
+            "cp_before": float(result.cp_before[i]),
+            "cp_after": float(result.cp_after[i]),
+        })
+    return responses
+
+
+class MicroBatcher:
+    """Coalesces concurrently submitted items into batched evaluate() calls."""
+
+    def __init__(self, evaluate, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT_MS / 1000):
+        self.evaluate = evaluate
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue = asyncio.Queue()
+
+    async def submit(self, items):
+        """Evaluate a list of items; resolves once their batch(es) are done."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self._queue.put_nowait((item, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+            try:
+                results = await loop.run_in_executor(None, self.evaluate, [item for item, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+
+
+class DecisionService:
+    """HTTP front end: request parsing, routing and latency statistics."""
+
+    def __init__(self, oor_cost, max_woc, mode="greedy", marketplaces=None,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT_MS / 1000):
+        self.oor_cost = oor_cost
+        self.max_woc = max_woc
+        self.marketplaces = list(marketplaces or nrp_engine.MARKETPLACES)
+        self.batcher = MicroBatcher(lambda items: evaluate_items(items, mode), max_batch_size, max_wait)
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        percentiles = (
+            dict(zip(("p50_ms", "p90_ms", "p99_ms"), np.percentile(latencies, [50, 90, 99]).tolist()))
+            if len(latencies) else {}
+        )
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.batcher.batches,
+            "mean_batch_size": self.batcher.items / self.batcher.batches if self.batcher.batches else 0.0,
+            **percentiles,
+            "max_ms": float(latencies.max()) if len(latencies) else None,
+            "p99_target_ms": P99_TARGET_MS,
+        }
+
+    async def route(self, method, path, body):
+        """Returns (status, JSON-serializable payload)."""
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/stats":
+            return 200, self.stats()
+        if path not in ("/decide", "/decide/bulk"):
+            return 404, {"error": f"Unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": "Use POST"}
+        try:
+            payload = json.loads(body)
+            bulk = path == "/decide/bulk"
+            if bulk and not isinstance(payload, list):
+                raise ValueError("Expected a JSON list of ASIN objects")
+            items = [parse_item(item, self.marketplaces, self.oor_cost, self.max_woc)
+                     for item in (payload if bulk else [payload])]
+        except ValueError as exc:  # includes json.JSONDecodeError
+            return 400, {"error": str(exc)}
+        responses = await self.batcher.submit(items)
+        return 200, responses if bulk else responses[0]
+
+    async def handle(self, reader, writer):
+        # One keep-alive HTTP/1.1 connection
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": f"Body larger than {MAX_BODY_BYTES} bytes"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, payload = await self.route(method, path.split("?")[0], body)
+                    except Exception as exc:
+                        status, payload = 500, {"error": repr(exc)}
+                    keep_alive = (headers.get("connection", "").lower() != "close"
+                                  and version.upper() == "HTTP/1.1")
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    .encode() + data
+                )
+                await writer.drain()
+                if path.startswith("/decide"):
+                    self.requests += 1
+                    self.errors += status != 200
+                    self.latencies.append(time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        batcher = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving NRP decisions on http://{host}:{port} "
+              f"(max batch {self.batcher.max_batch_size}, max wait {self.batcher.max_wait * 1000:g} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve NRP decisions over HTTP with request micro-batching.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="ASINs per vectorized evaluation")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="Longest wait for a batch to fill after its first request")
+    import nrp_batch  # pulls in pandas, which the service itself does not need
+    nrp_batch.add_model_arguments(parser)
+    args = parser.parse_args(argv)
+
+    service = DecisionService(args.oor_cost, args.max_woc, args.mode, args.marketplaces,
+                              args.max_batch_size, args.max_wait_ms / 1000)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
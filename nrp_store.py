@@ -0,0 +1,282 @@
+"""Compact, memory-mapped catalog store.
+
+A catalog converted once into a directory of raw column files plus a
+``store.json`` manifest. Every column is a flat NumPy array opened with
+``np.memmap``, so opening a store of tens of millions of ASIN x marketplace
+rows reads nothing up front, slices are views of the files, and decisions
+are written back into the same files in place.
+
+Per ASIN x marketplace (n_asins, n_marketplaces) columns are stock (int32),
+forecast and cppu (float32), decision (uint8 code) and checks (uint8, one bit
+per check, see pack_checks); per ASIN columns are asin (fixed-width bytes),
+po_status (uint8), lead_time, po_arrival and the float32 result metrics.
+That is 14 bytes per ASIN x marketplace instead of 24 for MARKETPLACE_DTYPE.
+Forecast and CPPU are stored at float32 precision and rounded back to
+INPUT_DECIMALS decimals when read, so decimal inputs (cents, fractional
+forecasts) evaluate exactly as from the catalog file.
+
+    python nrp_store.py build catalog.csv catalog.nrp
+    python nrp_store.py evaluate catalog.nrp --oor-cost 1.5 --max-woc 7
+    python nrp_store.py info catalog.nrp
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import nrp_engine
+
+MANIFEST = "store.json"
+STORE_VERSION = 1
+
+# Longest ASIN identifier the store holds
+ASIN_WIDTH = 16
+
+# name -> (dtype, per marketplace); files are <name>.bin
+COLUMNS = {
+    "asin": (f"S{ASIN_WIDTH}", False),
+    "po_status": ("u1", False),
+    "lead_time": ("<f4", False),
+    "po_arrival": ("<f4", False),
+    "stock": ("<i4", True),
+    "forecast": ("<f4", True),
+    "cppu": ("<f4", True),
+    "decision": ("u1", True),
+    "checks": ("u1", True),
+    "final_woc": ("<f4", False),
+    "cp_before": ("<f4", False),
+    "cp_after": ("<f4", False),
+}
+
+# Bits of the checks column
+CHECK_CPPU = 1
+CHECK_WOC_HEALTH = 2
+CHECK_DEPLETION = 4
+
+# Decimals of the float32 forecast/CPPU values restored on read
+INPUT_DECIMALS = 4
+
+# ASINs per engine call in CatalogStore.evaluate()
+DEFAULT_SLICE_ASINS = 1 << 20
+
+
+def _write_manifest(path, manifest):
+    # Written to a temporary file, renamed and the directory synced: a crash
+    # never leaves a truncated manifest
+    target = os.path.join(path, MANIFEST)
+    tmp = target + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, target)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def pack_checks(pass_cppu, pass_woc_health, pass_depletion):
+    """Check results as one uint8 bit field per ASIN x marketplace."""
+    return (
+        np.asarray(pass_cppu, dtype=np.uint8) * CHECK_CPPU
+        | np.asarray(pass_woc_health, dtype=np.uint8) * CHECK_WOC_HEALTH
+        | np.asarray(pass_depletion, dtype=np.uint8) * CHECK_DEPLETION
+    ).astype(np.uint8)
+
+
+def unpack_checks(checks):
+    """Inverse of pack_checks(): (pass_cppu, pass_woc_health, pass_depletion)."""
+    return tuple((checks & bit) != 0 for bit in (CHECK_CPPU, CHECK_WOC_HEALTH, CHECK_DEPLETION))
+
+
+class CatalogStore:
+    """Memory-mapped columns of a catalog and its latest decisions.
+
+    Columns are attributes (store.stock, store.decision, ...); slicing them
+    reads only the pages touched.
+    """
+
+    def __init__(self, path, manifest, columns):
+        self.path = path
+        self.manifest = manifest
+        self.marketplaces = manifest["marketplaces"]
+        self.columns = columns
+        for name, array in columns.items():
+            setattr(self, name, array)
+
+    def __len__(self):
+        return self.manifest["n_asins"]
+
+    @staticmethod
+    def _shape(name, n_asins, n_marketplaces):
+        return (n_asins, n_marketplaces) if COLUMNS[name][1] else (n_asins,)
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """Open an existing store; mode "r+" allows writing results back."""
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported catalog store version {manifest.get('version')!r} in {path}")
+        n, m = manifest["n_asins"], len(manifest["marketplaces"])
+        columns = {}
+        for name, (dtype, _) in COLUMNS.items():
+            shape = cls._shape(name, n, m)
+            # np.memmap cannot map empty files
+            columns[name] = (
+                np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode=mode, shape=shape)
+                if n else np.zeros(shape, dtype=dtype)
+            )
+        return cls(path, manifest, columns)
+
+    @classmethod
+    def build(cls, path, parts, marketplaces):
+        """Write a new store from an iterable of input parts and open it read-write.
+
+        parts: (asins, records, po_status, lead_time, po_arrival) tuples as
+        returned by the first five items of nrp_batch.pivot_chunk(), written
+        one after the other, so the whole catalog is never in memory.
+        Raises ValueError for stock that is not a whole number of units.
+        """
+        os.makedirs(path, exist_ok=True)
+        marketplaces = list(marketplaces)
+        m = len(marketplaces)
+        files = {name: open(os.path.join(path, f"{name}.bin"), "wb") for name in COLUMNS}
+        n = 0
+        try:
+            for asins, records, po_status, lead_time, po_arrival in parts:
+                asins = np.asarray(asins, dtype=str)
+                if len(asins) and max(map(len, asins)) > ASIN_WIDTH:
+                    raise ValueError(f"ASIN identifiers longer than {ASIN_WIDTH} characters are not supported")
+                k = len(asins)
+                fractional = records["stock"] != np.rint(records["stock"])
+                if fractional.any():
+                    row, mp = np.argwhere(fractional)[0]
+                    raise ValueError(f"Stock must be whole units, got {float(records['stock'][row, mp])!r} "
+                                     f"for ASIN {str(asins[row])!r} in marketplace {marketplaces[mp]!r}")
+                chunk = {
+                    "asin": np.char.encode(asins, "ascii"),
+                    "po_status": po_status,
+                    "lead_time": lead_time,
+                    "po_arrival": po_arrival,
+                    "stock": records["stock"],
+                    "forecast": records["forecast"],
+                    "cppu": records["cppu"],
+                }
+                for name, (dtype, _) in COLUMNS.items():
+                    values = chunk.get(name)
+                    if values is None:
+                        values = np.zeros(cls._shape(name, k, m), dtype=dtype)
+                    files[name].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+                n += k
+        finally:
+            for f in files.values():
+                f.close()
+        manifest = {"version": STORE_VERSION, "n_asins": n, "marketplaces": marketplaces, "evaluated": None}
+        _write_manifest(path, manifest)
+        return cls.open(path, "r+")
+
+    @classmethod
+    def from_catalog(cls, catalog_path, path, marketplaces=None, chunk_rows=None):
+        """Build a store from a CSV/Parquet catalog file (see nrp_batch.INPUT_COLUMNS).
+
+        Forecast horizon columns are not stored.
+        """
+        import nrp_batch
+        marketplaces = list(marketplaces or nrp_engine.MARKETPLACES)
+        chunks = nrp_batch.asin_chunks(
+            nrp_batch.read_chunks(catalog_path, chunk_rows or nrp_batch.DEFAULT_CHUNK_ROWS)
+        )
+        parts = (nrp_batch.pivot_chunk(df, marketplaces)[:5] for df in chunks)
+        return cls.build(path, parts, marketplaces)
+
+    def inputs(self, rows=slice(None)):
+        """Engine inputs of a slice of ASINs: (stock, forecast, cppu, po_status, lead_time, po_arrival).
+
+        The slice is read from the mapped files; float32 columns are widened
+        to float64 and rounded to INPUT_DECIMALS.
+        """
+        def widen(column):
+            return column[rows].astype(np.float64).round(INPUT_DECIMALS)
+
+        return (self.stock[rows], widen(self.forecast), widen(self.cppu),
+                self.po_status[rows], widen(self.lead_time), widen(self.po_arrival))
+
+    def evaluate(self, oor_cost, max_woc, mode="greedy", slice_asins=DEFAULT_SLICE_ASINS, progress=None):
+        """Evaluate every ASIN slice by slice and write the results back in place.
+
+        Needs a store opened with mode "r+". progress: optional callable
+        receiving the number of ASINs done after every slice. Returns the
+        number of MPs turned off.
+        """
+        turned_off = 0
+        for start in range(0, len(self), slice_asins):
+            rows = slice(start, min(start + slice_asins, len(self)))
+            result = nrp_engine.evaluate(*self.inputs(rows), oor_cost, max_woc, mode)
+            self.decision[rows] = result.decision
+            self.checks[rows] = pack_checks(result.pass_cppu, result.pass_woc_health, result.pass_depletion)
+            self.final_woc[rows] = result.final_woc
+            self.cp_before[rows] = result.cp_before
+            self.cp_after[rows] = result.cp_after
+            turned_off += int((result.decision == nrp_engine.TURN_OFF).sum())
+            if progress is not None:
+                progress(rows.stop)
+        self.flush()
+        self.manifest["evaluated"] = {"oor_cost": oor_cost, "max_woc": max_woc, "mode": mode,
+                                      "turned_off": turned_off}
+        _write_manifest(self.path, self.manifest)
+        return turned_off
+
+    def flush(self):
+        for array in self.columns.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def nbytes(self):
+        """Size of all column files in bytes."""
+        return sum(array.nbytes for array in self.columns.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact memory-mapped NRP catalog store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Convert a CSV/Parquet catalog into a store")
+    build.add_argument("input", help="Catalog CSV/Parquet")
+    build.add_argument("store", help="Store directory")
+    build.add_argument("--chunk-rows", type=int, help="Catalog rows read per chunk")
+    build.add_argument("--marketplaces", type=lambda s: s.split(","), default=list(nrp_engine.MARKETPLACES),
+                       help="Comma-separated marketplace codes (default: all known)")
+    evaluate = commands.add_parser("evaluate", help="Evaluate a store and write decisions back in place")
+    evaluate.add_argument("store", help="Store directory")
+    evaluate.add_argument("--oor-cost", type=float, default=1.50, help="OOR cost per unit ($)")
+    evaluate.add_argument("--max-woc", type=float, default=7, help="Max healthy WoC (weeks)")
+    evaluate.add_argument("--mode", choices=nrp_engine.MODES, default="greedy", help="Turn-off search")
+    evaluate.add_argument("--slice-asins", type=int, default=DEFAULT_SLICE_ASINS, help="ASINs per engine call")
+    info = commands.add_parser("info", help="Describe a store")
+    info.add_argument("store", help="Store directory")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == "build":
+        store = CatalogStore.from_catalog(args.input, args.store, args.marketplaces, args.chunk_rows)
+        print(f"{len(store):,} ASINs x {len(store.marketplaces)} MPs written to {args.store} "
+              f"({store.nbytes() / 2**20:,.1f} MB) in {time.perf_counter() - start:.1f}s")
+    elif args.command == "evaluate":
+        store = CatalogStore.open(args.store, "r+")
+        turned_off = store.evaluate(args.oor_cost, args.max_woc, args.mode, args.slice_asins)
+        seconds = time.perf_counter() - start
+        print(f"{len(store):,} ASINs evaluated in {seconds:.1f}s "
+              f"({len(store) / seconds if seconds > 0 else 0:,.0f} ASINs/sec), {turned_off:,} MPs turned off")
+    else:
+        store = CatalogStore.open(args.store)
+        print(f"{args.store}: {len(store):,} ASINs x {len(store.marketplaces)} MPs "
+              f"({', '.join(store.marketplaces)}), {store.nbytes() / 2**20:,.1f} MB")
+        print(f"last evaluation: {store.manifest['evaluated'] or 'never'}")
+
+
+if __name__ == "__main__":
+    main()
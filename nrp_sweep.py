@@ -0,0 +1,158 @@
+"""Parameter sensitivity sweeps.
+
+Evaluates the NRP decision logic over a grid of global parameters (OOR cost,
+max WoC, lead time, PO arrival) in one vectorized engine call: every ASIN is
+repeated once per grid point and the grid values become per-ASIN parameters.
+
+    python nrp_sweep.py catalog.csv sweep.csv --grid oor_cost=0:3:31 --grid max_woc=2:14:13
+"""
+import argparse
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import nrp_batch
+import nrp_engine
+
+# Parameters that can be swept (evaluate() keyword arguments)
+SWEEP_PARAMS = ("oor_cost", "max_woc", "lead_time", "po_arrival")
+
+# Max ASIN x grid point rows per engine call
+SWEEP_BLOCK = 1 << 20
+
+
+@dataclass
+class SweepResult:
+    """Sweep output; per-ASIN fields are shaped (n_asins, *grid_shape)."""
+    names: list  # swept parameter names, one per grid axis
+    values: list  # grid values, one 1-D array per axis
+    decision: np.ndarray  # (n_asins, *grid_shape, n_marketplaces)
+    n_turned_off: np.ndarray
+    final_woc: np.ndarray
+    cp_before: np.ndarray
+    cp_after: np.ndarray
+
+    @property
+    def cp_improvement(self):
+        return self.cp_after - self.cp_before
+
+
+def sweep(records, po_status, grid, mode="greedy", **params):
+    """Evaluate records (n_asins, n_marketplaces) at every point of a grid.
+
+    grid: {parameter: 1-D values} for parameters in SWEEP_PARAMS; the axes
+    follow the dict order. params: the remaining evaluate() parameters
+    (scalars or per-ASIN arrays).
+    """
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"Cannot sweep {sorted(unknown)}, expected some of {SWEEP_PARAMS}")
+    missing = set(SWEEP_PARAMS) - set(grid) - set(params)
+    if missing:
+        raise TypeError(f"Missing parameters {sorted(missing)}")
+
+    names = list(grid)
+    values = [np.asarray(v, dtype=np.float64).ravel() for v in grid.values()]
+    grid_shape = tuple(len(v) for v in values)
+    n_points = int(np.prod(grid_shape))
+    points = [axis.ravel() for axis in np.meshgrid(*values, indexing="ij")]
+
+    n, m = records.shape
+    po_status = np.broadcast_to(np.asarray(po_status), (n,))
+    fixed = {name: np.broadcast_to(np.asarray(params[name], dtype=np.float64), (n,))
+             for name in SWEEP_PARAMS if name not in grid}
+
+    decision = np.empty((n, n_points, m), dtype=np.uint8)
+    final_woc = np.empty((n, n_points))
+    cp_before = np.empty((n, n_points))
+    cp_after = np.empty((n, n_points))
+
+    # Row i * n_points + j is ASIN i at grid point j
+    step = max(1, SWEEP_BLOCK // n_points)
+    for start in range(0, n, step):
+        asins = slice(start, min(start + step, n))
+        k = asins.stop - asins.start
+        kwargs = {name: np.repeat(value[asins], n_points) for name, value in fixed.items()}
+        kwargs.update({name: np.tile(point, k) for name, point in zip(names, points)})
+        result = nrp_engine.evaluate_records(
+            np.repeat(records[asins], n_points, axis=0),
+            np.repeat(po_status[asins], n_points),
+            mode=mode,
+            **kwargs,
+        )
+        decision[asins] = result.decision.reshape(k, n_points, m)
+        final_woc[asins] = result.final_woc.reshape(k, n_points)
+        cp_before[asins] = result.cp_before.reshape(k, n_points)
+        cp_after[asins] = result.cp_after.reshape(k, n_points)
+
+    return SweepResult(
+        names=names,
+        values=values,
+        decision=decision.reshape((n,) + grid_shape + (m,)),
+        n_turned_off=(decision == nrp_engine.TURN_OFF).sum(axis=-1).reshape((n,) + grid_shape),
+        final_woc=final_woc.reshape((n,) + grid_shape),
+        cp_before=cp_before.reshape((n,) + grid_shape),
+        cp_after=cp_after.reshape((n,) + grid_shape),
+    )
+
+
+def sweep_frame(asins, marketplaces, result):
+    """Long-format sweep results: one row per ASIN x grid point."""
+    n = len(asins)
+    n_points = result.n_turned_off[0].size if n else 0
+    columns = {"asin": np.repeat(np.asarray(asins), n_points)}
+    for name, axis in zip(result.names, np.meshgrid(*result.values, indexing="ij")):
+        columns[name] = np.tile(axis.ravel(), n)
+    turned_off = result.decision.reshape(n * n_points, -1) == nrp_engine.TURN_OFF
+    for i, mp in enumerate(marketplaces):
+        columns[f"off_{mp}"] = turned_off[:, i]
+    columns["n_turned_off"] = result.n_turned_off.ravel()
+    columns["final_woc"] = result.final_woc.ravel()
+    columns["cp_before"] = result.cp_before.ravel()
+    columns["cp_after"] = result.cp_after.ravel()
+    columns["cp_improvement"] = result.cp_improvement.ravel()
+    return pd.DataFrame(columns)
+
+
+def parse_grid(spec):
+    """'name=start:stop:num' (linspace) or 'name=v1,v2,...' -> (name, values)."""
+    name, _, values = spec.partition("=")
+    if name not in SWEEP_PARAMS:
+        raise argparse.ArgumentTypeError(f"Cannot sweep {name!r}, expected one of {SWEEP_PARAMS}")
+    if ":" in values:
+        start, stop, num = values.split(":")
+        return name, np.linspace(float(start), float(stop), int(num))
+    return name, np.array([float(v) for v in values.split(",")])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep global NRP parameters over a catalog file.")
+    parser.add_argument("input", help="Catalog CSV/Parquet with columns " + ", ".join(nrp_batch.INPUT_COLUMNS))
+    parser.add_argument("output", help="Result CSV/Parquet path")
+    parser.add_argument("--grid", type=parse_grid, action="append", required=True,
+                        help="Swept parameter, e.g. oor_cost=0:3:31 or max_woc=4,7,10 (repeatable)")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="Catalog rows read per chunk")
+    nrp_batch.add_model_arguments(parser)
+    args = parser.parse_args(argv)
+    grid = dict(args.grid)
+
+    start = time.perf_counter()
+    asin_count = 0
+    with nrp_batch.ResultWriter(args.output) as writer:
+        for df in nrp_batch.asin_chunks(nrp_batch.read_chunks(args.input, args.chunk_rows)):
+            asins, records, po_status, lead_time, po_arrival, _, _ = nrp_batch.pivot_chunk(df, args.marketplaces)
+            params = {"oor_cost": args.oor_cost, "max_woc": args.max_woc,
+                      "lead_time": lead_time, "po_arrival": po_arrival}
+            params = {name: value for name, value in params.items() if name not in grid}
+            result = sweep(records, po_status, grid, mode=args.mode, **params)
+            writer.write(sweep_frame(asins, args.marketplaces, result))
+            asin_count += len(asins)
+    seconds = time.perf_counter() - start
+    points = int(np.prod([len(v) for v in grid.values()]))
+    print(f"{asin_count:,} ASINs x {points:,} grid points in {seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Opt-in per-stage timing and profiling.
+
+Functions that support it take an optional StageTimer (``timer=None``) and
+record nothing without one, so the instrumentation costs nothing unless a
+caller asks for it. Timings can be shown as a table or dumped as JSON lines
+(one object per stage run); ``profile()`` wraps a block in cProfile for
+headless runs.
+"""
+import contextlib
+import cProfile
+import json
+import time
+
+
+class StageTimer:
+    """Wall time of named stages, in the order they ran.
+
+    context: fields added to every record (e.g. the chunk being processed);
+    callers may update it between stages.
+    """
+
+    def __init__(self, **context):
+        self.context = context
+        self.records = []
+        self._lap_start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one run of stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append({"stage": name, "seconds": time.perf_counter() - start, **self.context})
+
+    def lap(self, name):
+        """Record the time since the previous lap (or creation) as stage `name`.
+
+        For top-to-bottom scripts, where wrapping every stage in a block
+        would not fit.
+        """
+        now = time.perf_counter()
+        self.records.append({"stage": name, "seconds": now - self._lap_start, **self.context})
+        self._lap_start = now
+
+    def totals(self):
+        """{stage: (calls, seconds)} summed over all runs, in first-run order."""
+        totals = {}
+        for record in self.records:
+            calls, seconds = totals.get(record["stage"], (0, 0.0))
+            totals[record["stage"]] = (calls + 1, seconds + record["seconds"])
+        return totals
+
+    def frame(self):
+        """Per-stage totals as a DataFrame (Stage, Calls, Total (ms), Share)."""
+        import pandas as pd
+        totals = self.totals()
+        total = sum(seconds for _, seconds in totals.values())
+        return pd.DataFrame({
+            "Stage": list(totals),
+            "Calls": [calls for calls, _ in totals.values()],
+            "Total (ms)": [seconds * 1000 for _, seconds in totals.values()],
+            "Share": [seconds / total if total > 0 else 0.0 for _, seconds in totals.values()],
+        })
+
+    def jsonl(self, **fields):
+        """Records as JSON lines; fields are added to every line."""
+        return "".join(json.dumps({**record, **fields}) + "\n" for record in self.records)
+
+    def write_jsonl(self, path, **fields):
+        """Append the records to a JSON lines file."""
+        with open(path, "a") as f:
+            f.write(self.jsonl(**fields))
+
+
+def stage(timer, name):
+    """timer.stage(name), or a no-op context when timer is None."""
+    return timer.stage(name) if timer is not None else contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def profile(path):
+    """cProfile the enclosed block and write the stats to path (read with pstats)."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
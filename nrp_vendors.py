@@ -0,0 +1,216 @@
+"""Vendor reference table: lead times, confirmation rates and open POs.
+
+A vendor file has one row per vendor with VENDOR_COLUMNS: lead time (days),
+confirmation rate (%) and the arrival of its open PO in weeks (empty if it
+has none). It is loaded once into per-vendor NumPy columns behind a hash
+index on the vendor ID, together with the derived PO status (from the
+confirmation rate, see nrp_engine.po_status_from_cr) and T_arrival. Joining
+a catalog chunk is then one index lookup and a take() per column, whatever
+the number of ASINs.
+
+Every vendor row also keeps a 64-bit hash of its values. refresh() re-reads
+the file and recomputes the derived columns of the vendors whose hash
+changed only; the changed vendor IDs tell callers which ASINs to re-evaluate
+(see nrp_incremental.IncrementalEvaluator.refresh_vendors).
+
+    python nrp_batch.py catalog.csv results.csv --vendors vendors.csv
+    python nrp_vendors.py vendors.csv catalog.csv po_status.csv
+"""
+import argparse
+import hashlib
+import time
+
+import numpy as np
+import pandas as pd
+
+import nrp_batch
+import nrp_engine
+
+VENDOR_COLUMNS = ["vendor_id", "lead_time", "confirmation_rate", "po_arrival"]
+
+# Catalog column joined to the vendor table
+VENDOR_ID = nrp_batch.VENDOR_ID
+
+
+def read_vendors(path):
+    """Vendor CSV/Parquet file as a DataFrame of VENDOR_COLUMNS (vendor IDs as strings)."""
+    if nrp_batch._is_parquet(path):
+        df = pd.read_parquet(path, columns=VENDOR_COLUMNS)
+    else:
+        df = pd.read_csv(path, usecols=VENDOR_COLUMNS, dtype={VENDOR_ID: str})
+    return normalize(df)
+
+
+def normalize(df):
+    """Vendor rows with string IDs and float columns; raises ValueError on duplicate IDs."""
+    df = pd.DataFrame({
+        VENDOR_ID: df[VENDOR_ID].astype(str).to_numpy(dtype=object),
+        "lead_time": df["lead_time"].to_numpy(dtype=np.float64),
+        "confirmation_rate": df["confirmation_rate"].to_numpy(dtype=np.float64),
+        "po_arrival": df["po_arrival"].to_numpy(dtype=np.float64),
+    })
+    duplicated = df[VENDOR_ID].duplicated()
+    if duplicated.any():
+        raise ValueError(f"Duplicate vendor ID {df[VENDOR_ID][duplicated].iloc[0]!r}")
+    return df
+
+
+def row_hashes(df):
+    """64-bit hash of every vendor row (ID and values)."""
+    return pd.util.hash_pandas_object(df[VENDOR_COLUMNS], index=False).to_numpy()
+
+
+class VendorTable:
+    """Per-vendor columns behind a vendor ID index.
+
+    lead_time, confirmation_rate and po_arrival are the file columns;
+    po_status (nrp_engine PO_* codes) and t_arrival (weeks) are derived.
+    """
+
+    def __init__(self, df):
+        df = normalize(df)
+        self.index = pd.Index(df[VENDOR_ID])
+        # Copies: refresh() writes into them
+        self.lead_time = df["lead_time"].to_numpy(copy=True)
+        self.confirmation_rate = df["confirmation_rate"].to_numpy(copy=True)
+        self.po_arrival = df["po_arrival"].to_numpy(copy=True)
+        self.hashes = row_hashes(df).copy()
+        self.po_status = np.empty(len(df), dtype=np.int8)
+        self.t_arrival = np.empty(len(df))
+        self._derive(slice(None))
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(read_vendors(path))
+
+    def __len__(self):
+        return len(self.index)
+
+    def _derive(self, rows):
+        self.po_status[rows] = nrp_engine.po_status_from_cr(
+            self.confirmation_rate[rows], po_open=~np.isnan(self.po_arrival[rows])
+        )
+        self.t_arrival[rows] = nrp_engine.t_arrival_weeks(
+            self.po_status[rows], self.lead_time[rows], self.po_arrival[rows]
+        )
+
+    def fingerprint(self):
+        """Hex digest of the whole table (independent of row order)."""
+        return hashlib.sha1(np.sort(self.hashes).tobytes()).hexdigest()
+
+    def lookup(self, vendor_ids):
+        """Row of every vendor ID in the table; raises ValueError for unknown IDs."""
+        vendor_ids = np.asarray(vendor_ids)
+        if vendor_ids.dtype.kind != "O":
+            vendor_ids = vendor_ids.astype(str).astype(object)
+        rows = self.index.get_indexer(vendor_ids)
+        if (rows < 0).any():
+            raise ValueError(f"Unknown vendor ID {vendor_ids[rows < 0][0]!r}")
+        return rows
+
+    def join(self, vendor_ids, po_status=None, po_arrival=None):
+        """PO status, lead time, PO arrival and T_arrival per ASIN from its vendor ID.
+
+        po_status/po_arrival: optional per-ASIN values of the catalog; ASINs
+        it marks EoL or Incoming PO keep that status (and their own PO
+        arrival), the others take their vendor's.
+        Returns (po_status, lead_time, po_arrival, t_arrival) arrays.
+        """
+        rows = self.lookup(vendor_ids)
+        status = self.po_status[rows]
+        lead_time = self.lead_time[rows]
+        arrival = self.po_arrival[rows]
+        t_arrival = self.t_arrival[rows]
+        if po_status is not None:
+            own = np.isin(po_status, (nrp_engine.PO_EOL, nrp_engine.PO_INCOMING))
+            if own.any():
+                status[own] = np.asarray(po_status)[own]
+                if po_arrival is not None:
+                    arrival[own] = np.asarray(po_arrival, dtype=np.float64)[own]
+                t_arrival[own] = nrp_engine.t_arrival_weeks(status[own], lead_time[own], arrival[own])
+        return status, lead_time, arrival, t_arrival
+
+    def refresh(self, df):
+        """Apply a new version of the vendor file (path or DataFrame). Returns the changed vendor IDs.
+
+        Vendors whose row is unchanged are left alone; changed rows are
+        overwritten in place and new vendors appended, and only those rows'
+        PO status and T_arrival are recomputed. Vendors missing from the
+        new version are dropped (and reported as changed).
+        """
+        df = read_vendors(df) if isinstance(df, str) else normalize(df)
+        hashes = row_hashes(df)
+        rows = self.index.get_indexer(df[VENDOR_ID])
+        known = rows >= 0
+        changed = ~known
+        changed[known] = self.hashes[rows[known]] != hashes[known]
+        removed = np.ones(len(self), dtype=bool)
+        removed[rows[known]] = False
+        changed_ids = pd.Index(df[VENDOR_ID][changed]).append(self.index[removed])
+
+        if removed.any():
+            keep = ~removed
+            self.index = self.index[keep]
+            for name in ("lead_time", "confirmation_rate", "po_arrival", "hashes", "po_status", "t_arrival"):
+                setattr(self, name, getattr(self, name)[keep])
+            rows = self.index.get_indexer(df[VENDOR_ID])
+        update = changed & known
+        target = rows[update]
+        self.lead_time[target] = df["lead_time"].to_numpy()[update]
+        self.confirmation_rate[target] = df["confirmation_rate"].to_numpy()[update]
+        self.po_arrival[target] = df["po_arrival"].to_numpy()[update]
+        self.hashes[target] = hashes[update]
+        self._derive(target)
+
+        added = ~known
+        if added.any():
+            start = len(self)
+            self.index = self.index.append(pd.Index(df[VENDOR_ID][added]))
+            self.lead_time = np.concatenate([self.lead_time, df["lead_time"].to_numpy()[added]])
+            self.confirmation_rate = np.concatenate([self.confirmation_rate, df["confirmation_rate"].to_numpy()[added]])
+            self.po_arrival = np.concatenate([self.po_arrival, df["po_arrival"].to_numpy()[added]])
+            self.hashes = np.concatenate([self.hashes, hashes[added]])
+            self.po_status = np.concatenate([self.po_status, np.empty(added.sum(), dtype=np.int8)])
+            self.t_arrival = np.concatenate([self.t_arrival, np.empty(added.sum())])
+            self._derive(slice(start, None))
+        return changed_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Join a catalog to its vendors' PO status and T_arrival.")
+    parser.add_argument("vendors", help="Vendor CSV/Parquet with columns " + ", ".join(VENDOR_COLUMNS))
+    parser.add_argument("catalog", help=f"Catalog CSV/Parquet with asin and {VENDOR_ID} columns")
+    parser.add_argument("output", help="Per ASIN CSV/Parquet path")
+    parser.add_argument("--chunk-rows", type=int, default=nrp_batch.DEFAULT_CHUNK_ROWS,
+                        help="Catalog rows read per chunk")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    vendors = VendorTable.from_file(args.vendors)
+    print(f"{len(vendors):,} vendors loaded in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    asins = 0
+    with nrp_batch.ResultWriter(args.output) as writer:
+        for df in nrp_batch.asin_chunks(nrp_batch.read_chunks(args.catalog, args.chunk_rows)):
+            per_asin = df.drop_duplicates("asin")
+            po_status, lead_time, po_arrival, t_arrival = vendors.join(
+                per_asin[VENDOR_ID].to_numpy(),
+                nrp_batch.po_status_codes(per_asin["po_status"]) if "po_status" in per_asin else None,
+                per_asin["po_arrival"].to_numpy(dtype=np.float64) if "po_arrival" in per_asin else None,
+            )
+            writer.write(pd.DataFrame({
+                "asin": per_asin["asin"].to_numpy(),
+                VENDOR_ID: per_asin[VENDOR_ID].to_numpy(),
+                "po_status": np.asarray(nrp_engine.PO_STATUSES)[po_status],
+                "lead_time": lead_time,
+                "po_arrival": po_arrival,
+                "t_arrival": t_arrival,
+            }))
+            asins += len(per_asin)
+    seconds = time.perf_counter() - start
+    print(f"{asins:,} ASINs joined in {seconds:.1f}s ({asins / seconds if seconds > 0 else 0:,.0f} ASINs/sec)")
+
+
+if __name__ == "__main__":
+    main()
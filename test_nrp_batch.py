@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+import nrp_batch
+from conftest import MARKETPLACES, catalog_frame
+
+
+def run(input_path, output_path, **kwargs):
+    return nrp_batch.run(input_path, output_path, 1.5, 7.0, MARKETPLACES, **kwargs)
+
+
+def test_chunking_does_not_change_the_output(catalog_csv, tmp_path):
+    whole, chunked = str(tmp_path / "whole.csv"), str(tmp_path / "chunked.csv")
+    stats = run(catalog_csv, whole)
+    chunked_stats = run(catalog_csv, chunked, chunk_rows=997)
+    assert chunked_stats["chunks"] > 1
+    assert (stats["rows"], stats["asins"], stats["turned_off"]) == (12000, 3000, chunked_stats["turned_off"])
+    pd.testing.assert_frame_equal(pd.read_csv(chunked), pd.read_csv(whole))
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_empty_catalog_gives_an_empty_result(tmp_path, suffix):
+    catalog = str(tmp_path / "empty.csv")
+    catalog_frame().iloc[:0].to_csv(catalog, index=False)
+    output = str(tmp_path / f"out{suffix}")
+    assert run(catalog, output)["rows"] == 0
+    result = pd.read_csv(output) if suffix == ".csv" else pd.read_parquet(output)
+    assert result.empty and list(result.columns) == list(nrp_batch.empty_result().columns)
+
+
+def test_all_digit_asins_keep_leading_zeros(tmp_path):
+    catalog = str(tmp_path / "isbn.csv")
+    df = catalog_frame(2)
+    df["asin"] = ["0316769487"] * 4 + ["0000000001"] * 4
+    df.to_csv(catalog, index=False)
+    output = str(tmp_path / "out.csv")
+    run(catalog, output)
+    assert pd.read_csv(output, dtype={"asin": str})["asin"].unique().tolist() == ["0316769487", "0000000001"]
+
+
+def test_duplicate_rows_are_rejected(tmp_path):
+    df = catalog_frame(2)
+    df = pd.concat([df, df.iloc[[1]]]).sort_values("asin", kind="stable")
+    with pytest.raises(ValueError, match="Duplicate rows for ASIN 'B000000000' in marketplace 'FR'"):
+        nrp_batch.evaluate_chunk(df, MARKETPLACES, 1.5, 7.0)
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_parallel_output_matches_serial(catalog_csv, tmp_path, suffix):
+    import nrp_parallel
+    serial, parallel = str(tmp_path / f"serial{suffix}"), str(tmp_path / f"parallel{suffix}")
+    run(catalog_csv, serial, chunk_rows=1500)
+    stats = nrp_parallel.run(catalog_csv, parallel, 1.5, 7.0, MARKETPLACES, chunk_rows=1500, workers=2)
+    assert stats["rows"] == 12000
+    read = pd.read_csv if suffix == ".csv" else pd.read_parquet
+    pd.testing.assert_frame_equal(read(parallel), read(serial))
@@ -0,0 +1,69 @@
+import os
+
+import pandas as pd
+import pytest
+
+import nrp_batch
+import nrp_parallel
+from conftest import MARKETPLACES
+
+CHUNK_ROWS = 1000
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(chunks):
+    def progress(stats):
+        if stats["chunks"] - stats["resumed_chunks"] >= chunks:
+            raise Interrupted
+    return progress
+
+
+@pytest.fixture
+def expected(catalog_csv, tmp_path):
+    path = str(tmp_path / "expected.csv")
+    nrp_batch.run(catalog_csv, path, 1.5, 7.0, MARKETPLACES, chunk_rows=CHUNK_ROWS)
+    return pd.read_csv(path)
+
+
+def test_interrupted_run_resumes(catalog_csv, tmp_path, expected):
+    output, checkpoint = str(tmp_path / "out.csv"), str(tmp_path / "out.ckpt")
+    kwargs = dict(chunk_rows=CHUNK_ROWS, checkpoint=checkpoint)
+    with pytest.raises(Interrupted):
+        nrp_batch.run(catalog_csv, output, 1.5, 7.0, MARKETPLACES, progress=interrupt_after(3), **kwargs)
+    assert not os.path.exists(output)
+
+    stats = nrp_batch.run(catalog_csv, output, 1.5, 7.0, MARKETPLACES, **kwargs)
+    assert stats["resumed_chunks"] == 3
+    assert stats["rows"] == len(expected)
+    pd.testing.assert_frame_equal(pd.read_csv(output), expected)
+    assert not os.path.exists(checkpoint)
+
+
+def test_parallel_run_resumes_a_serial_checkpoint(catalog_csv, tmp_path, expected):
+    output, checkpoint = str(tmp_path / "out.csv"), str(tmp_path / "out.ckpt")
+    kwargs = dict(chunk_rows=CHUNK_ROWS, checkpoint=checkpoint)
+    with pytest.raises(Interrupted):
+        nrp_batch.run(catalog_csv, output, 1.5, 7.0, MARKETPLACES, progress=interrupt_after(2), **kwargs)
+
+    stats = nrp_parallel.run(catalog_csv, output, 1.5, 7.0, MARKETPLACES, workers=2, **kwargs)
+    assert stats["resumed_chunks"] == 2
+    pd.testing.assert_frame_equal(pd.read_csv(output), expected)
+
+
+def test_checkpoint_of_another_run_is_refused(catalog_csv, tmp_path):
+    output, checkpoint = str(tmp_path / "out.csv"), str(tmp_path / "out.ckpt")
+    with pytest.raises(Interrupted):
+        nrp_batch.run(catalog_csv, output, 1.5, 7.0, MARKETPLACES, chunk_rows=CHUNK_ROWS, checkpoint=checkpoint,
+                      progress=interrupt_after(1))
+    with pytest.raises(ValueError, match="oor_cost"):
+        nrp_batch.run(catalog_csv, output, 2.0, 7.0, MARKETPLACES, chunk_rows=CHUNK_ROWS, checkpoint=checkpoint)
+
+
+def test_empty_catalog_compacts_to_an_empty_result(tmp_path):
+    catalog, output = str(tmp_path / "empty.csv"), str(tmp_path / "out.csv")
+    pd.DataFrame(columns=nrp_batch.INPUT_COLUMNS).to_csv(catalog, index=False)
+    nrp_batch.run(catalog, output, 1.5, 7.0, MARKETPLACES, checkpoint=str(tmp_path / "out.ckpt"))
+    assert pd.read_csv(output).empty
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import nrp_bench
+import nrp_engine
+import nrp_reference
+
+
+@pytest.mark.parametrize("n_marketplaces", [1, 2, 4, 9])
+def test_greedy_matches_scalar_reference(n_marketplaces):
+    records, po_status, lead_time, po_arrival = nrp_bench.synthetic_catalog(500, n_marketplaces, seed=n_marketplaces)
+    oor_cost = np.random.default_rng(0).uniform(0, 3, len(records))
+    result = nrp_engine.evaluate_records(records, po_status, lead_time, po_arrival, oor_cost, 7.0, kernel="numpy")
+    assert nrp_reference.mismatches(
+        records, po_status, lead_time, po_arrival, oor_cost, 7.0, result, range(len(records))
+    ) == []
+
+
+def test_zero_forecast_and_all_stocked_asins():
+    records = nrp_engine.marketplace_inputs(3, 3)
+    records["stock"] = [[0, 0, 0], [10, 20, 30], [0, 5, 0]]
+    records["forecast"] = [[0, 0, 0], [1, 2, 3], [0, 0, 0]]
+    records["cppu"] = 2.0
+    result = nrp_engine.evaluate_records(records, nrp_engine.PO_EOL, 14, 8, 1.5, 7, kernel="numpy")
+    assert nrp_reference.mismatches(records, nrp_engine.PO_EOL, 14, 8, 1.5, 7, result, range(3)) == []
+    assert (result.decision[1] == nrp_engine.NOT_EVALUATED).all()
+
+
+def brute_force_cp(stock, forecast, cppu, s_eu, f_eu, t_arrival, max_woc, candidates):
+    """Highest CP after over every feasible turn-off subset of the candidates of one ASIN."""
+    total_fc = sum(f * c for f, c in zip(forecast, cppu))
+    best = s_eu * total_fc / f_eu if f_eu > 0 else 0.0  # nothing turned off
+    mps = [i for i in range(len(stock)) if candidates[i]]
+    for mask in range(1, 1 << len(mps)):
+        off = [mp for k, mp in enumerate(mps) if mask >> k & 1]
+        remaining = f_eu - sum(forecast[mp] for mp in off)
+        woc = s_eu / remaining if remaining > 0 else nrp_engine.NEVER
+        if woc > max_woc or not (t_arrival >= nrp_engine.NEVER or woc < t_arrival):
+            continue
+        cp = s_eu * (total_fc - sum(forecast[mp] * cppu[mp] for mp in off)) / remaining if remaining > 0 else 0.0
+        best = max(best, cp)
+    return best
+
+
+@pytest.mark.parametrize("n_marketplaces", [3, 6, 9])
+def test_optimal_matches_brute_force(n_marketplaces):
+    records, po_status, lead_time, po_arrival = nrp_bench.synthetic_catalog(
+        300, n_marketplaces, zero_stock_share=0.6, seed=n_marketplaces
+    )
+    params = (po_status, lead_time, po_arrival, 0.8, 7.0)
+    greedy = nrp_engine.evaluate_records(records, *params, kernel="numpy")
+    optimal = nrp_engine.evaluate_records(records, *params, mode="optimal", kernel="numpy")
+    candidates = (records["stock"] == 0) & greedy.pass_cppu
+    for r in range(len(records)):
+        expected = brute_force_cp(
+            records["stock"][r], records["forecast"][r], records["cppu"][r], greedy.s_eu[r], greedy.f_eu[r],
+            greedy.t_arrival[r], 7.0, candidates[r],
+        )
+        assert optimal.cp_after[r] == pytest.approx(expected, rel=1e-9, abs=1e-9), r
+        assert optimal.cp_after[r] >= greedy.cp_after[r] - 1e-9
+    turned_off = optimal.decision == nrp_engine.TURN_OFF
+    assert not (turned_off & ~candidates).any()
+    assert (optimal.cp_after > greedy.cp_after + 1e-9).any()  # the catalog exercises the search
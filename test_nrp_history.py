@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import nrp_history
+
+
+def result_rows(decisions):
+    """Result frame (nrp_batch.result_frame() columns) of ASIN A1 with one decision per MP."""
+    n = len(decisions)
+    return pd.DataFrame({
+        "asin": ["A1"] * n,
+        "marketplace": list(decisions),
+        "decision": list(decisions.values()),
+        "new_woc": np.nan,
+        "pass_cppu": True,
+        "pass_woc_health": True,
+        "pass_depletion": False,
+        "woc_eu": 2.5,
+        "final_woc": 2.5,
+        "t_arrival": 2.0,
+        "cp_before": 100.0,
+        "cp_after": 120.0,
+        "cbf_units_before": 10.0,
+        "cbf_units_after": 5.0,
+    })
+
+
+@pytest.fixture
+def history(tmp_path):
+    with nrp_history.ResultHistory(str(tmp_path / "history.db")) as history:
+        yield history
+
+
+def flipped(history, run_id):
+    return history.flips(run_id)[["marketplace", "previous", "decision"]].values.tolist()
+
+
+def test_flips_against_previous_run(history):
+    history.add_run([result_rows({"ES": "TURN_OFF", "IT": "KEEP_ACTIVE"})], "2026-01-01")
+    run = history.add_run([result_rows({"ES": "KEEP_ACTIVE", "IT": "KEEP_ACTIVE"})], "2026-01-02")
+    assert flipped(history, run) == [["ES", "TURN_OFF", "KEEP_ACTIVE"]]
+    assert history.flips(run, since_run_id=run).empty
+
+
+def test_backfilled_run_relinks_the_next_one(history):
+    history.add_run([result_rows({"ES": "TURN_OFF"})], "2026-01-02")
+    d4 = history.add_run([result_rows({"ES": "KEEP_ACTIVE"})], "2026-01-04")
+    assert flipped(history, d4) == [["ES", "TURN_OFF", "KEEP_ACTIVE"]]
+
+    d3 = history.add_run([result_rows({"ES": "KEEP_ACTIVE"})], "2026-01-03")
+    runs = history.runs().set_index("run_id")
+    assert runs.loc[d4, "previous_run_id"] == d3
+    assert flipped(history, d4) == []
+    assert flipped(history, d3) == [["ES", "TURN_OFF", "KEEP_ACTIVE"]]
+
+
+def test_replaced_run_relinks_the_next_one(history):
+    history.add_run([result_rows({"ES": "TURN_OFF"})], "2026-01-01")
+    d2 = history.add_run([result_rows({"ES": "KEEP_ACTIVE"})], "2026-01-02")
+    assert flipped(history, d2) == [["ES", "TURN_OFF", "KEEP_ACTIVE"]]
+
+    d1 = history.add_run([result_rows({"ES": "KEEP_ACTIVE"})], "2026-01-01")
+    assert history.runs().set_index("run_id").loc[d2, "previous_run_id"] == d1
+    assert flipped(history, d2) == []
+
+
+def test_deleted_run_relinks_the_next_one(history):
+    history.add_run([result_rows({"ES": "TURN_OFF"})], "2026-01-01")
+    d2 = history.add_run([result_rows({"ES": "KEEP_ACTIVE"})], "2026-01-02")
+    d3 = history.add_run([result_rows({"ES": "TURN_OFF"})], "2026-01-03")
+    assert flipped(history, d3) == [["ES", "KEEP_ACTIVE", "TURN_OFF"]]
+
+    history.delete_run(d2)
+    assert flipped(history, d3) == []
+    previous = history.asin_history("A1")["previous"]
+    assert previous.isna().iloc[0] and previous.iloc[1] == "TURN_OFF"
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import nrp_engine
+import nrp_incremental
+
+MARKETPLACES = ["DE", "FR", "ES", "IT"]
+
+
+def evaluator(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    records = nrp_engine.marketplace_inputs(n, len(MARKETPLACES))
+    records["stock"] = rng.integers(0, 3, records.shape) * rng.integers(10, 80, records.shape)
+    records["forecast"] = rng.integers(1, 30, records.shape)
+    records["cppu"] = rng.uniform(1, 4, records.shape).round(2)
+    asins = [f"B{i:09d}" for i in range(n)]
+    return nrp_incremental.IncrementalEvaluator(
+        asins, MARKETPLACES, records, rng.integers(0, 3, n), 14.0, rng.uniform(1, 12, n), 1.5, 7.0
+    )
+
+
+def events(state, count=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    event = rng.choice(["receipt", "sale", "sale", "forecast", "po"], count)
+    value = np.where(event == "po", rng.uniform(1, 12, count), rng.integers(0, 60, count)).astype(float)
+    return pd.DataFrame({
+        "asin": state.asins[rng.integers(0, len(state), count)],
+        "marketplace": rng.choice(MARKETPLACES, count),
+        "event": event,
+        "value": value,
+    })
+
+
+def test_stock_events_are_applied_in_order():
+    stock = np.array([[10.0]])
+    nrp_incremental.apply_stock_events(stock, np.array([0, 0]), np.array([0, 0]), np.array([-50.0, 50.0]))
+    assert stock[0, 0] == 50.0
+
+
+@pytest.fixture(scope="module")
+def one_by_one():
+    state = evaluator()
+    stream = events(state)
+    for start in range(len(stream)):
+        state.apply_frame(stream.iloc[start:start + 1])
+    return state
+
+
+@pytest.mark.parametrize("batch", [7, 100, 2000])
+def test_batching_does_not_change_the_result(one_by_one, batch):
+    batched = evaluator()
+    stream = events(batched)
+    for start in range(0, len(stream), batch):
+        batched.apply_frame(stream.iloc[start:start + batch])
+    np.testing.assert_array_equal(batched.records["stock"], one_by_one.records["stock"])
+    np.testing.assert_array_equal(batched.result.decision, one_by_one.result.decision)
+
+
+def test_incremental_matches_full_re_evaluation():
+    state = evaluator()
+    changed = []
+    stream = events(state)
+    for start in range(0, len(stream), 100):
+        changed.append(state.apply_frame(stream.iloc[start:start + 100]))
+    full = nrp_engine.evaluate_records(
+        state.records, state.po_status, state.lead_time, state.po_arrival, state.oor_cost, state.max_woc
+    )
+    np.testing.assert_array_equal(state.result.decision, full.decision)
+    np.testing.assert_allclose(state.result.cp_after, full.cp_after)
+    np.testing.assert_allclose(state.result.cbf_units_after, full.cbf_units_after)
+    assert sum(len(df) for df in changed) > 0
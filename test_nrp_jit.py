@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+import nrp_bench
+import nrp_engine
+
+pytest.importorskip("numba")
+
+FIELDS = ["order", "n_zero", "decision", "new_woc", "pass_cppu", "pass_woc_health", "pass_depletion", "final_woc",
+          "cp_before", "cp_after", "cbf_units_before", "cbf_units_after"]
+
+
+@pytest.mark.parametrize("n_marketplaces", [1, 4, 9])
+def test_jit_matches_numpy(n_marketplaces):
+    records, po_status, lead_time, po_arrival = nrp_bench.synthetic_catalog(2000, n_marketplaces, seed=n_marketplaces)
+    # Ties in the turn-off order
+    records["forecast"][::7] = 10
+    oor_cost = np.random.default_rng(0).uniform(0, 3, len(records))
+    params = (po_status, lead_time, po_arrival, oor_cost, 7.0)
+    numpy_result = nrp_engine.evaluate_records(records, *params, kernel="numpy")
+    jit_result = nrp_engine.evaluate_records(records, *params, kernel="jit")
+    for field in FIELDS:
+        expected, actual = getattr(numpy_result, field), getattr(jit_result, field)
+        if expected.dtype.kind == "f":
+            np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-9, err_msg=field)
+        else:
+            np.testing.assert_array_equal(actual, expected, err_msg=field)